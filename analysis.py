@@ -0,0 +1,230 @@
+# analysis.py
+"""Monte Carlo result summaries. matplotlib is only imported when a plot is drawn."""
+import math
+from collections import defaultdict
+
+
+def summarize_results(all_run_results, time_threshold=25.0):
+    """Plain-data summary of run_monte_carlo output (JSON friendly, no plotting)"""
+    times_by_car = defaultdict(list)
+
+    for run in all_run_results:
+        for car_id, elapsed, finished in run:
+            if finished:
+                times_by_car[car_id].append(elapsed)
+
+    all_times = [t for times in times_by_car.values() for t in times]
+    under_threshold = sum(1 for t in all_times if t < time_threshold)
+
+    per_car = {}
+    for car_id, times in sorted(times_by_car.items()):
+        per_car[car_id] = {
+            "avg": sum(times) / len(times),
+            "pct_under": sum(1 for t in times if t < time_threshold) / len(times) * 100,
+            "finishes": len(times),
+        }
+
+    return {
+        "runs": len(all_run_results),
+        "time_threshold": time_threshold,
+        "finishes": len(all_times),
+        "prob_under": under_threshold / len(all_times) * 100 if all_times else 0,
+        "per_car": per_car,
+        "times_by_car": dict(times_by_car),
+    }
+
+
+def summarize_arrays(car_id, time, finished, time_threshold=25.0, with_times=True):
+    """summarize_results for (runs, cars) arrays, e.g. shared.SharedResults, without building run lists.
+
+    times_by_car is only filled in with_times (it's a Python list per car).
+    """
+    import numpy as np
+
+    ids = car_id[finished]
+    times = time[finished]
+    order = np.argsort(ids, kind="stable")  # stable: each car's times stay in run order
+    ids, times = ids[order], times[order]
+    cars, starts, counts = np.unique(ids, return_index=True, return_counts=True)
+    under = times < time_threshold
+    if len(times):
+        sums = np.add.reduceat(times, starts)
+        unders = np.add.reduceat(under.astype(np.int64), starts)
+    else:
+        sums = unders = np.empty(0)
+
+    per_car = {
+        int(c): {"avg": float(s / n), "pct_under": float(u / n * 100), "finishes": int(n)}
+        for c, s, u, n in zip(cars, sums, unders, counts)
+    }
+    times_by_car = {}
+    if with_times:
+        times_by_car = {int(c): times[a:a + n].tolist() for c, a, n in zip(cars, starts, counts)}
+
+    return {
+        "runs": int(car_id.shape[0]),
+        "time_threshold": time_threshold,
+        "finishes": int(len(times)),
+        "prob_under": float(under.sum() / len(times) * 100) if len(times) else 0,
+        "per_car": per_car,
+        "times_by_car": times_by_car,
+    }
+
+
+Z95 = 1.959963984540054  # two-sided 95% normal quantile
+
+
+def wilson_interval(successes, n, z=Z95):
+    """Wilson score interval for a proportion, as fractions (lo, hi)."""
+    if n <= 0:
+        return 0.0, 1.0
+    p = successes / n
+    denom = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return max(0.0, center - half), min(1.0, center + half)
+
+
+class SequentialSummary:
+    """
+    Running estimate of summarize_results' numbers for Monte Carlo done in batches.
+
+    Only counts are kept, not the times. prob_under gets a Wilson interval; since
+    the finishes of one run aren't independent, its sample size is the number of
+    finishes scaled down by the between-run variance (design effect). Per-car mean
+    times get a normal interval and are keyed by the car's slot in its run
+    (0 = player), since car ids differ from run to run.
+    """
+
+    def __init__(self, time_threshold=25.0, z=Z95):
+        self.time_threshold = time_threshold
+        self.z = z
+        self.runs = 0
+        self.finishes = 0
+        self.under = 0
+        # per-run sums for the ratio variance of under / finishes
+        self._uu = self._ff = self._uf = 0
+        self._slots = []  # [n, mean, m2] per slot (Welford)
+
+    def add(self, all_run_results):
+        threshold = self.time_threshold
+        for run in all_run_results:
+            f = u = 0
+            for slot, (_, elapsed, finished) in enumerate(run):
+                if not finished:
+                    continue
+                f += 1
+                u += elapsed < threshold
+                if slot >= len(self._slots):
+                    self._slots.extend([0, 0.0, 0.0] for _ in range(slot + 1 - len(self._slots)))
+                acc = self._slots[slot]
+                acc[0] += 1
+                delta = elapsed - acc[1]
+                acc[1] += delta / acc[0]
+                acc[2] += delta * (elapsed - acc[1])
+            self.runs += 1
+            self.finishes += f
+            self.under += u
+            self._uu += u * u
+            self._ff += f * f
+            self._uf += u * f
+
+    def effective_finishes(self):
+        n, total = self.runs, self.finishes
+        if n < 2 or total == 0:
+            return float(total)
+        p = self.under / total
+        if p in (0.0, 1.0):
+            return float(total)
+        mean_f = total / n
+        var_ratio = (self._uu - 2 * p * self._uf + p * p * self._ff) / (n * (n - 1) * mean_f * mean_f)
+        if var_ratio <= 0:
+            return float(total)
+        return p * (1 - p) / var_ratio
+
+    def prob_interval(self):
+        """95% (by default) interval of prob_under, in percent."""
+        n_eff = self.effective_finishes()
+        p = self.under / self.finishes if self.finishes else 0.0
+        lo, hi = wilson_interval(p * n_eff, n_eff, self.z)
+        return lo * 100, hi * 100
+
+    def mean_intervals(self):
+        """{slot: (mean, half width)} of finish times, for slots with a finish so far."""
+        out = {}
+        for slot, (n, mean, m2) in enumerate(self._slots):
+            if not n:
+                continue
+            half = self.z * math.sqrt(m2 / (n - 1) / n) if n > 1 else math.inf
+            out[slot] = (mean, half)
+        return out
+
+    def precision(self):
+        """(half width of the prob_under interval in points, widest per-car mean half width in s)."""
+        lo, hi = self.prob_interval()
+        halves = [h for _, h in self.mean_intervals().values()]
+        return (hi - lo) / 2, max(halves, default=math.inf)
+
+    def to_dict(self):
+        lo, hi = self.prob_interval()
+        return {
+            "runs": self.runs,
+            "time_threshold": self.time_threshold,
+            "finishes": self.finishes,
+            "prob_under": self.under / self.finishes * 100 if self.finishes else 0,
+            "prob_under_ci": [lo, hi],
+            "per_slot": {
+                slot: {"avg": mean, "avg_ci_half": half, "finishes": self._slots[slot][0]}
+                for slot, (mean, half) in self.mean_intervals().items()
+            },
+        }
+
+
+def print_results(summary):
+    time_threshold = summary["time_threshold"]
+    print(f"\n==== MONTE CARLO RESULTS ({summary['runs']} runs) ====")
+    for car_id, times in sorted(summary["times_by_car"].items()):
+        avg = summary["per_car"][car_id]["avg"]
+        pct_under = summary["per_car"][car_id]["pct_under"]
+        runs_str = "  |  ".join(f"run{i+1}: {t:.2f}s" for i, t in enumerate(times))
+        print(f"Car #{car_id}: avg={avg:.2f}s  % under {time_threshold}s: {pct_under:.1f}%  [{runs_str}]")
+
+    print(f"\nProbability of finishing under {time_threshold}s: {summary['prob_under']:.1f}%")
+    if "conflicts" in summary:  # conflicts.summarize
+        c = summary["conflicts"]
+        print(f"Overlaps: {c['overlaps']['total']} in {c['runs_with_overlap']} runs, "
+              f"near misses: {c['near_misses']['total']}")
+
+
+def plot_histogram(summary):
+    import matplotlib.pyplot as plt
+
+    time_threshold = summary["time_threshold"]
+    all_times = [t for times in summary["times_by_car"].values() for t in times]
+
+    # Histogram — floor each time to nearest second for bucketing
+    counts = defaultdict(int)
+    for t in all_times:
+        counts[math.floor(t)] += 1
+
+    seconds = sorted(counts.keys())
+    freqs = [counts[s] for s in seconds]
+
+    plt.figure(figsize=(10, 5))
+    plt.bar(seconds, freqs, color=["red" if s >= time_threshold else "steelblue" for s in seconds], edgecolor="black", width=0.8)
+    plt.axvline(x=time_threshold, color="red", linestyle="--", linewidth=1.5, label=f"Threshold: {time_threshold}s")
+    plt.xlabel("Finish Time (s)")
+    plt.ylabel("Count")
+    plt.title(f"Finish Time Distribution ({summary['runs']} runs, {len(all_times)} total finishes)")
+    plt.legend()
+    plt.xticks(seconds)
+    plt.tight_layout()
+    plt.show()
+
+
+def analyze_results(all_run_results, time_threshold=25.0, plot=True):
+    summary = summarize_results(all_run_results, time_threshold)
+    print_results(summary)
+    if plot:
+        plot_histogram(summary)
+    return summary
@@ -0,0 +1,206 @@
+# batch.py
+"""
+Batch-of-worlds engine: K independent runs advanced together as (cars x runs) arrays.
+
+Each tick applies the same rules as CarLogic/CarStats and engine.run_simulation,
+but for every run at once. Cars are still updated in list order within a tick
+(car j sees cars < j already moved), so each run follows the object engine's
+semantics exactly; the loop is over the handful of car slots, not over runs.
+Runs whose cars have all crossed the line are dropped from the arrays.
+
+Random draws come from a numpy Generator rather than the `random` module, so
+a batch run doesn't replay the object engine's seeds, only its distributions.
+"""
+import numpy as np
+from carlogic import Intent
+from engine import (CAR_H, DT, END_Y_M, HEIGHT, LANES, SIGN_LIMITS_KMH, START_Y_M, kmh_to_mps)
+
+CRUISE = Intent.CRUISE.value
+ACCELERATE = Intent.ACCELERATE.value
+DECELERATE = Intent.DECELERATE.value
+LANE_CHANGE_RIGHT = Intent.LANE_CHANGE_RIGHT.value
+LANE_CHANGE_LEFT = Intent.LANE_CHANGE_LEFT.value
+
+
+class BatchWorld:
+    """
+    State of K runs. Arrays are stored (cars, runs) so each car's column across
+    all runs is contiguous; car 0 is the player, 1.. the traffic.
+    """
+
+    def __init__(self, num_runs, num_traffic=6, speed_limit_kmh=120.0, lanes=LANES, seed=None, end_y_m=END_Y_M):
+        rng = np.random.default_rng(seed)
+        self.lanes = lanes
+        self.end_y_m = end_y_m
+
+        # --- spawn (mirrors engine.spawn_traffic) ---
+        max_count = int(HEIGHT / (CAR_H * 2) * lanes)
+        count = min(num_traffic, max_count)
+        n = count + 1
+        k = num_runs
+
+        # A random permutation prefix per run == shuffle + take `count` slots
+        slots = np.argsort(rng.random((max_count, k)), axis=0)[:count]
+
+        self.position = np.empty((n, k))
+        self.lane = np.empty((n, k), dtype=np.int64)
+        self.speed = np.empty((n, k))
+        self.position[0] = START_Y_M
+        self.lane[0] = 1
+        self.speed[0] = kmh_to_mps(120.0)
+        self.position[1:] = slots // lanes * (CAR_H * 2)
+        self.lane[1:] = slots % lanes
+        self.speed[1:] = kmh_to_mps(rng.uniform(0.65, 0.9, (count, k)) * speed_limit_kmh)
+
+        self.speed_limit = np.full((n, k), kmh_to_mps(speed_limit_kmh))
+        self.acceleration = 6.0 + rng.uniform(-2, 2, (n, k))
+        self.deceleration = -9.0 + rng.uniform(-2, 2, (n, k))
+        self.speed_preference = rng.uniform(-10, 10, (n, k))
+        self.length = np.full((n, k), float(CAR_H))
+        self.intent = np.full((n, k), CRUISE, dtype=np.int8)
+        self.elapsed_time = np.zeros((n, k))
+        self.finished = np.zeros((n, k), dtype=bool)
+
+        # --- signs (mirrors engine.build_signs), padded with +inf ---
+        max_signs = int(np.ceil((end_y_m + 150.0) / 350.0)) + 1
+        gaps = rng.uniform(350, 450, (max_signs, k))
+        gaps[0] = 0.0
+        sign_pos = -150.0 + np.cumsum(gaps, axis=0)
+        sign_pos[sign_pos >= end_y_m] = np.inf
+        self.sign_position = sign_pos
+        self.sign_limit = kmh_to_mps(np.asarray(SIGN_LIMITS_KMH, dtype=float)[rng.integers(0, len(SIGN_LIMITS_KMH), (max_signs, k))])
+
+        # Column -> original run index, and where finished runs' results go
+        self.run_index = np.arange(k)
+        self.result_time = np.zeros((k, n))
+        self.result_finished = np.zeros((k, n), dtype=bool)
+
+    _PER_RUN = ("position", "lane", "speed", "speed_limit", "acceleration", "deceleration",
+                "speed_preference", "length", "intent", "elapsed_time", "finished",
+                "sign_position", "sign_limit")
+
+    @property
+    def num_cars(self):
+        return self.position.shape[0]
+
+    @property
+    def live_runs(self):
+        return len(self.run_index)
+
+    def _apply_signs(self, j):
+        # Signs are sorted, so the number passed is the index of the next one
+        passed = (self.sign_position <= self.position[j]).sum(axis=0)
+        cols = np.flatnonzero(passed)
+        self.speed_limit[j, cols] = self.sign_limit[passed[cols] - 1, cols]
+
+    def _update_car(self, j, dt, stop, back):
+        pos, lane = self.position, self.lane
+        pj, lj, sj = pos[j], lane[j], self.speed[j]
+
+        # analyze_traffic for car j against every car (self excluded below)
+        lane_diff = lane - lj
+        car_front = pos - stop[j]
+        self_back = back[j]
+        self_front = pj - stop
+
+        overlap_front = (self_front < car_front) & (car_front < self_back)
+        either = overlap_front | ((car_front < self_front) & (self_front < back))
+        overlap_front[j] = False
+        either[j] = False
+
+        front = (overlap_front & (lane_diff == 0)).any(axis=0)
+        left = (either & (lane_diff == -1)).any(axis=0)
+        right = (either & (lane_diff == 1)).any(axis=0)
+
+        # intent selection (CarLogic.update)
+        target = self.speed_limit[j] + self.speed_preference[j]
+        intent = np.select(
+            [
+                front & ~left & (lj > 0),
+                front & ~right & (lj < self.lanes - 1),
+                front,
+                sj - target > 1,
+                sj < target,
+            ],
+            [LANE_CHANGE_LEFT, LANE_CHANGE_RIGHT, DECELERATE, DECELERATE, ACCELERATE],
+            CRUISE,
+        )
+
+        # CarStats only moves cars that haven't finished
+        live = ~self.finished[j]
+        intent = np.where(live, intent, self.intent[j])
+        self.intent[j] = intent
+
+        accel = live & (intent == ACCELERATE)
+        decel = live & (intent == DECELERATE)
+        sj += np.where(accel, self.acceleration[j] * dt, 0.0)
+        sj += np.where(decel, self.deceleration[j] * dt, 0.0)
+        np.maximum(sj, 0.0, out=sj, where=decel)
+        lj += live & (intent == LANE_CHANGE_RIGHT)
+        lj -= live & (intent == LANE_CHANGE_LEFT)
+        self.elapsed_time[j] += live * dt
+
+        pj += sj * dt
+        self.finished[j] |= pj >= self.end_y_m
+
+        # Later cars this tick see j's new state
+        stop[j] = -sj ** 2 / (2 * self.deceleration[j])
+        back[j] = pj + self.length[j]
+
+    def _retire_finished_runs(self):
+        done = self.finished.all(axis=0)
+        if not done.any():
+            return
+        cols = self.run_index[done]
+        self.result_time[cols] = self.elapsed_time[:, done].T
+        self.result_finished[cols] = True
+
+        keep = ~done
+        for name in self._PER_RUN:
+            setattr(self, name, getattr(self, name)[:, keep])
+        self.run_index = self.run_index[keep]
+
+    def step(self, dt=DT):
+        stop = -self.speed ** 2 / (2 * self.deceleration)
+        back = self.position + self.length
+        for j in range(self.num_cars):
+            self._apply_signs(j)
+            self._update_car(j, dt, stop, back)
+        self._retire_finished_runs()
+
+    def run(self, dt=DT, max_ticks=None):
+        """Step until every run has finished; returns (elapsed_time, finished) as (runs, cars) arrays."""
+        ticks = 0
+        while self.live_runs and (max_ticks is None or ticks < max_ticks):
+            self.step(dt)
+            ticks += 1
+        if self.live_runs:
+            self.result_time[self.run_index] = self.elapsed_time.T
+            self.result_finished[self.run_index] = self.finished.T
+        return self.result_time, self.result_finished
+
+
+BLOCK_RUNS = 16384  # runs per BatchWorld; bigger blocks stop fitting in cache
+
+
+def iter_batch_blocks(num_runs, num_traffic=6, speed_limit_kmh=120.0, lanes=LANES, seed=None, block_runs=BLOCK_RUNS):
+    """Run num_runs in blocks of block_runs; yields (first run, elapsed_time, finished) per block."""
+    blocks = range(0, num_runs, block_runs)
+    seeds = np.random.SeedSequence(seed).spawn(len(blocks))
+    for start, block_seed in zip(blocks, seeds):
+        world = BatchWorld(min(block_runs, num_runs - start), num_traffic=num_traffic,
+                           speed_limit_kmh=speed_limit_kmh, lanes=lanes, seed=block_seed)
+        times, finished = world.run()
+        yield start, times, finished
+
+
+def run_batch_worlds(num_runs, num_traffic=6, speed_limit_kmh=120.0, lanes=LANES, seed=None, block_runs=BLOCK_RUNS):
+    """Batch equivalent of engine.run_monte_carlo: list of runs of (car_id, elapsed_time, finished).
+
+    car_id is the car's slot in its run (0 = player), not a global id.
+    """
+    results = []
+    for _, times, finished in iter_batch_blocks(num_runs, num_traffic, speed_limit_kmh, lanes, seed, block_runs):
+        ids = range(times.shape[1])
+        results.extend(list(zip(ids, t, f)) for t, f in zip(times.tolist(), finished.tolist()))
+    return results
@@ -0,0 +1,260 @@
+# behaviour.py
+"""
+Vectorized driver-behaviour kernels for the array engine (highway.py).
+
+A kernel looks at the cars being updated (own, a dict of state arrays) through
+a Neighbours index over every car they can see, and returns per-car
+accelerations (m/s^2) and lane changes (-1 left, 0, +1 right) for a tick of
+dt seconds. integrate()
+then applies them the same way whatever the kernel:
+
+    reference  CarLogic's five-intent rules: look-ahead flags, bang-bang
+               acceleration / deceleration, change lanes when blocked
+    idm        Intelligent Driver Model car following, no lane changes
+    mobil      IDM plus MOBIL lane changes: change when the own gain beats the
+               politeness-weighted loss of the old and new followers, and only
+               if the new follower doesn't have to brake harder than B_SAFE and
+               both gaps stay above the jam gap; each car reconsiders about
+               MOBIL_RATE times a second (cars merging into one lane from both
+               sides in the same tick are highway's arbitrate option)
+
+All kernels share one (lane, position) sort of the visible cars per tick and
+binary searches into it, so the cost per tick is O(N log N) for any of them.
+Each kernel also says how far ahead or behind it looks (view()); that is the
+halo width run_decomposed exchanges, and leaders / followers further away are
+ignored, so split and single-process runs still agree.
+
+Kernels are picked by name (KERNELS) so they can be handed to worker processes.
+Cars occupy [position, position + length] and drive towards larger positions.
+"""
+import numpy as np
+
+from carlogic import Intent
+
+CRUISE = Intent.CRUISE.value
+ACCELERATE = Intent.ACCELERATE.value
+DECELERATE = Intent.DECELERATE.value
+LANE_CHANGE_RIGHT = Intent.LANE_CHANGE_RIGHT.value
+LANE_CHANGE_LEFT = Intent.LANE_CHANGE_LEFT.value
+
+LANE_KEY = 1e9  # (lane, position) sort key = lane * LANE_KEY + position
+
+# IDM (Treiber, Hennecke & Helbing 2000); a = the car's acceleration, b = COMFORT x its braking
+IDM_S0 = 2.0      # jam gap (m)
+IDM_T = 1.5       # time headway (s)
+IDM_DELTA = 4.0
+IDM_COMFORT = 0.3
+IDM_VIEW = 5.0    # look this many worst-case desired gaps ahead: (s*/s)^2 <= 4% beyond
+# MOBIL (Kesting, Treiber & Helbing 2007)
+MOBIL_POLITENESS = 0.3
+MOBIL_THRESHOLD = 0.2  # m/s^2
+MOBIL_B_SAFE = 4.0     # m/s^2
+MOBIL_RATE = 1.0       # lane-change decisions per second (all at once every tick moves whole platoons across)
+
+
+def stopping_distance(cars):
+    return -cars["speed"] ** 2 / (2 * cars["deceleration"])
+
+
+def visible_view(cars):
+    """What other cars' kernels need to see of these cars."""
+    return {"id": cars["id"], "position": cars["position"], "lane": cars["lane"], "speed": cars["speed"],
+            "length": cars["length"], "stop": stopping_distance(cars), "acceleration": cars["acceleration"],
+            "deceleration": cars["deceleration"], "target": cars["speed_limit"] + cars["speed_preference"]}
+
+
+class Neighbours:
+    """The visible cars sorted by (lane, position), searched for each own car."""
+
+    def __init__(self, own, visible, view=np.inf):
+        self.view = view  # leader() / follower() ignore cars further away than this
+        key = visible["lane"] * LANE_KEY + visible["position"]
+        self.order = order = np.argsort(key, kind="stable")
+        self.key = key[order]
+        self.cars = {k: v[order] for k, v in visible.items()}
+        self.own = own
+
+    def flags(self):
+        """CarLogic.analyze_traffic for every own car: (front, left, right) boolean arrays."""
+        own, c = self.own, self.cars
+        n = len(own["id"])
+        front, left, right = np.zeros(n, bool), np.zeros(n, bool), np.zeros(n, bool)
+        if n == 0:
+            return front, left, right
+        last = len(self.key) - 1
+        p, lane, ln, s = own["position"], own["lane"], own["length"], stopping_distance(own)
+        behind = float((c["stop"] + c["length"]).max()) + 1.0  # +1 m: the window only has to be wide enough
+        for d, flag in ((0, front), (-1, left), (1, right)):
+            base = (lane + d) * LANE_KEY
+            lo = np.searchsorted(self.key, base + p - behind, "left")
+            hi = np.searchsorted(self.key, base + p + s + ln + 1.0, "right")
+            for k in range(int((hi - lo).max(initial=0))):
+                j = lo + k
+                valid = j < hi
+                j = np.minimum(j, last)
+                c_pos, c_stop = c["position"][j], c["stop"][j]
+                car_front = c_pos - s
+                self_front = p - c_stop
+                hit = (self_front < car_front) & (car_front < p + ln)
+                if d:
+                    hit |= (car_front < self_front) & (self_front < c_pos + c["length"][j])
+                flag |= valid & hit & (c["id"][j] != own["id"])
+        return front, left, right
+
+    def leader(self, d):
+        """Index into self.cars of the nearest car ahead in lane + d (less than view metres on), else -1."""
+        base = (self.own["lane"] + d) * LANE_KEY + self.own["position"]
+        j = np.searchsorted(self.key, base, "right")
+        jc = np.minimum(j, len(self.key) - 1)
+        return np.where((j < len(self.key)) & (self.key[jc] - base < self.view) & self._in_lane(jc, d), jc, -1)
+
+    def follower(self, d):
+        """Index into self.cars of the nearest car behind in lane + d (less than view metres back), else -1."""
+        base = (self.own["lane"] + d) * LANE_KEY + self.own["position"]
+        j = np.searchsorted(self.key, base, "left") - 1
+        jc = np.maximum(j, 0)
+        return np.where((j >= 0) & (base - self.key[jc] < self.view) & self._in_lane(jc, d), jc, -1)
+
+    def _in_lane(self, j, d):
+        """The nearest key either side can be in the next lane over (always, with an unlimited view)."""
+        return self.cars["lane"][j] == self.own["lane"] + d
+
+
+def integrate(own, acceleration, change, dt, end_m):
+    """Apply a kernel's output to the own cars (in place). Finished cars keep intent and speed but roll on."""
+    live = ~own["finished"]
+    intent = np.select([change < 0, change > 0, acceleration > 0, acceleration < 0],
+                       [LANE_CHANGE_LEFT, LANE_CHANGE_RIGHT, ACCELERATE, DECELERATE], CRUISE).astype(np.int8)
+    own["intent"] = np.where(live, intent, own["intent"])
+    speed = own["speed"]
+    speed += np.where(live, acceleration * dt, 0.0)
+    np.maximum(speed, 0.0, out=speed, where=live & (acceleration < 0))
+    own["lane"] += np.where(live, change, 0)
+    own["elapsed_time"] += live * dt
+    own["position"] += speed * dt
+    own["finished"] |= own["position"] >= end_m
+
+
+# --- kernels ---
+
+class Reference:
+    """CarLogic.decide / integrate for all cars at once."""
+
+    name = "reference"
+
+    def view(self, cars):
+        return float((stopping_distance(cars) + cars["length"]).max(initial=0.0))
+
+    def __call__(self, own, nb, lanes, dt):
+        front, left, right = nb.flags()
+        lane, speed = own["lane"], own["speed"]
+        target = own["speed_limit"] + own["speed_preference"]
+        go_left = front & ~left & (lane > 0)
+        go_right = front & ~go_left & ~right & (lane < lanes - 1)
+        brake = (front & ~go_left & ~go_right) | (~front & (speed - target > 1))
+        accelerate = ~front & ~brake & (speed < target)
+        acceleration = np.where(accelerate, own["acceleration"], np.where(brake, own["deceleration"], 0.0))
+        return acceleration, go_right.astype(np.int64) - go_left
+
+
+def idm(speed, target, a, deceleration, gap, lead_speed):
+    """IDM acceleration (gap = inf for a free road), braking no harder than deceleration allows."""
+    b = -IDM_COMFORT * deceleration
+    s_star = IDM_S0 + np.maximum(0.0, speed * IDM_T + speed * (speed - lead_speed) / (2 * np.sqrt(a * b)))
+    acc = a * (1 - (speed / np.maximum(target, 1.0)) ** IDM_DELTA - (s_star / np.maximum(gap, 0.1)) ** 2)
+    return np.maximum(acc, deceleration)
+
+
+def chance(own, p):
+    """Per-car uniform draws < p that depend only on car id and elapsed time, so they
+    come out the same however the cars are split between processes."""
+    x = own["id"].astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15) ^ own["elapsed_time"].view(np.uint64)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)  # splitmix64 finaliser
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    return (x >> np.uint64(11)).astype(float) / 2.0 ** 53 < p
+
+
+def _gap(front_pos, has_front, back_pos, back_len):
+    return np.where(has_front, front_pos - back_pos - back_len, np.inf)
+
+
+class IDM:
+    """Intelligent Driver Model towards speed limit + preference; stays in lane."""
+
+    name = "idm"
+
+    def view(self, cars):
+        v, a, b = cars["speed"], cars["acceleration"], -IDM_COMFORT * cars["deceleration"]
+        worst = IDM_S0 + v * IDM_T + v * v / (2 * np.sqrt(a * b))  # desired gap closing on a stopped car
+        return float((IDM_VIEW * worst + cars["length"]).max(initial=0.0))
+
+    def own(self, own, nb, j):
+        """IDM acceleration of the own cars behind nb.cars[j] (j = -1: free road)."""
+        has = j >= 0
+        gap = _gap(nb.cars["position"][j], has, own["position"], own["length"])
+        return idm(own["speed"], own["speed_limit"] + own["speed_preference"], own["acceleration"],
+                   own["deceleration"], gap, np.where(has, nb.cars["speed"][j], 0.0))
+
+    def other(self, nb, k, lead_pos, has_lead, lead_speed):
+        """IDM acceleration of visible cars nb.cars[k] behind a leader at lead_pos."""
+        c = nb.cars
+        gap = _gap(lead_pos, has_lead, c["position"][k], c["length"][k])
+        return idm(c["speed"][k], c["target"][k], c["acceleration"][k], c["deceleration"][k], gap,
+                   np.where(has_lead, lead_speed, 0.0))
+
+    def __call__(self, own, nb, lanes, dt):
+        return self.own(own, nb, nb.leader(0)), np.zeros(len(own["id"]), np.int64)
+
+
+class MOBIL(IDM):
+    """IDM with MOBIL lane changes to whichever side gains most (no keep-right bias)."""
+
+    name = "mobil"
+
+    def __call__(self, own, nb, lanes, dt):
+        c = nb.cars
+        pos, speed = own["position"], own["speed"]
+        lead = nb.leader(0)
+        acc = self.own(own, nb, lead)
+        change = np.zeros(len(pos), np.int64)
+
+        # the old follower: behind us now, behind our leader after we go
+        o = nb.follower(0)
+        has_o = o >= 0
+        has_lead = lead >= 0
+        lead_pos, lead_speed = c["position"][lead], c["speed"][lead]
+        old_loss = np.where(has_o, self.other(nb, o, lead_pos, has_lead, lead_speed)
+                            - self.other(nb, o, pos, True, speed), 0.0)
+
+        best = np.where(chance(own, MOBIL_RATE * dt), MOBIL_THRESHOLD, np.inf)
+        out = acc
+        for d in (-1, 1):
+            into = own["lane"] + d
+            new_lead = nb.leader(d)
+            has_nl = new_lead >= 0
+            nl_pos, nl_speed = c["position"][new_lead], c["speed"][new_lead]
+            acc_new = self.own(own, nb, new_lead)
+            # the new follower: behind the new leader now, behind us after we come in
+            f = nb.follower(d)
+            has_f = f >= 0
+            f_after = self.other(nb, f, pos, True, speed)
+            f_gain = np.where(has_f, f_after - self.other(nb, f, nl_pos, has_nl, nl_speed), 0.0)
+
+            # safe: a jam gap either side at the end of the tick (the gaps count the rear car's
+            # length), and neither we nor the new follower would need to brake harder than we
+            # can (idm() clamps there) or, for the follower, than B_SAFE
+            lead_gap = _gap(nl_pos + nl_speed * dt, has_nl, pos + speed * dt, own["length"])
+            f_gap = _gap(pos + speed * dt, has_f, c["position"][f] + c["speed"][f] * dt, c["length"][f])
+            f_brake = np.maximum(-MOBIL_B_SAFE, c["deceleration"][f])
+            safe = ((into >= 0) & (into < lanes) & (lead_gap > IDM_S0) & (acc_new > own["deceleration"])
+                    & (~has_f | ((f_gap > IDM_S0) & (f_after > f_brake))))
+            gain = acc_new - acc + MOBIL_POLITENESS * (f_gain + old_loss)
+            take = safe & (gain > best)
+            change = np.where(take, d, change)
+            best = np.where(take, gain, best)
+            out = np.where(take, acc_new, out)
+        return out, change
+
+
+KERNELS = {k.name: k for k in (Reference(), IDM(), MOBIL())}
@@ -10,14 +10,23 @@ class Intent(Enum):
   LANE_CHANGE_RIGHT = 3
   LANE_CHANGE_LEFT = 4
 
+# analyze_traffic() result bits
+CAR_FRONT = 1
+CAR_LEFT = 2
+CAR_RIGHT = 4
+
 class CarLogic:
-  def __init__(self):
+  def __init__(self, rng=None):
+    self._init_state(rng)
+
+  # Per-run state; engine's VehiclePool calls this again to reuse the object for a new run
+  def _init_state(self, rng=None):
     global car_id
     self.id = car_id
     car_id += 1
     cars.append(self)
     self.intent = Intent.CRUISE
-    self.speed_preference = uniform(-10, 10)
+    self.speed_preference = rng.uniform(-10, 10) if rng else uniform(-10, 10)
   
   def set_properties(self, position=0, speed=0, speed_limit=0, acceleration=0, deceleration=0, lane=0, laneCount=1, length=0):
     self.position = position
@@ -32,34 +41,37 @@ class CarLogic:
   def get_stopping_distance(self):
     return -self.speed**2/(2*self.deceleration)
 
+  # Returns CAR_FRONT | CAR_LEFT | CAR_RIGHT bits; a plain int so nothing is allocated per call
   def analyze_traffic(self):
-    params = {
-      "car_front": False,
-      "car_left": False,
-      "car_right": False
-    }
+    flags = 0
+    lane = self.lane
+    position = self.position
+    self_stop = self.get_stopping_distance()
+    self_back = position + self.length
     for car in cars:
-      if car.id == self.id: continue
-      lane_diff = car.lane - self.lane
-      car_back = car.position + car.length
-      car_front = car.position - self.get_stopping_distance()
-      self_back = self.position + self.length
-      self_front = self.position - car.get_stopping_distance()
-      
-      overlap_front = self_front < car_front < self_back
-      overlap_back = car_front < self_front < car_back
+      lane_diff = car.lane - lane
+      if lane_diff < -1 or lane_diff > 1 or car is self: continue
+      car_front = car.position - self_stop
+      self_front = position - car.get_stopping_distance()
 
-      if lane_diff == 0 and overlap_front: params["car_front"] = True
-      if lane_diff == -1 and (overlap_front or overlap_back): params["car_left"] = True
-      if lane_diff == 1 and (overlap_front or overlap_back): params["car_right"] = True
-    return params
+      overlap_front = self_front < car_front < self_back
+      if lane_diff == 0:
+        if overlap_front: flags |= CAR_FRONT
+      elif overlap_front or car_front < self_front < car.position + car.length:
+        flags |= CAR_LEFT if lane_diff == -1 else CAR_RIGHT
+    return flags
 
   def update(self, dt):
-    params = self.analyze_traffic()
-    if params["car_front"]:
-      if not params["car_left"] and self.lane > 0:
+    self.decide()
+    self.integrate(dt)
+
+  # Driver decision: neighbour scan, intent choice, lane change. Can run less often than integrate()
+  def decide(self):
+    flags = self.analyze_traffic()
+    if flags & CAR_FRONT:
+      if not flags & CAR_LEFT and self.lane > 0:
         self.intent = Intent.LANE_CHANGE_LEFT
-      elif not params["car_right"] and self.lane < self.laneCount - 1:
+      elif not flags & CAR_RIGHT and self.lane < self.laneCount - 1:
         self.intent = Intent.LANE_CHANGE_RIGHT
       else:
         self.intent = Intent.DECELERATE
@@ -70,16 +82,20 @@ class CarLogic:
           self.intent = Intent.ACCELERATE
         else:
           self.intent = Intent.CRUISE
-    
+
+    match self.intent:
+      case Intent.LANE_CHANGE_RIGHT:
+        self.lane += 1
+      case Intent.LANE_CHANGE_LEFT:
+        self.lane -= 1
+
+  # Kinematics for the current intent, every tick
+  def integrate(self, dt):
     match self.intent:
       case Intent.ACCELERATE:
         self.speed += self.acceleration * dt
       case Intent.DECELERATE:
         self.speed += self.deceleration * dt
         if self.speed < 0: self.speed = 0
-      case Intent.LANE_CHANGE_RIGHT:
-        self.lane += 1
-      case Intent.LANE_CHANGE_LEFT:
-        self.lane -= 1
 
 cars = []
\ No newline at end of file
@@ -12,8 +12,8 @@ class Intent(Enum):
   LANE_CHANGE_RIGHT = 4
 
 class CarStats(CarLogic):
-    def __init__(self):
-        super().__init__()
+    def _init_state(self, rng=None):
+        super()._init_state(rng)
 
         self.elapsed_time = 0.0
         self.finished = False
@@ -21,10 +21,14 @@ class CarStats(CarLogic):
         self.max_speed = 0.0
         self.min_speed = float("inf")
 
-    def update(self, dt):
+    def decide(self):
+        if not self.finished:
+            super().decide()
+
+    def integrate(self, dt):
         # Only update movement if not finished
         if not self.finished:
-            super().update(dt)
+            super().integrate(dt)
 
             # Track time
             self.elapsed_time += dt
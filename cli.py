@@ -0,0 +1,934 @@
+# cli.py
+"""
+Non-interactive entry point.
+
+    python cli.py sim   [--headless] [--cars 20] [--lanes 5] [--speed-limit 120] [--render-process]
+    python cli.py monte --runs 1000 --threshold 25 [--workers 8] [--output out.json] [--headless]
+    python cli.py monte --precision 0.5 --runs 50000 --time-budget 60 --headless
+    python cli.py monte --runs 1000000 --log runs/big --seed 1 --headless   (rerun to resume)
+    python cli.py monte --runs 1000 --cars 20 --conflicts --headless
+    python cli.py analyze runs/big --headless
+    python cli.py sweep --runs 200 --speed-limits 120,160 --cars 6,12 --lanes 3,5 --output sweep.jsonl
+    python cli.py compare --runs 500 --variant speed_limit=160 [--antithetic]
+    python cli.py bench --runs 200 [--workers 4]
+    python cli.py replay runs/run_000042.simrec
+    python cli.py distributed --runs 100000 --listen 0.0.0.0:50000 [--local-workers 2]
+    python cli.py worker --connect coordinator:50000 --authkey <hex>
+    python cli.py ctm --diagram fd.json --runs 500 [--recalibrate]
+    python cli.py highway --length-km 100 --cars 20000 --segments 4 [--verify] [--model mobil] [--conflicts] [--arbitrate]
+    python cli.py train --cars 2,6,10 --lanes 3,5 --speed-limits 120,200 --runs 500 --log-root runs/grid -o model.json
+    python cli.py query --model model.json --cars 8 --lanes 4 --speed-limit 160 --threshold 20,25
+
+pygame / matplotlib are only imported by the subcommands that draw something.
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+
+
+def _int_list(text):
+    return [int(x) for x in text.split(",") if x]
+
+
+def _float_list(text):
+    return [float(x) for x in text.split(",") if x]
+
+
+def _reuse(pooled):
+    """(VehiclePool, GC context) for a run loop, or (None, no-op) with pooling off."""
+    import contextlib
+    import engine
+
+    if not pooled:
+        return None, contextlib.nullcontext()
+    return engine.VehiclePool(), engine.quiet_gc()
+
+
+PROGRESS_CHUNK = 64  # runs between progress updates when running in-process
+
+
+def _run_event_chunk(run_ids, seed, num_traffic, speed_limit_kmh, lanes, record_dir=None, timing=None, pooled=True):
+    """Same as _run_chunk with the event-driven engine (events.py); same seeds, same results."""
+    import random
+    from events import run_event_simulation
+
+    results = []
+    pool, gc_ctx = _reuse(pooled)
+    with gc_ctx:
+        for i in run_ids:
+            if seed is not None:
+                random.seed(seed + i)
+            results.append(run_event_simulation(None, num_traffic=num_traffic, speed_limit_kmh=speed_limit_kmh,
+                                                lanes=lanes, pool=pool))
+    return results
+
+
+def _run_chunk(run_ids, seed, num_traffic, speed_limit_kmh, lanes, record_dir=None, timing=None, pooled=True,
+               conflicts=False):
+    """Run a slice of a Monte Carlo batch (pool worker entry point).
+
+    With conflicts, returns (results, per-run conflicts.ConflictCounter stats).
+    """
+    import random
+    import engine
+
+    results = []
+    counts = []
+    pool, gc_ctx = _reuse(pooled)
+    with gc_ctx:
+        for i in run_ids:
+            if seed is not None:
+                random.seed(seed + i)
+            telemetry = None
+            if record_dir:
+                from telemetry import Telemetry
+                telemetry = Telemetry()
+            elif conflicts:
+                from conflicts import ConflictCounter
+                telemetry = ConflictCounter(end_m=engine.END_Y_M)
+            results.append(engine.run_simulation(None, num_traffic=num_traffic, speed_limit_kmh=speed_limit_kmh,
+                                                 lanes=lanes, telemetry=telemetry, pool=pool, **(timing or {})))
+            if record_dir:
+                from replay import write_replay
+                write_replay(os.path.join(record_dir, f"run_{i:06d}.simrec"), telemetry, end_position=engine.END_Y_M)
+            elif conflicts:
+                counts.append(telemetry.stats())
+    return (results, counts) if conflicts else results
+
+
+def _run_batch_chunk(run_ids, seed, num_traffic, speed_limit_kmh, lanes, record_dir=None, timing=None, pooled=True):
+    """Same as _run_chunk but on the array engine (batch.py); one seed per slice."""
+    from batch import run_batch_worlds
+
+    slice_seed = None if seed is None else [seed, run_ids.start]
+    return run_batch_worlds(len(run_ids), num_traffic=num_traffic, speed_limit_kmh=speed_limit_kmh,
+                            lanes=lanes, seed=slice_seed)
+
+
+def _timed_chunk(run, run_ids, *args):
+    """run(run_ids, *args) in a pool worker, with the seconds it took (for utilisation)."""
+    t0 = time.perf_counter()
+    results = run(run_ids, *args)
+    return time.perf_counter() - t0, results
+
+
+def run_batch(num_runs, seed=None, workers=1, num_traffic=6, speed_limit_kmh=120.0, lanes=5, record_dir=None,
+              engine="object", first_run=0, sub_steps=1, decision_hz=None, pooled=True, progress=None,
+              conflicts=False):
+    """Headless Monte Carlo, optionally spread over worker processes.
+
+    With a seed, run i is seeded with seed + i so results don't depend on the worker count
+    (engine="object", or "event" which gives the same results via events.py).
+    engine="batch" uses batch.py, seeded per worker slice instead.
+    With record_dir, every run is also saved there as run_<i>.simrec (see replay.py).
+    Runs are numbered from first_run, so consecutive batches continue the same seed sequence.
+    sub_steps splits the engine tick for integration, decision_hz sets the driver decision rate.
+    pooled reuses car objects between runs and holds off the cyclic GC (engine.VehiclePool, quiet_gc).
+    Finished runs are counted on progress (a progress.Progress) as they come in.
+    With conflicts, every run also counts overlaps and near misses (conflicts.py) and
+    (results, per-run stats) is returned.
+    """
+    if engine != "object" and (record_dir or conflicts):
+        raise ValueError("recording and conflict counts need the object engine")
+    if record_dir and conflicts:
+        raise ValueError("recording and conflict counts don't combine")
+    timing = None
+    if sub_steps != 1 or decision_hz:
+        if engine != "object":
+            raise ValueError("sub-steps / decision rate need the object engine")
+        from engine import DT
+        timing = {"dt": DT / sub_steps, "decision_hz": decision_hz}
+    if record_dir:
+        os.makedirs(record_dir, exist_ok=True)
+    run = {"object": _run_chunk, "batch": _run_batch_chunk, "event": _run_event_chunk}[engine]
+    args = (seed, num_traffic, speed_limit_kmh, lanes, record_dir, timing, pooled) + ((True,) if conflicts else ())
+    end = first_run + num_runs
+    stats = []
+
+    def unpack(part):
+        if conflicts:
+            part, counts = part
+            stats.extend(counts)
+        return part
+
+    def done(results):
+        return (results, stats) if conflicts else results
+
+    if progress is not None:
+        from progress import vehicle_ticks
+    if workers <= 1:
+        if progress is None or engine == "batch":  # the array engine is seeded per call: keep it whole
+            results = unpack(run(range(first_run, end), *args))
+            if progress is not None:
+                progress.update(len(results), vehicle_ticks(results))
+            return done(results)
+        results = []
+        for i in range(first_run, end, PROGRESS_CHUNK):
+            busy, part = _timed_chunk(run, range(i, min(i + PROGRESS_CHUNK, end)), *args)
+            part = unpack(part)
+            progress.update(len(part), vehicle_ticks(part), busy)
+            results.extend(part)
+        return done(results)
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Array engine wants few big slices; the object engine small ones for load balance
+    chunk = -(-num_runs // workers) if engine == "batch" else max(1, num_runs // (workers * 4))
+    slices = [range(i, min(i + chunk, end)) for i in range(first_run, end, chunk)]
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for busy, part in pool.map(_timed_chunk, itertools.repeat(run), slices, *[itertools.repeat(a) for a in args]):
+            part = unpack(part)
+            if progress is not None:
+                progress.update(len(part), vehicle_ticks(part), busy)
+            results.extend(part)
+    return done(results)
+
+
+def run_adaptive(time_threshold=25.0, precision=1.0, mean_precision=None, batch_runs=200, max_runs=100_000,
+                 time_budget=None, keep_results=False, **batch_kwargs):
+    """Monte Carlo in batches of batch_runs until the estimate is precise enough.
+
+    Stops once the 95% interval of prob_under has half width <= precision (percentage
+    points) and, if given, every per-car mean time is within mean_precision seconds;
+    or when max_runs or time_budget (s) is used up. Returns (summary dict with
+    runs and stop_reason, results if keep_results else None). batch_kwargs go to run_batch.
+    """
+    from analysis import SequentialSummary
+
+    estimate = SequentialSummary(time_threshold)
+    results = [] if keep_results else None
+    t0 = time.perf_counter()
+    reason = "max_runs"
+    while estimate.runs < max_runs:
+        batch = run_batch(min(batch_runs, max_runs - estimate.runs), first_run=estimate.runs, **batch_kwargs)
+        estimate.add(batch)
+        if keep_results:
+            results.extend(batch)
+
+        prob_half, mean_half = estimate.precision()
+        if prob_half <= precision and (mean_precision is None or mean_half <= mean_precision):
+            reason = "precision"
+            break
+        if time_budget is not None and time.perf_counter() - t0 >= time_budget:
+            reason = "time_budget"
+            break
+
+    summary = estimate.to_dict()
+    summary["stop_reason"] = reason
+    summary["wall_s"] = time.perf_counter() - t0
+    return summary, results
+
+
+def _progress(args, total, done=0):
+    from progress import Progress
+
+    return Progress(total, workers=getattr(args, "workers", 1), done=done)
+
+
+def _write_output(payload, path):
+    text = json.dumps(payload, indent=2)
+    if path in (None, "-"):
+        print(text)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+def cmd_sim(args):
+    if not args.headless:
+        import main
+        main.set_lanes(args.lanes)
+        if args.render_process:
+            main.live(num_cars=args.cars, speed_limit=args.speed_limit, seed=args.seed, realtime=args.realtime)
+        else:
+            main.main(num_cars=args.cars, speed_limit=args.speed_limit)
+        return 0
+
+    import random
+    import engine
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    recorder = _macro_recorder(args, engine.END_Y_M, args.lanes)
+    results = engine.run_simulation(None, num_traffic=args.cars, speed_limit_kmh=args.speed_limit, lanes=args.lanes,
+                                    telemetry=recorder)
+    if recorder is not None:
+        recorder.close()
+        recorder.sink.close()
+    _write_output({
+        "cars": [{"car_id": cid, "elapsed_time": t, "finished": f} for cid, t, f in results],
+    }, args.output)
+    return 0
+
+
+def _macro_recorder(args, length_m, lanes):
+    """MacroRecorder writing to --macro, or None."""
+    if not args.macro:
+        return None
+    from macro import MacroRecorder, open_sink
+
+    return MacroRecorder(open_sink(args.macro), length_m=length_m, lanes=lanes, section_m=args.section_m,
+                         window_s=args.window_s, sample_every=args.sample_every)
+
+
+def cmd_monte(args):
+    import analysis
+
+    if args.log and (args.precision is not None or args.transport == "shm"):
+        raise SystemExit("--log doesn't combine with --precision or --transport shm")
+    if args.conflicts and (args.log or args.precision is not None or args.transport == "shm" or args.record):
+        raise SystemExit("--conflicts doesn't combine with --log, --precision, --transport shm or --record")
+    conflicts = None
+    if args.precision is not None:
+        return _monte_adaptive(args)
+
+    if args.state_ticks and (args.transport != "shm" or args.engine != "object"):
+        raise SystemExit("--state-ticks needs --transport shm and the object engine")
+    states = None
+    if args.transport == "shm":
+        if args.record or args.sub_steps != 1 or args.decision_hz:
+            raise SystemExit("--transport shm doesn't support --record, --sub-steps or --decision-hz")
+        from shared import run_shared
+
+        with run_shared(args.runs, seed=args.seed, workers=args.workers, num_traffic=args.cars,
+                        speed_limit_kmh=args.speed_limit, lanes=args.lanes, state_ticks=args.state_ticks,
+                        engine_name=args.engine) as res:
+            summary = analysis.summarize_arrays(res.car_id, res.time, res.finished, args.threshold,
+                                                with_times=not args.headless)
+            results = res.runs() if args.raw else None
+            if args.raw and args.state_ticks:
+                states = {"ticks": res.ticks.tolist(), "position": res.position.tolist(), "speed": res.speed.tolist()}
+    elif args.log:
+        results = _monte_logged(args)
+        summary = analysis.summarize_results(results, args.threshold)
+    else:
+        with _progress(args, args.runs) as progress:
+            results = run_batch(args.runs, seed=args.seed, workers=args.workers,
+                                num_traffic=args.cars, speed_limit_kmh=args.speed_limit, lanes=args.lanes,
+                                record_dir=args.record, engine=args.engine, progress=progress,
+                                conflicts=args.conflicts, **_timing(args))
+        if args.conflicts:
+            from conflicts import summarize
+
+            results, stats = results
+            conflicts = summarize(stats)
+        summary = analysis.summarize_results(results, args.threshold)
+    times_by_car = summary.pop("times_by_car")
+    if conflicts is not None:
+        summary["conflicts"] = conflicts
+
+    if args.output:
+        payload = {"scenario": _scenario(args), "summary": summary}
+        if args.raw:
+            payload["results"] = results
+        if states is not None:
+            payload["states"] = states
+        _write_output(payload, args.output)
+
+    if args.headless:
+        print(f"{summary['runs']} runs, {summary['finishes']} finishes, "
+              f"P(t < {args.threshold}s) = {summary['prob_under']:.1f}%")
+        if conflicts is not None:
+            print(f"overlaps in {conflicts['runs_with_overlap']} runs ({conflicts['overlaps']['per_run']:.3f} per run, "
+                  f"max {conflicts['overlaps']['max']}), near misses {conflicts['near_misses']['per_run']:.3f} per run")
+    else:
+        summary["times_by_car"] = times_by_car
+        analysis.print_results(summary)
+        analysis.plot_histogram(summary)
+    return 0
+
+
+def _monte_logged(args):
+    """monte with --log: resume from / append to a runlog.RunLog, batch_runs runs at a time."""
+    from runlog import RunLog, run_logged, scenario
+
+    log = RunLog(args.log, scenario(args.cars, args.speed_limit, args.lanes, engine=args.engine, **_timing(args)),
+                 args.seed)
+    if log.runs_done:
+        print(f"{args.log}: {log.runs_done} runs already done, seed {log.seed}", file=sys.stderr)
+
+    with _progress(args, args.runs, done=min(log.runs_done, args.runs)) as progress:
+        def run(first_run, n):
+            return run_batch(n, seed=log.seed, workers=args.workers, num_traffic=args.cars,
+                             speed_limit_kmh=args.speed_limit, lanes=args.lanes, record_dir=args.record,
+                             engine=args.engine, first_run=first_run, progress=progress, **_timing(args))
+
+        return run_logged(log, args.runs, run, args.batch_runs)
+
+
+def cmd_analyze(args):
+    import analysis
+    from runlog import RunLog
+
+    log = RunLog(args.log)
+    results = log.results()
+    if not results:
+        raise SystemExit(f"{args.log}: no completed runs yet")
+    summary = analysis.summarize_results(results, args.threshold)
+    if args.headless:
+        print(f"{summary['runs']} runs logged (seed {log.seed}), {summary['finishes']} finishes, "
+              f"P(t < {args.threshold}s) = {summary['prob_under']:.1f}%")
+    else:
+        analysis.print_results(summary)
+        analysis.plot_histogram(summary)
+    return 0
+
+
+def _monte_adaptive(args):
+    import analysis
+
+    with _progress(args, args.runs) as progress:
+        summary, results = run_adaptive(
+            args.threshold, precision=args.precision, mean_precision=args.mean_precision,
+            batch_runs=args.batch_runs, max_runs=args.runs, time_budget=args.time_budget,
+            keep_results=args.raw or not args.headless,
+            seed=args.seed, workers=args.workers, num_traffic=args.cars, speed_limit_kmh=args.speed_limit,
+            lanes=args.lanes, record_dir=args.record, engine=args.engine, progress=progress, **_timing(args),
+        )
+    if args.output:
+        payload = {"scenario": _scenario(args), "summary": summary}
+        if args.raw:
+            payload["results"] = results
+        _write_output(payload, args.output)
+
+    lo, hi = summary["prob_under_ci"]
+    print(f"{summary['runs']} runs ({summary['stop_reason']}), {summary['finishes']} finishes, "
+          f"P(t < {args.threshold}s) = {summary['prob_under']:.1f}% [95% CI {lo:.1f}-{hi:.1f}%]")
+    if not args.headless:
+        full = analysis.summarize_results(results, args.threshold)
+        analysis.print_results(full)
+        analysis.plot_histogram(full)
+    return 0
+
+
+_VARIANT_KEYS = {"cars": ("num_traffic", int), "lanes": ("lanes", int), "speed_limit": ("speed_limit_kmh", float)}
+
+
+def _variant(text):
+    """'speed_limit=160,lanes=3' -> overrides of the baseline scenario."""
+    out = {}
+    for item in text.split(","):
+        key, _, value = item.partition("=")
+        if key.strip() not in _VARIANT_KEYS:
+            raise argparse.ArgumentTypeError(f"unknown key {key!r} (use {', '.join(_VARIANT_KEYS)})")
+        name, kind = _VARIANT_KEYS[key.strip()]
+        out[name] = kind(value)
+    return out
+
+
+def cmd_compare(args):
+    from crn import run_paired
+
+    baseline = {"num_traffic": args.cars, "speed_limit_kmh": args.speed_limit, "lanes": args.lanes}
+    variants = [baseline] + [{**baseline, **v} for v in args.variant]
+    report = run_paired(variants, args.runs, seed=args.seed, antithetic=args.antithetic,
+                        time_threshold=args.threshold, workers=args.workers, common=not args.independent)
+    _write_output(report, args.output)
+    return 0
+
+
+def cmd_sweep(args):
+    from analysis import summarize_results
+
+    out = sys.stdout if args.output in (None, "-") else open(args.output, "w", encoding="utf-8")
+    try:
+        for limit, cars, lanes in itertools.product(args.speed_limits, args.cars, args.lanes):
+            t0 = time.perf_counter()
+            with _progress(args, args.runs) as progress:
+                results = run_batch(args.runs, seed=args.seed, workers=args.workers,
+                                    num_traffic=cars, speed_limit_kmh=limit, lanes=lanes, engine=args.engine,
+                                    progress=progress, **_timing(args))
+            summary = summarize_results(results, args.threshold)
+            row = {
+                "speed_limit": limit, "cars": cars, "lanes": lanes, "runs": args.runs,
+                "finishes": summary["finishes"], "prob_under": summary["prob_under"],
+                "mean_time": _mean(t for times in summary["times_by_car"].values() for t in times),
+                "wall_s": time.perf_counter() - t0,
+            }
+            out.write(json.dumps(row) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+HEADLESS_MODULES = ("cli", "engine", "analysis")
+SPAWN_BENCH_DENSITY = 15.0  # veh/km/lane for bench --spawn
+SPAWN_BUDGET_S = 0.5
+KERNEL_NAMES = ("reference", "idm", "mobil")  # behaviour.KERNELS, without importing numpy here
+KERNEL_BENCH_TICKS = 50
+
+HEAVY_MODULES = ("pygame", "matplotlib")
+
+
+def import_time(modules=HEADLESS_MODULES):
+    """Import `modules` in a fresh interpreter under -X importtime.
+
+    Returns (total_ms, imported_names); total is the sum of top-level cumulative times.
+    """
+    import subprocess
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + ", ".join(modules)],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)), check=True,
+    )
+    total_us = 0
+    names = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # header row
+        names.add(name.strip().split(".")[0])
+        if not name.startswith("  "):
+            total_us += int(cumulative)
+    return total_us / 1000.0, names
+
+
+def hot_loop(num_traffic=40, ticks=2000, lanes=5, seed=0):
+    """Steady-state engine.step: (ticks per second, net bytes kept per tick, peak transient bytes).
+
+    The finish line is moved to infinity so every car stays live. Net is what
+    tracemalloc still holds after the measured ticks; peak is the most that was
+    briefly allocated on top of that at any point.
+    """
+    import math
+    import random
+    import tracemalloc
+    import engine
+    from carstats import cars
+
+    random.seed(seed)
+    engine.spawn_traffic(None, engine.START_Y_M, 120.0, count=num_traffic, lanes=lanes)
+    signs = engine.build_signs()
+    tick = 0
+
+    def run(n):
+        nonlocal tick
+        for _ in range(n):
+            engine.step(cars, signs, engine.DT, math.inf, 1, tick)
+            tick += 1
+
+    run(200)  # warm up: lane changes settle, attribute dicts reach their final size
+    t0 = time.perf_counter()
+    run(ticks)
+    rate = ticks / (time.perf_counter() - t0)
+
+    tracemalloc.start()
+    try:
+        run(10)
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        run(ticks)
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return rate, (after - before) / ticks, peak - before
+
+
+def cmd_bench(args):
+    if args.transport_only:
+        from shared import transport_benchmark
+
+        timings = transport_benchmark(args.runs, cars=args.cars + 1, workers=max(2, args.workers))
+        _write_output({"runs": args.runs, "cars": args.cars + 1, "wall_s": timings,
+                       "runs_per_s": {k: args.runs / v for k, v in timings.items()}}, args.output)
+        return 0
+
+    if args.spawn:
+        import numpy as np
+        from engine import CAR_H
+        from spawner import place
+
+        length_m = args.spawn * 1000.0 / (SPAWN_BENCH_DENSITY * args.lanes)
+        place(1000.0, args.lanes, count=10)  # warm up numpy
+        t0 = time.perf_counter()
+        position, lane = place(length_m, args.lanes, count=args.spawn, rng=args.seed)
+        wall = time.perf_counter() - t0
+        per_lane = [position[lane == k] for k in range(args.lanes)]
+        min_gap = min((np.diff(p).min() for p in per_lane if len(p) > 1), default=float("inf")) - CAR_H
+        print(f"placed {len(position)} vehicles on {length_m / 1000:.0f} km x {args.lanes} lanes in {wall * 1000:.0f} ms "
+              f"(budget {SPAWN_BUDGET_S * 1000:.0f} ms), smallest gap {min_gap:.2f} m")
+        return 0 if wall <= SPAWN_BUDGET_S else 1
+
+    if args.kernels:
+        from highway import make_highway, run_highway
+
+        length_m = args.kernels * 1000.0 / (SPAWN_BENCH_DENSITY * args.lanes)
+        hw = make_highway(length_m, args.lanes, density_per_km=SPAWN_BENCH_DENSITY, seed=args.seed)
+        rates = {}
+        for name in KERNEL_NAMES:
+            t0 = time.perf_counter()
+            _, ticks = run_highway(hw, max_ticks=KERNEL_BENCH_TICKS, kernel=name)
+            rates[name] = hw.num_cars * ticks / (time.perf_counter() - t0)
+        _write_output({"cars": hw.num_cars, "ticks": KERNEL_BENCH_TICKS, "vehicle_ticks_per_s": rates}, args.output)
+        return 0
+
+    if args.hot_loop:
+        rate, per_tick, peak = hot_loop(num_traffic=args.cars, lanes=args.lanes, seed=args.seed or 0)
+        print(f"{args.cars + 1} cars: {rate:.0f} ticks/s, {per_tick:+.1f} bytes/tick net allocation, "
+              f"{peak} bytes peak transient")
+        return 0 if per_tick <= 0 else 1
+
+    if args.import_time:
+        total_ms, names = import_time()
+        heavy = sorted(n for n in HEAVY_MODULES if n in names)
+        ok = total_ms <= args.budget_ms and not heavy
+        print(f"headless import: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)"
+              + (f", pulls in {', '.join(heavy)}" if heavy else ""))
+        return 0 if ok else 1
+
+    t0 = time.perf_counter()
+    run_batch(args.runs, seed=args.seed, workers=args.workers,
+              num_traffic=args.cars, speed_limit_kmh=args.speed_limit, lanes=args.lanes, engine=args.engine,
+              pooled=not args.no_pool, **_timing(args))
+    wall = time.perf_counter() - t0
+    _write_output({
+        "scenario": _scenario(args),
+        "wall_s": wall,
+        "runs_per_s": args.runs / wall if wall > 0 else float("inf"),
+    }, args.output)
+    return 0
+
+
+def cmd_distributed(args):
+    import analysis
+    from distributed import parse_address, run_distributed
+
+    def ready(address, authkey):
+        print(f"serving {args.runs} runs on {address[0]}:{address[1]}; workers: "
+              f"python cli.py worker --connect HOST:{address[1]} --authkey {authkey.hex()}", file=sys.stderr)
+
+    authkey = bytes.fromhex(args.authkey) if args.authkey else None
+    with _progress(args, args.runs) as progress:
+        progress.workers = max(1, args.local_workers)
+        results, tasks = run_distributed(args.runs, seed=args.seed, num_traffic=args.cars,
+                                         speed_limit_kmh=args.speed_limit, lanes=args.lanes,
+                                         batch_runs=args.batch_runs, address=parse_address(args.listen),
+                                         authkey=authkey, local_workers=args.local_workers, lease_s=args.lease,
+                                         on_ready=ready, progress=progress)
+    summary = analysis.summarize_results(results, args.threshold)
+    summary.pop("times_by_car")
+    _write_output({"scenario": _scenario(args), "summary": summary, "tasks": tasks}, args.output)
+    return 0
+
+
+def cmd_worker(args):
+    from distributed import parse_address, work
+
+    done = work(parse_address(args.connect), bytes.fromhex(args.authkey), batch=args.batch)
+    print(f"{done} tasks done", file=sys.stderr)
+    return 0
+
+
+def cmd_highway(args):
+    from conflicts import ConflictCounter
+    from highway import make_highway, run_decomposed, run_highway
+
+    hw = make_highway(args.length_km * 1000.0, lanes=args.lanes, num_cars=args.cars,
+                      speed_limit_kmh=args.speed_limit, seed=args.seed, density_per_km=args.density,
+                      flow_per_h=args.flow, min_gap_m=args.min_gap)
+    recorder = _macro_recorder(args, hw.length_m, hw.lanes)
+    counter = ConflictCounter(end_m=hw.length_m) if args.conflicts else None
+    t0 = time.perf_counter()
+    if args.segments > 1:
+        (ids, times, finished), ticks = run_decomposed(hw, args.segments, max_ticks=args.ticks, macro=recorder,
+                                                       kernel=args.model, conflicts=counter, arbitrate=args.arbitrate)
+    else:
+        (ids, times, finished), ticks = run_highway(hw, max_ticks=args.ticks, macro=recorder, kernel=args.model,
+                                                    conflicts=counter, arbitrate=args.arbitrate)
+    wall = time.perf_counter() - t0
+    if recorder is not None:
+        recorder.sink.close()
+    payload = {
+        "cars": hw.num_cars,
+        "model": args.model,
+        "segments": max(1, args.segments),
+        "ticks": ticks,
+        "finished": int(finished.sum()),
+        "wall_s": wall,
+        "vehicle_ticks_per_s": hw.num_cars * ticks / wall if wall > 0 else float("inf"),
+    }
+    if counter is not None:
+        payload["conflicts"] = counter.stats()
+    if args.verify and args.segments > 1:
+        import numpy as np
+
+        ref_counter = ConflictCounter(end_m=hw.length_m) if counter is not None else None
+        (ref_ids, ref_times, ref_finished), ref_ticks = run_highway(hw, max_ticks=args.ticks, kernel=args.model,
+                                                                      conflicts=ref_counter, arbitrate=args.arbitrate)
+        payload["matches_single_process"] = bool(ref_ticks == ticks and np.array_equal(ref_ids, ids)
+                                                 and (counter is None or ref_counter.stats() == counter.stats())
+                                                 and np.array_equal(ref_times, times)
+                                                 and np.array_equal(ref_finished, finished))
+    _write_output(payload, args.output)
+    return 0 if payload.get("matches_single_process", True) else 1
+
+
+def cmd_ctm(args):
+    import ctm
+
+    if args.diagram and os.path.exists(args.diagram) and not args.recalibrate:
+        fd = ctm.FundamentalDiagram.load(args.diagram)
+    else:
+        fd = ctm.calibrate(seed=args.seed or 0)
+        if args.diagram:
+            fd.save(args.diagram)
+    report = ctm.validate(fd, runs=args.runs, seed=(args.seed or 0) + 10_000, num_traffic=args.cars,
+                          speed_limit_kmh=args.speed_limit, lanes=args.lanes, cell_m=args.cell_m)
+    _write_output(report, args.output)
+    return 0
+
+
+def cmd_train(args):
+    import surrogate
+
+    def run(first_run, n, scenario, seed):
+        with _progress(args, n) as progress:
+            return run_batch(n, seed=seed, workers=args.workers, num_traffic=scenario["num_traffic"],
+                             speed_limit_kmh=scenario["speed_limit_kmh"], lanes=scenario["lanes"], engine=args.engine,
+                             first_run=first_run, progress=progress, **_timing(args))
+
+    model = surrogate.train(args.log_root, args.cars, args.lanes, args.speed_limits, runs=args.runs,
+                            seed=args.seed or 0, run=run, engine=args.engine, **_timing(args))
+    model.save(args.output)
+    print(f"{len(model.params)} scenarios, {int(model.runs.sum())} runs -> {args.output} "
+          f"(leave-one-out CDF error up to {model.loo_rmse.max() * 100:.1f} points)", file=sys.stderr)
+    return 0
+
+
+def cmd_query(args):
+    import surrogate
+
+    model = surrogate.Surrogate.load(args.model) if args.model else None
+    t0 = time.perf_counter()
+    out = surrogate.answer(model, (args.cars, args.lanes, args.speed_limit), thresholds=args.threshold,
+                           fallback_runs=args.fallback_runs, seed=args.seed or 0)
+    out["wall_s"] = time.perf_counter() - t0
+    _write_output(out, args.output)
+    return 0
+
+
+def cmd_replay(args):
+    import main
+    main.playback(args.path)
+    return 0
+
+
+def _mean(values):
+    total = n = 0
+    for v in values:
+        total += v
+        n += 1
+    return total / n if n else None
+
+
+def _timing(args):
+    return {"sub_steps": args.sub_steps, "decision_hz": args.decision_hz}
+
+
+def _scenario(args):
+    return {k: getattr(args, k) for k in ("runs", "threshold", "cars", "lanes", "speed_limit", "seed", "workers", "engine",
+                                      "precision", "mean_precision", "time_budget", "sub_steps", "decision_hz", "no_pool",
+                                      "transport", "state_ticks", "batch_runs", "local_workers", "log")
+            if hasattr(args, k)}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Traffic simulation runner")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def common(p, cars=6):
+        p.add_argument("--cars", type=int, default=cars, help="traffic cars besides the player")
+        p.add_argument("--lanes", type=int, default=5)
+        p.add_argument("--speed-limit", type=float, default=120.0, help="initial limit (km/h)")
+        p.add_argument("--seed", type=int, default=None)
+        p.add_argument("--output", "-o", default=None, help="output path ('-' for stdout)")
+
+    def batch(p):
+        p.add_argument("--runs", "-n", type=int, default=100)
+        p.add_argument("--workers", "-j", type=int, default=1, help="processes (0 = one per core)")
+        p.add_argument("--engine", choices=("object", "event", "batch"), default="object",
+                       help="per-car objects (engine.py), event-driven jumps (events.py) "
+                            "or many runs as arrays (batch.py)")
+        p.add_argument("--sub-steps", type=int, default=1, help="integration steps per engine tick (object engine)")
+        p.add_argument("--decision-hz", type=float, default=None,
+                       help="driver decision rate; default decides every integration step (object engine)")
+
+    def macro(p):
+        g = p.add_argument_group("macroscopic flow / density / speed (headless)")
+        g.add_argument("--macro", metavar="PATH", default=None,
+                       help="write per lane/section/window metrics as CSV (*.csv) or JSON lines")
+        g.add_argument("--section-m", type=float, default=100.0, help="road section length (m)")
+        g.add_argument("--window-s", type=float, default=5.0, help="time window (s)")
+        g.add_argument("--sample-every", type=int, default=1, help="ticks between samples")
+
+    p = sub.add_parser("sim", help="single run (window, or JSON with --headless)")
+    common(p, cars=20)
+    p.add_argument("--headless", action="store_true", help="no window, print results")
+    macro(p)
+    p.add_argument("--render-process", action="store_true",
+                   help="simulate in a separate process at full speed; the window shows its latest frame")
+    p.add_argument("--realtime", action="store_true",
+                   help="with --render-process, pace the simulation to the wall clock instead")
+    p.set_defaults(func=cmd_sim)
+
+    p = sub.add_parser("monte", help="Monte Carlo finish-time distribution")
+    common(p)
+    batch(p)
+    p.add_argument("--threshold", "-t", type=float, default=25.0, help="finish time threshold (s)")
+    p.add_argument("--headless", action="store_true", help="print a summary instead of plotting")
+    p.add_argument("--raw", action="store_true", help="include per-run results in --output")
+    p.add_argument("--record", metavar="DIR", default=None, help="save every run as DIR/run_<i>.simrec")
+    p.add_argument("--transport", choices=("pickle", "shm"), default="pickle",
+                   help="how workers hand back results: pickled lists or a shared memory block (shared.py)")
+    p.add_argument("--state-ticks", type=int, default=0, metavar="N",
+                   help="with --transport shm, keep every run's positions and speeds for its first N ticks "
+                        "(in --output with --raw)")
+    p.add_argument("--precision", type=float, default=None,
+                   help="run in batches until the 95%% CI of P(t < threshold) is within +-this many "
+                        "points; --runs becomes the maximum")
+    p.add_argument("--mean-precision", type=float, default=None,
+                   help="with --precision, also wait for every per-car mean time to be within +-this (s)")
+    p.add_argument("--time-budget", type=float, default=None, help="with --precision, stop after this many seconds")
+    p.add_argument("--batch-runs", type=int, default=200,
+                   help="runs between convergence checks, or per --log record")
+    p.add_argument("--log", metavar="DIR", default=None,
+                   help="append finished batches to a run log in DIR and skip runs already there")
+    p.add_argument("--conflicts", action="store_true",
+                   help="count overlapping cars and near misses per run (object engine)")
+    p.set_defaults(func=cmd_monte)
+
+    p = sub.add_parser("analyze", help="summary of the runs in a monte --log directory so far")
+    p.add_argument("log", metavar="DIR")
+    p.add_argument("--threshold", "-t", type=float, default=25.0)
+    p.add_argument("--headless", action="store_true", help="print a summary instead of plotting")
+    p.set_defaults(func=cmd_analyze)
+
+    p = sub.add_parser("sweep", help="Monte Carlo over a grid of scenarios (JSON lines)")
+    batch(p)
+    p.add_argument("--speed-limits", type=_float_list, default=[120.0])
+    p.add_argument("--cars", type=_int_list, default=[6])
+    p.add_argument("--lanes", type=_int_list, default=[5])
+    p.add_argument("--threshold", "-t", type=float, default=25.0)
+    p.add_argument("--seed", type=int, default=None)
+    p.add_argument("--output", "-o", default=None)
+    p.set_defaults(func=cmd_sweep)
+
+    p = sub.add_parser("compare", help="paired Monte Carlo of scenario variants against the baseline")
+    common(p)
+    p.add_argument("--runs", "-n", type=int, default=100)
+    p.add_argument("--workers", "-j", type=int, default=1, help="processes (0 = one per core)")
+    p.add_argument("--variant", type=_variant, action="append", required=True,
+                   help="KEY=VALUE[,KEY=VALUE] overrides of the baseline (cars, lanes, speed_limit); repeatable")
+    p.add_argument("--threshold", "-t", type=float, default=25.0)
+    p.add_argument("--antithetic", action="store_true", help="also run every run with mirrored uniform draws")
+    p.add_argument("--independent", action="store_true",
+                   help="separate random streams per variant (no common random numbers)")
+    p.set_defaults(func=cmd_compare)
+
+    p = sub.add_parser("distributed", help="Monte Carlo served to workers on other hosts over TCP")
+    common(p)
+    p.add_argument("--runs", "-n", type=int, default=1000)
+    p.add_argument("--threshold", "-t", type=float, default=25.0)
+    p.add_argument("--listen", default="127.0.0.1:50000", help="HOST:PORT to serve tasks on")
+    p.add_argument("--authkey", default=None, help="hex key workers must present (default: random, printed)")
+    p.add_argument("--local-workers", type=int, default=1, help="worker processes on this machine")
+    p.add_argument("--batch-runs", type=int, default=50, help="runs per task")
+    p.add_argument("--lease", type=float, default=120.0, help="seconds before an unfinished task is handed out again")
+    p.set_defaults(func=cmd_distributed)
+
+    p = sub.add_parser("worker", help="run tasks for a 'distributed' coordinator")
+    p.add_argument("--connect", required=True, help="coordinator HOST:PORT")
+    p.add_argument("--authkey", required=True, help="key printed by the coordinator")
+    p.add_argument("--batch", type=int, default=1, help="tasks to take at a time")
+    p.set_defaults(func=cmd_worker)
+
+    p = sub.add_parser("ctm", help="calibrate the cell-transmission model and validate it against CarLogic")
+    common(p)
+    p.add_argument("--runs", "-n", type=int, default=200, help="validation runs")
+    p.add_argument("--diagram", metavar="PATH", default=None,
+                   help="fundamental diagram JSON: loaded if it exists, else calibrated and saved")
+    p.add_argument("--recalibrate", action="store_true", help="calibrate even if --diagram exists")
+    p.add_argument("--cell-m", type=float, default=50.0, help="CTM cell length (m)")
+    p.set_defaults(func=cmd_ctm)
+
+    p = sub.add_parser("highway", help="long highway split into segments across processes")
+    p.add_argument("--length-km", type=float, default=100.0)
+    p.add_argument("--cars", type=int, default=20_000)
+    p.add_argument("--lanes", type=int, default=5)
+    p.add_argument("--speed-limit", type=float, default=120.0, help="initial limit (km/h)")
+    p.add_argument("--density", type=float, default=None, help="veh/km/lane instead of --cars")
+    p.add_argument("--flow", type=float, default=None, help="veh/h/lane instead of --cars")
+    p.add_argument("--min-gap", type=float, default=2.0, help="bumper to bumper gap at spawn (m)")
+    p.add_argument("--model", choices=KERNEL_NAMES, default="reference",
+                   help="driver behaviour: CarLogic's rules, IDM car following, or IDM + MOBIL lane changes")
+    p.add_argument("--conflicts", action="store_true", help="count overlapping cars and near misses")
+    p.add_argument("--arbitrate", action="store_true",
+                   help="cancel lane changes into the same stretch of lane in the same tick (furthest ahead goes)")
+    p.add_argument("--segments", type=int, default=4, help="worker processes, one per road segment (1 = in process)")
+    p.add_argument("--ticks", type=int, default=None, help="stop after this many ticks")
+    p.add_argument("--verify", action="store_true", help="also run in one process and check the results match")
+    macro(p)
+    p.add_argument("--seed", type=int, default=None)
+    p.add_argument("--output", "-o", default=None)
+    p.set_defaults(func=cmd_highway)
+
+    p = sub.add_parser("train", help="log a grid of scenarios and fit a finish-time surrogate to them")
+    batch(p)
+    p.add_argument("--cars", type=_int_list, default=[2, 6, 10])
+    p.add_argument("--lanes", type=_int_list, default=[3, 5])
+    p.add_argument("--speed-limits", type=_float_list, default=[120.0, 200.0])
+    p.add_argument("--log-root", metavar="DIR", default="runs/surrogate",
+                   help="one run log per scenario under DIR (rerun to resume or add runs)")
+    p.add_argument("--seed", type=int, default=None)
+    p.add_argument("--output", "-o", default="surrogate.json", help="model file")
+    p.set_defaults(func=cmd_train)
+
+    p = sub.add_parser("query", help="finish-time quantiles / P(t < T) from a surrogate (simulates outside it)")
+    common(p)
+    p.add_argument("--model", metavar="PATH", default=None, help="surrogate from 'train' (none: always simulate)")
+    p.add_argument("--threshold", "-t", type=_float_list, default=[25.0], help="finish time thresholds (s)")
+    p.add_argument("--fallback-runs", type=int, default=200, help="runs to simulate outside the trained region")
+    p.set_defaults(func=cmd_query)
+
+    p = sub.add_parser("replay", help="play back a .simrec recording")
+    p.add_argument("path")
+    p.set_defaults(func=cmd_replay)
+
+    p = sub.add_parser("bench", help="headless runs/sec, or the import-time gate")
+    common(p)
+    batch(p)
+    p.add_argument("--import-time", action="store_true",
+                   help="check headless modules import under --budget-ms without pygame/matplotlib (exit 1 if not)")
+    p.add_argument("--budget-ms", type=float, default=50.0)
+    p.add_argument("--no-pool", action="store_true", help="new car objects every run and default GC settings")
+    p.add_argument("--transport-only", action="store_true",
+                   help="time --runs synthetic results coming back pickled vs through shared memory")
+    p.add_argument("--spawn", type=int, default=None, metavar="N",
+                   help=f"time placing N vehicles at {SPAWN_BENCH_DENSITY:.0f} veh/km/lane (exit 1 over "
+                        f"{SPAWN_BUDGET_S:.1f} s)")
+    p.add_argument("--kernels", type=int, default=None, metavar="N",
+                   help="vehicle-ticks/s of each highway behaviour kernel with N vehicles")
+    p.add_argument("--hot-loop", action="store_true",
+                   help="ticks/s of engine.step with --cars live cars; exit 1 if a steady-state tick keeps memory")
+    p.set_defaults(func=cmd_bench)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if getattr(args, "workers", 1) < 1:
+        args.workers = os.cpu_count() or 1
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+# conflicts.py
+"""
+Overlap and near-miss detection, and lane-change arbitration.
+
+Detection is a sweep-and-prune pass over cars sorted by (lane, position)
+(behaviour.Neighbours already has that order for the highway engine): a car
+spans [position, position + length], so every car it overlaps in its lane comes
+right after it in the order, up to searchsorted(key, key + length). That finds
+all overlapping pairs in O(N log N + pairs). Neighbours in lane that don't
+overlap are a near miss when the rear car closes in on the front one with a
+time to collision under NEAR_MISS_TTC_S.
+
+ConflictCounter turns the pairs of every tick into per-run counts: onsets
+(a pair that wasn't in conflict the tick before) and pair-ticks. It works as a
+run_simulation telemetry recorder (record(cars, dt)) or on sorted arrays (observe()).
+
+arbitrate() resolves lane changes decided in the same tick into the same
+stretch of a lane: only the car furthest ahead goes, the others stay in lane.
+"""
+import numpy as np
+
+from behaviour import LANE_KEY
+from spawner import MIN_GAP_M
+
+NEAR_MISS_TTC_S = 1.0
+_PAIR = np.int64(1) << 32  # pair key = rear id * _PAIR + front id
+
+
+def detect(key, length, speed, ttc_s=NEAR_MISS_TTC_S):
+    """
+    (overlap_rear, overlap_front, near_rear, near_front) index arrays into the cars
+    sorted by key = lane * LANE_KEY + position.
+    """
+    n = len(key)
+    idx = np.arange(n)
+    hi = np.searchsorted(key, key + length, "left")
+    count = hi - idx - 1
+    rear = np.repeat(idx, count)
+    first = np.cumsum(count) - count
+    front = rear + 1 + np.arange(len(rear)) - np.repeat(first, count)
+
+    # nearest car ahead in the same lane, not overlapping
+    nxt = idx[:-1] + 1
+    gap = key[nxt] - key[:-1] - length[:-1]
+    closing = speed[:-1] - speed[nxt]
+    same_lane = np.floor(key[nxt] / LANE_KEY + 0.5) == np.floor(key[:-1] / LANE_KEY + 0.5)
+    near = same_lane & (gap >= 0) & (closing > 0) & (gap < closing * ttc_s)
+    return rear, front, idx[:-1][near], nxt[near]
+
+
+class ConflictCounter:
+    """Overlap / near-miss counts of one run (onsets and pair-ticks) and arbitrated lane changes."""
+
+    def __init__(self, ttc_s=NEAR_MISS_TTC_S, end_m=None):
+        self.ttc_s = ttc_s
+        self.end_m = end_m  # pairs whose rear car is past this don't count
+        self.overlaps = 0
+        self.overlap_ticks = 0
+        self.near_misses = 0
+        self.near_miss_ticks = 0
+        self.lane_change_conflicts = 0
+        self._prev = (np.empty(0, np.int64), np.empty(0, np.int64))  # overlap, near-miss pair keys
+        self._buf = None
+
+    def record(self, car_list, dt):
+        n = len(car_list)
+        if self._buf is None or len(self._buf[0]) != n:
+            self._buf = tuple(np.empty(n, dtype) for dtype in (np.int64, float, np.int64, float, float))
+        ids, pos, lane, length, speed = self._buf
+        for j, c in enumerate(car_list):
+            ids[j], pos[j], lane[j], length[j], speed[j] = c.id, c.position, c.lane, c.length, c.speed
+        key = lane * LANE_KEY + pos
+        order = np.argsort(key, kind="stable")
+        self.observe(key[order], {"id": ids[order], "position": pos[order], "length": length[order],
+                                  "speed": speed[order]})
+
+    def observe(self, key, cars, rear=None):
+        """One tick of cars sorted by key (dict with id, position, length, speed); rear, if given,
+        is the mask of cars whose pairs count here (the rear car of each pair is counted by its owner)."""
+        o_rear, o_front, n_rear, n_front = detect(key, cars["length"], cars["speed"], self.ttc_s)
+        keep = np.ones(len(key), bool) if rear is None else rear.copy()
+        if self.end_m is not None:
+            keep &= cars["position"] < self.end_m
+        ids = cars["id"].astype(np.int64)
+        now = []
+        for r, f in ((o_rear, o_front), (n_rear, n_front)):
+            k = keep[r]
+            now.append(np.unique(ids[r[k]] * _PAIR + ids[f[k]]))
+        new = [int((~np.isin(cur, prev)).sum()) for cur, prev in zip(now, self._prev)]
+        self.overlaps += new[0]
+        self.near_misses += new[1]
+        self.overlap_ticks += len(now[0])
+        self.near_miss_ticks += len(now[1])
+        self._prev = tuple(now)
+
+    def carry(self, ids):
+        """Take out last tick's pairs whose rear car is one of ids (cars moving to another counter)."""
+        out = []
+        kept = []
+        for prev in self._prev:
+            moving = np.isin(prev // _PAIR, ids)
+            out.append(prev[moving])
+            kept.append(prev[~moving])
+        self._prev = tuple(kept)
+        return tuple(out)
+
+    def adopt(self, carried):
+        """Pairs handed over by carry() on the counter the cars came from."""
+        self._prev = tuple(np.union1d(p, c) for p, c in zip(self._prev, carried))
+
+    def stats(self):
+        return {"overlaps": self.overlaps, "overlap_ticks": self.overlap_ticks, "near_misses": self.near_misses,
+                "near_miss_ticks": self.near_miss_ticks, "lane_change_conflicts": self.lane_change_conflicts}
+
+    def merge(self, stats):
+        """Add another counter's stats() (e.g. from a segment worker)."""
+        for k, v in stats.items():
+            setattr(self, k, getattr(self, k) + v)
+
+
+def summarize(stats):
+    """Monte Carlo report of per-run stats() dicts."""
+    runs = len(stats)
+    out = {"runs": runs, "runs_with_overlap": sum(1 for s in stats if s["overlaps"])}
+    for k in ("overlaps", "near_misses", "lane_change_conflicts"):
+        values = [s[k] for s in stats]
+        out[k] = {"total": sum(values), "per_run": sum(values) / runs if runs else 0.0,
+                  "max": max(values, default=0)}
+    return out
+
+
+# --- lane-change arbitration ---
+
+def proposals(own, change):
+    """The lane changes own cars want this tick: id, position, length and target lane of each."""
+    moving = change != 0
+    return {"id": own["id"][moving], "position": own["position"][moving], "length": own["length"][moving],
+            "target": own["lane"][moving] + change[moving]}
+
+
+def arbitrate(own, change, others=(), margin=MIN_GAP_M):
+    """
+    (change, cancelled): own lane changes with the conflicting ones cancelled. Changes into
+    the same lane whose footprints come within margin of each other conflict; the car
+    furthest ahead (lowest id on a tie) wins. others = proposals() of changers elsewhere
+    (other segments) that own changers may conflict with.
+    """
+    mine = proposals(own, change)
+    parts = [mine] + [p for p in others if len(p["id"])]
+    allp = {k: np.concatenate([p[k] for p in parts]) for k in mine} if len(parts) > 1 else mine
+    cancelled = np.zeros(len(change), bool)
+    if not len(mine["id"]):
+        return change, cancelled
+    key = allp["target"] * LANE_KEY + allp["position"]
+    order = np.lexsort((-allp["id"], key))  # ahead and lower id = later = higher priority
+    key, length = key[order], allp["length"][order]
+    # each changer loses to the next changer in order if that one is within reach
+    loses = np.zeros(len(key), bool)
+    loses[:-1] = key[1:] < key[:-1] + length[:-1] + margin
+    lost = np.empty(len(key), bool)
+    lost[order] = loses
+    moving = np.flatnonzero(change != 0)
+    cancelled[moving] = lost[:len(mine["id"])]
+    return np.where(cancelled, 0, change), cancelled
@@ -0,0 +1,135 @@
+# crn.py
+"""
+Paired-scenario Monte Carlo with common random numbers and antithetic runs.
+
+With engine.run_simulation(streams=...), the slot layout, the signs and every
+car's own draws (sprite, initial speed, speed preference, accel/decel) come
+from separate generators keyed by (seed, run, purpose). Running each variant
+of a comparison on the same Streams means car k has the same attributes and
+the signs are the same in every variant, even when the variant changes how
+many draws the layout takes, so most of the run-to-run noise cancels in the
+difference.
+
+Antithetic runs repeat each run with every uniform draw u replaced by 1 - u
+and average the pair. Integer draws (slot shuffle, sprite and sign choices)
+are left as they are.
+"""
+import random
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+
+
+class AntitheticRandom(random.Random):
+    """random.Random with random() mirrored to 1 - u; integer draws match the plain stream."""
+
+    def random(self):
+        return 1.0 - super().random()
+
+    # Overriding getrandbits (even unchanged) is what makes Random subclasses build
+    # randrange / choice on it rather than on random(), which is mirrored here
+    def getrandbits(self, k):
+        return super().getrandbits(k)
+
+
+class Streams:
+    """Independent generators for one run: layout, signs and car(k) for car k (0 = player)."""
+
+    def __init__(self, seed, run=0, antithetic=False):
+        self._cls = AntitheticRandom if antithetic else random.Random
+        self._key = f"{seed}:{run}"
+        self.layout = self._cls(self._key + ":layout")
+        self.signs = self._cls(self._key + ":signs")
+
+    def car(self, k):
+        return self._cls(f"{self._key}:car{k}")
+
+
+def run_metrics(results, time_threshold):
+    """(mean finish time, % of finishes under time_threshold) of one run."""
+    times = [t for _, t, finished in results if finished]
+    if not times:
+        return float("nan"), 0.0
+    return sum(times) / len(times), sum(1 for t in times if t < time_threshold) / len(times) * 100
+
+
+def _paired_chunk(run_ids, seed, variants, antithetic, time_threshold, common):
+    """Per run, per variant: list of metrics for the plain run (and its antithetic twin)."""
+    import engine
+
+    rows = []
+    for i in run_ids:
+        row = []
+        for j, variant in enumerate(variants):
+            run = i if common else f"{i}/{j}"
+            sims = [Streams(seed, run)]
+            if antithetic:
+                sims.append(Streams(seed, run, antithetic=True))
+            row.append([run_metrics(engine.run_simulation(None, streams=s, **variant), time_threshold) for s in sims])
+        rows.append(row)
+    return rows
+
+
+def _estimate(units):
+    n = len(units)
+    mean = statistics.fmean(units)
+    var = statistics.variance(units, mean) if n > 1 else float("inf")
+    return mean, var
+
+
+def run_paired(variants, num_runs, seed=None, antithetic=False, time_threshold=25.0, workers=1, common=True):
+    """
+    Run every variant (dict of run_simulation kwargs: num_traffic, speed_limit_kmh, lanes)
+    num_runs times and compare each with variants[0].
+
+    Reports per variant the mean finish time and P(under threshold) with standard
+    errors, and per difference the paired standard error next to the one the same
+    number of independent runs would give; variance_ratio is how many times more
+    runs an independent comparison needs. With antithetic=True each run is a pair
+    of simulations, and antithetic_variance_ratio compares against 2x plain runs.
+    common=False gives each variant its own streams (for checking the savings).
+    """
+    if seed is None:
+        seed = random.getrandbits(64)
+    args = (seed, variants, antithetic, time_threshold, common)
+    if workers <= 1:
+        rows = _paired_chunk(range(num_runs), *args)
+    else:
+        chunk = max(1, num_runs // (workers * 4))
+        slices = [range(i, min(i + chunk, num_runs)) for i in range(0, num_runs, chunk)]
+        rows = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for part in pool.map(_paired_chunk, slices, *[[a] * len(slices) for a in args]):
+                rows.extend(part)
+
+    n = len(rows)
+    report = {"runs": n, "seed": seed, "antithetic": antithetic, "common_random_numbers": common,
+              "time_threshold": time_threshold, "variants": [], "differences": []}
+    # units[j][m] = per-run value of metric m for variant j (antithetic pairs averaged)
+    units = []
+    for j, variant in enumerate(variants):
+        per_metric = {}
+        entry = {"scenario": variant}
+        for m, name in enumerate(("mean_time", "prob_under")):
+            values = [statistics.fmean(sim[m] for sim in row[j]) for row in rows]
+            mean, var = _estimate(values)
+            per_metric[name] = values
+            entry[name] = mean
+            entry[name + "_se"] = (var / n) ** 0.5
+            if antithetic:
+                _, single_var = _estimate([sim[m] for row in rows for sim in row[j]])
+                entry[name + "_antithetic_variance_ratio"] = (single_var / (2 * n)) / (var / n) if var else float("inf")
+        units.append(per_metric)
+        report["variants"].append(entry)
+
+    base = units[0]
+    for j in range(1, len(variants)):
+        diff = {"variant": j}
+        for name in ("mean_time", "prob_under"):
+            d_mean, d_var = _estimate([b - a for a, b in zip(base[name], units[j][name])])
+            indep_var = _estimate(base[name])[1] + _estimate(units[j][name])[1]
+            diff[name] = d_mean
+            diff[name + "_se"] = (d_var / n) ** 0.5
+            diff[name + "_se_independent"] = (indep_var / n) ** 0.5
+            diff[name + "_variance_ratio"] = indep_var / d_var if d_var else float("inf")
+        report["differences"].append(diff)
+    return report
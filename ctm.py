@@ -0,0 +1,255 @@
+# ctm.py
+"""
+Cell-transmission (LWR) approximation of the road, calibrated from CarLogic runs.
+
+The road is cut into cells of cell_m metres and only each cell's density
+(all lanes together) is simulated. Flow between neighbouring cells is
+the smaller of what the upstream cell can send and what the downstream
+one can take, from a triangular fundamental diagram:
+
+    demand  D = min(v_free(limit) * k, lanes * q_max)
+    supply  S = min(lanes * q_max, w * (lanes * k_jam - k))
+
+with v_free depending on the cell's sign limit (v_free = a * limit + b). The
+whole batch of runs is stepped as (runs, cells) arrays, so thousands of
+what-if runs cost about as much as a handful of micro runs.
+
+calibrate() fits the diagram from macro.MacroRecorder output: the
+free-flow line from run_simulation runs (per-cell sign limits), capacity and
+the congested branch from highway.py runs over a range of densities (the
+screen-sized run_simulation road never gets dense enough to congest).
+validate() replays seeded run_simulation runs with the same signs and
+initial positions in the CTM and compares travel times car by car in exit order.
+"""
+import json
+import random
+import time
+
+import numpy as np
+
+import engine
+from macro import ColumnSink, MacroRecorder
+
+CELL_M = 50.0
+CALIBRATION_DENSITIES = (2.0, 5.0, 8.0, 11.0, 14.0, 17.0, 20.0, 23.0)  # veh/km/lane
+
+
+class FundamentalDiagram:
+    """Triangular diagram per lane: free speed a * limit + b (km/h), capacity q_max (veh/h), jam k_jam (veh/km)."""
+
+    def __init__(self, a, b, q_max, k_jam, w):
+        self.a, self.b = a, b
+        self.q_max = q_max
+        self.k_jam = k_jam
+        self.w = w  # congested wave speed (km/h)
+
+    def v_free(self, limit_kmh):
+        return np.maximum(self.a * np.asarray(limit_kmh, dtype=float) + self.b, 1.0)
+
+    def to_dict(self):
+        return {"a": self.a, "b": self.b, "q_max": self.q_max, "k_jam": self.k_jam, "w": self.w}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["a"], d["b"], d["q_max"], d["k_jam"], d["w"])
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+def _cell_limits(x0, sign_position, sign_limit_kmh, default_kmh):
+    """Limit in force at each cell start: the last sign at or before it."""
+    idx = np.searchsorted(sign_position, x0, "right") - 1
+    return np.where(idx >= 0, np.asarray(sign_limit_kmh, dtype=float)[np.maximum(idx, 0)], default_kmh)
+
+
+# --- calibration ---
+
+def free_flow_data(runs=200, seed=0, speed_limit_kmh=120.0, num_traffic=6, lanes=engine.LANES,
+                   section_m=100.0, window_s=2.0):
+    """(speed_kmh, limit_kmh, weight) of the occupied cells of seeded run_simulation runs."""
+    speed, limit, weight = [], [], []
+    for i in range(runs):
+        random.seed(seed + i)
+        sink = ColumnSink()
+        rec = MacroRecorder(sink, engine.END_Y_M, lanes, section_m, window_s, run=i)
+        engine.run_simulation(None, num_traffic=num_traffic, speed_limit_kmh=speed_limit_kmh, lanes=lanes,
+                              telemetry=rec)
+        rec.close()
+        cols = sink.columns()
+        used = cols["samples"] > 0
+        positions, limits = zip(*rec.signs) if rec.signs else ((), ())
+        speed.append(cols["speed_kmh"][used])
+        limit.append(_cell_limits(cols["x0"][used], np.array(positions), limits, speed_limit_kmh))
+        weight.append(cols["samples"][used])
+    return np.concatenate(speed), np.concatenate(limit), np.concatenate(weight).astype(float)
+
+
+def capacity_data(densities=CALIBRATION_DENSITIES, length_m=5000.0, lanes=3, ticks=150, seed=0,
+                  section_m=250.0, window_s=10.0):
+    """(density, flow) per lane of highway runs at each spawn density, first window (warm-up) dropped."""
+    from highway import make_highway, run_highway
+
+    k, q = [], []
+    for j, d in enumerate(densities):
+        sink = ColumnSink()
+        hw = make_highway(length_m, lanes, density_per_km=d, seed=seed + j)
+        run_highway(hw, max_ticks=ticks, macro=MacroRecorder(sink, length_m, lanes, section_m, window_s))
+        cols = sink.columns()
+        keep = cols["window"] >= 1
+        k.append(cols["density_veh_km"][keep])
+        q.append(cols["flow_veh_h"][keep])
+    return np.concatenate(k), np.concatenate(q)
+
+
+def calibrate(free_flow=None, capacity=None, seed=0):
+    """
+    Fit a FundamentalDiagram. free_flow = free_flow_data(), capacity = capacity_data()
+    (generated with `seed` when not given).
+      v_free: weighted least squares of cell speed on sign limit
+      q_max:  highest median flow over 1 veh/km density bins
+      k_jam, w: least squares line q = w (k_jam - k) through the bins past capacity
+    """
+    speed, limit, weight = free_flow if free_flow is not None else free_flow_data(seed=seed)
+    sw = np.sqrt(weight)
+    a, b = np.linalg.lstsq(np.column_stack((limit, np.ones_like(limit))) * sw[:, None], speed * sw, rcond=None)[0]
+
+    k, q = capacity if capacity is not None else capacity_data(seed=seed)
+    bins = np.floor(k).astype(int)
+    centers, medians = [], []
+    for b_ in np.unique(bins):
+        sel = bins == b_
+        if sel.sum() >= 5:
+            centers.append(k[sel].mean())
+            medians.append(np.median(q[sel]))
+    centers, medians = np.array(centers), np.array(medians)
+    peak = int(np.argmax(medians))
+    q_max = float(medians[peak])
+
+    congested = slice(peak, None)
+    if len(centers[congested]) >= 3:
+        slope, intercept = np.polyfit(centers[congested], medians[congested], 1)
+    else:
+        slope = 0.0
+    if slope < 0:
+        w, k_jam = -slope, intercept / -slope
+    else:  # no congested branch in the data: bumper to bumper at the spawn gap
+        from spawner import MIN_GAP_M
+        k_jam = 1000.0 / (engine.CAR_H + MIN_GAP_M)
+        w = q_max / (k_jam - centers[peak])
+    return FundamentalDiagram(float(a), float(b), q_max, float(k_jam), float(w))
+
+
+# --- simulation ---
+
+def simulate(fd, positions, sign_position, sign_limit_kmh, lanes=engine.LANES, end_m=engine.END_Y_M,
+             cell_m=CELL_M, default_limit_kmh=120.0, t0=0.0, max_t=600.0):
+    """
+    CTM runs of one road length. positions[r] = initial car positions of run r (same count per run),
+    sign_position / sign_limit_kmh = per-run sign arrays (lists). Returns exit times (runs, cars):
+    the time the cumulative outflow past end_m reaches n - 0.5 for the n-th car to leave.
+    """
+    runs = len(positions)
+    n_cars = len(positions[0])
+    start = min(0.0, min(float(np.min(p)) for p in positions))
+    edges = np.arange(start, end_m + cell_m, cell_m)
+    edges[-1] = end_m
+    cells = len(edges) - 1
+    dx = np.diff(edges) / 1000.0  # km
+
+    k = np.empty((runs, cells))
+    v = np.empty((runs, cells))
+    for r in range(runs):
+        k[r] = np.histogram(positions[r], edges)[0] / dx
+        v[r] = fd.v_free(_cell_limits(edges[:-1], np.asarray(sign_position[r]), sign_limit_kmh[r], default_limit_kmh))
+    cap = lanes * fd.q_max
+    jam = lanes * fd.k_jam
+    dt_h = 0.95 * dx.min() / max(float(v.max()), fd.w)  # CFL
+
+    out = np.zeros(runs)
+    exits = np.full((runs, n_cars), np.nan)
+    targets = np.arange(n_cars) + 0.5
+    t = t0
+    steps = int(max_t / (dt_h * 3600.0)) + 1
+    for _ in range(steps):
+        demand = np.minimum(v * k, cap)
+        supply = np.minimum(cap, fd.w * (jam - k))
+        flow = np.empty_like(demand)
+        flow[:, :-1] = np.minimum(demand[:, :-1], supply[:, 1:])
+        flow[:, -1] = demand[:, -1]  # free outflow past the line
+        k[:, 1:] += flow[:, :-1] * dt_h / dx[1:]
+        k -= flow * dt_h / dx
+
+        before = out
+        out = out + flow[:, -1] * dt_h
+        t_next = t + dt_h * 3600.0
+        crossed = (before[:, None] < targets) & (out[:, None] >= targets)
+        if crossed.any():
+            frac = (targets - before[:, None]) / np.maximum(out - before, 1e-12)[:, None]
+            exits = np.where(crossed, t + frac * (t_next - t), exits)
+        t = t_next
+        if out.min() >= n_cars - 0.5:
+            break
+    return exits
+
+
+class _Start:
+    """run_simulation recorder keeping the state after the first tick (and the signs)."""
+
+    def __init__(self):
+        self.signs = None
+        self.positions = None
+        self.dt = None
+
+    def record(self, car_list, dt):
+        if self.positions is None:
+            self.positions = np.array([c.position for c in car_list])
+            self.dt = dt
+
+
+def validate(fd, runs=200, seed=10_000, num_traffic=6, speed_limit_kmh=120.0, lanes=engine.LANES,
+             cell_m=CELL_M):
+    """Seeded run_simulation runs against the CTM on the same signs and starting positions."""
+    micro, starts = [], []
+    t_micro = time.perf_counter()
+    for i in range(runs):
+        random.seed(seed + i)
+        start = _Start()
+        results = engine.run_simulation(None, num_traffic=num_traffic, speed_limit_kmh=speed_limit_kmh,
+                                        lanes=lanes, telemetry=start)
+        micro.append(sorted(t for _, t, f in results if f))
+        starts.append(start)
+    t_micro = time.perf_counter() - t_micro
+
+    t_ctm = time.perf_counter()
+    exits = simulate(fd, [s.positions for s in starts], [[p for p, _ in s.signs] for s in starts],
+                     [[lim for _, lim in s.signs] for s in starts], lanes=lanes, cell_m=cell_m,
+                     default_limit_kmh=speed_limit_kmh, t0=starts[0].dt)
+    t_ctm = time.perf_counter() - t_ctm
+
+    # (runs, cars), sorted: n-th column = n-th car over the line; NaN past the cars that finished
+    padded = np.full(exits.shape, np.nan)
+    for row, times in zip(padded, micro):
+        row[:len(times)] = times
+    micro = padded
+    err = exits - micro
+    run_mean_micro, run_mean_ctm = np.nanmean(micro, axis=1), np.nanmean(exits, axis=1)
+    both = ~np.isnan(run_mean_micro) & ~np.isnan(run_mean_ctm)
+    return {
+        "runs": runs,
+        "cars": micro.shape[1],
+        "diagram": fd.to_dict(),
+        "mean_travel_time_s": {"micro": float(np.nanmean(micro)), "ctm": float(np.nanmean(exits))},
+        "run_mean_abs_error_s": float(np.nanmean(np.abs(run_mean_ctm - run_mean_micro))),
+        "run_mean_correlation": float(np.corrcoef(run_mean_micro[both], run_mean_ctm[both])[0, 1]),
+        "by_exit_order": [{"n": n + 1, "micro_s": float(np.nanmean(micro[:, n])), "ctm_s": float(np.nanmean(exits[:, n])),
+                           "mean_abs_error_s": float(np.nanmean(np.abs(err[:, n])))} for n in range(micro.shape[1])],
+        "wall_s": {"micro": t_micro, "ctm": t_ctm},
+        "speedup": t_micro / t_ctm if t_ctm > 0 else float("inf"),
+    }
@@ -0,0 +1,303 @@
+# distributed.py
+"""
+Monte Carlo over workers on any host, through a job board served over TCP.
+
+The coordinator splits a scenario's runs into tasks keyed by
+"<scenario hash>/<first run>", publishes them on a TaskBoard and serves the
+board with multiprocessing.managers. Workers connect, take a few tasks at a
+time, run them on the object engine (run i seeded with seed + i, as
+cli.run_batch does) and submit packed results under the task key.
+
+A taken task is leased for lease_s seconds; if its result isn't in by then
+(worker died, host lost) the task goes back on the queue for someone else.
+Submitting is idempotent: the first result for a key wins and late duplicates
+from a worker that was only slow are dropped, which is safe because a task's
+result only depends on its seeds.
+
+    coordinator:  python cli.py distributed --runs 100000 --listen 0.0.0.0:50000 --seed 1
+    each worker:  python cli.py worker --connect coordinator-host:50000 --authkey <hex>
+"""
+import hashlib
+import json
+import socket
+import threading
+import time
+from array import array
+from collections import deque
+from multiprocessing.managers import BaseManager
+
+DEFAULT_LEASE_S = 120.0
+
+
+def task_key(scenario, seed, first_run):
+    """Idempotent result key: the same runs of the same scenario always get the same key."""
+    digest = hashlib.sha1(json.dumps([scenario, seed], sort_keys=True).encode()).hexdigest()[:12]
+    return f"{digest}/{first_run}"
+
+
+class TaskBoard:
+    """Queued, leased and finished tasks; lives in the coordinator, shared through the manager."""
+
+    def __init__(self, lease_s=DEFAULT_LEASE_S):
+        self.lease_s = lease_s
+        self._lock = threading.Lock()
+        self._tasks = {}     # key -> task
+        self._pending = deque()
+        self._leases = {}    # key -> (deadline, worker)
+        self._results = {}   # key -> packed result
+        self._closed = False
+        self.retries = 0
+        self.duplicates = 0
+        self.runs_done = 0
+        self.vehicle_ticks = 0
+        self.busy_s = 0.0
+
+    def publish(self, tasks):
+        """Queue (key, task) pairs; keys already queued or finished are skipped."""
+        with self._lock:
+            for key, task in tasks:
+                if key not in self._tasks:
+                    self._tasks[key] = task
+                    self._pending.append(key)
+
+    def _requeue_expired(self, now):
+        for key, (deadline, _) in list(self._leases.items()):
+            if deadline <= now:
+                del self._leases[key]
+                self._pending.append(key)
+                self.retries += 1
+
+    def take(self, worker, n=1):
+        """Lease up to n tasks to worker: [(key, task)], [] if none is free now, None once closed."""
+        with self._lock:
+            if self._closed:
+                return None
+            now = time.monotonic()
+            self._requeue_expired(now)
+            out = []
+            while self._pending and len(out) < n:
+                key = self._pending.popleft()
+                if key in self._results or key in self._leases:
+                    continue
+                self._leases[key] = (now + self.lease_s, worker)
+                out.append((key, self._tasks[key]))
+            return out
+
+    def submit(self, key, result, vehicle_ticks=0, busy_s=0.0):
+        """Store a task's result; False if the key already has one (or is unknown)."""
+        with self._lock:
+            self._leases.pop(key, None)
+            if key in self._results or key not in self._tasks:
+                self.duplicates += 1
+                return False
+            self._results[key] = result
+            self.runs_done += result[0]
+            self.vehicle_ticks += vehicle_ticks
+            self.busy_s += busy_s
+            return True
+
+    def progress(self):
+        with self._lock:
+            return {"done": len(self._results), "total": len(self._tasks), "leased": len(self._leases),
+                    "retries": self.retries, "duplicates": self.duplicates, "runs": self.runs_done,
+                    "vehicle_ticks": self.vehicle_ticks, "busy_s": self.busy_s}
+
+    def results(self, keys):
+        with self._lock:
+            return [self._results[k] for k in keys]
+
+    def close(self):
+        """Tell workers to exit (take() returns None from now on)."""
+        with self._lock:
+            self._closed = True
+
+
+class _BoardClient(BaseManager):
+    pass
+
+
+_BoardClient.register("board")
+
+
+def parse_address(text):
+    host, _, port = text.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def serve(board, address=("127.0.0.1", 0), authkey=b""):
+    """Serve board over TCP from a background thread; returns the server (.address), for stop()."""
+    class BoardServer(BaseManager):  # registrations are per class, so one class per served board
+        pass
+
+    BoardServer.register("board", callable=lambda: board)
+    server = BoardServer(address=address, authkey=authkey).get_server()
+    server.stop_event = threading.Event()
+    server.accept_thread = threading.Thread(target=_accept, args=(server,), daemon=True)
+    server.accept_thread.start()
+    return server
+
+
+def _accept(server):
+    """Server.accepter until stop(): that one retries a closed listener forever."""
+    while True:
+        try:
+            conn = server.listener.accept()
+        except Exception:  # a client failing the handshake, or stop()'s wake-up connection
+            if server.stop_event.is_set():
+                return
+            continue
+        if server.stop_event.is_set():
+            conn.close()
+            return
+        threading.Thread(target=server.handle_request, args=(conn,), daemon=True).start()
+
+
+def stop(server):
+    """Stop accepting connections for a serve() server and close its listening socket."""
+    server.stop_event.set()
+    try:
+        socket.create_connection(server.address, timeout=1.0).close()  # unblock accept()
+    except OSError:
+        pass
+    server.accept_thread.join()
+    server.listener.close()
+
+
+def connect(address, authkey, timeout=30.0):
+    """Proxy to a served TaskBoard, retrying until the coordinator is up or timeout runs out."""
+    deadline = time.monotonic() + timeout
+    while True:
+        client = _BoardClient(address=address, authkey=authkey)
+        try:
+            client.connect()
+            return client.board()
+        except (ConnectionError, OSError):
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.5)
+
+
+# --- tasks and results ---
+
+def pack_runs(results):
+    """Runs of [(car_id, elapsed_time, finished)] (same number of cars each) -> compact tuple."""
+    ids, times, finished = array("q"), array("d"), bytearray()
+    for run in results:
+        for cid, t, f in run:
+            ids.append(cid)
+            times.append(t)
+            finished.append(f)
+    return len(results), ids.tobytes(), times.tobytes(), bytes(finished)
+
+
+def unpack_runs(packed):
+    num_runs, ids_b, times_b, finished = packed
+    ids, times = array("q"), array("d")
+    ids.frombytes(ids_b)
+    times.frombytes(times_b)
+    cars = len(ids) // num_runs if num_runs else 0
+    return [[(ids[j], times[j], bool(finished[j])) for j in range(r * cars, (r + 1) * cars)] for r in range(num_runs)]
+
+
+def run_task(task):
+    """Run one task dict (scenario, seed, first_run, runs) on the object engine: (packed results, vehicle-ticks)."""
+    import random
+    import engine
+    from progress import vehicle_ticks
+
+    scenario = task["scenario"]
+    pool = engine.VehiclePool()
+    results = []
+    with engine.quiet_gc():
+        for i in range(task["first_run"], task["first_run"] + task["runs"]):
+            if task["seed"] is not None:
+                random.seed(task["seed"] + i)
+            results.append(engine.run_simulation(None, pool=pool, **scenario))
+    return pack_runs(results), vehicle_ticks(results)
+
+
+def work(address, authkey, name=None, batch=1, poll_s=0.5, connect_timeout=30.0):
+    """Worker loop: take, run and submit tasks until the board closes or goes away; returns tasks done."""
+    import os
+    import socket
+
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    board = connect(address, authkey, connect_timeout)
+    done = 0
+    try:
+        while True:
+            tasks = board.take(name, batch)
+            if tasks is None:
+                return done
+            if not tasks:
+                time.sleep(poll_s)
+                continue
+            for key, task in tasks:
+                t0 = time.perf_counter()
+                packed, ticks = run_task(task)
+                board.submit(key, packed, ticks, time.perf_counter() - t0)
+                done += 1
+    except (ConnectionError, EOFError, OSError):
+        return done  # coordinator gone
+
+
+def _local_worker(address, authkey):
+    work(address, authkey)
+
+
+def run_distributed(num_runs, seed=None, num_traffic=6, speed_limit_kmh=120.0, lanes=5, batch_runs=50,
+                    address=("127.0.0.1", 0), authkey=None, local_workers=1, lease_s=DEFAULT_LEASE_S,
+                    on_ready=None, timeout=None, progress=None):
+    """
+    Coordinator: publish num_runs runs as tasks of batch_runs, serve them and wait for
+    every result; returns (results in run order, board.progress()).
+
+    local_workers processes on this machine join in (0 = only remote workers).
+    on_ready(address, authkey) is called once the board is being served, e.g. to
+    print how remote workers connect. Results equal cli.run_batch with the same seed.
+    progress (a progress.Progress) is kept up to date from the board; its workers
+    count is what utilisation is measured against.
+    """
+    import multiprocessing
+    import os
+    import random
+
+    if seed is None:
+        seed = random.getrandbits(32)
+    if authkey is None:
+        authkey = os.urandom(16)
+    scenario = {"num_traffic": num_traffic, "speed_limit_kmh": speed_limit_kmh, "lanes": lanes}
+    tasks = []
+    for first in range(0, num_runs, batch_runs):
+        task = {"scenario": scenario, "seed": seed, "first_run": first, "runs": min(batch_runs, num_runs - first)}
+        tasks.append((task_key(scenario, seed, first), task))
+
+    board = TaskBoard(lease_s)
+    board.publish(tasks)
+    server = serve(board, address, authkey)
+    if on_ready is not None:
+        on_ready(server.address, authkey)
+    procs = [multiprocessing.Process(target=_local_worker, args=(server.address, authkey), daemon=True)
+             for _ in range(local_workers)]
+    for p in procs:
+        p.start()
+    try:
+        t0 = time.monotonic()
+        while True:
+            state = board.progress()
+            if progress is not None:
+                progress.set(state["runs"], state["vehicle_ticks"], state["busy_s"])
+            if state["done"] >= len(tasks):
+                break
+            if timeout is not None and time.monotonic() - t0 > timeout:
+                raise TimeoutError(f"distributed run: {board.progress()}")
+            time.sleep(0.1)
+        results = []
+        for packed in board.results([key for key, _ in tasks]):
+            results.extend(unpack_runs(packed))
+        return results, board.progress()
+    finally:
+        board.close()
+        for p in procs:
+            p.join(timeout=10)
+        stop(server)
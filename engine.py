@@ -0,0 +1,299 @@
+# engine.py
+"""
+Headless simulation core: spawning, signs, the fixed-step loop and Monte Carlo.
+
+Nothing here imports pygame or matplotlib, so Monte Carlo workers and the CLI
+start fast. main.py layers the drawing code on top of these classes.
+"""
+import gc
+import random
+import time
+from contextlib import contextmanager
+from functools import partial
+from sheets import atlas_keys
+from carstats import CarStats, cars
+
+# Spawn grid is sized from the visual screen height so headless and visual runs match
+HEIGHT = 800
+LANES = 5
+CAR_W, CAR_H = 22, 40
+
+START_Y_M = 0.0
+END_Y_M = 1000.0
+
+SIGN_LIMITS_KMH = [120, 160, 200, 240, 280]
+
+SIM_SPEED = 50.0
+SUB_STEPS = 4
+DT_BASE = 1.0 / 60.0  # simulate at 60fps timestep regardless of wall clock
+DT = (DT_BASE * SIM_SPEED) / SUB_STEPS
+
+# --- Units ---
+# World distance is in METERS.
+# Sign limits are in KM/H.
+def kmh_to_mps(kmh: float) -> float:
+    return kmh * 1000.0 / 3600.0
+
+def mps_to_kmh(x: float) -> float:
+    return x / 1000.0 * 3600.0
+
+
+class Car(CarStats):
+    def __init__(self, lane, position_m, speed_kmh, speed_limit_kmh, sprite=None, lanes=LANES, rng=None):
+        super().__init__(rng)
+        self._place(lane, position_m, speed_kmh, speed_limit_kmh, sprite, lanes, rng)
+
+    def reset(self, lane, position_m, speed_kmh, speed_limit_kmh, sprite=None, lanes=LANES, rng=None):
+        """Reuse this object for a new run: new id, same draws as a new Car, stats cleared."""
+        self._init_state(rng)
+        self._place(lane, position_m, speed_kmh, speed_limit_kmh, sprite, lanes, rng)
+
+    def _place(self, lane, position_m, speed_kmh, speed_limit_kmh, sprite, lanes, rng):
+        rng = rng or random
+        self.set_properties(
+            lane=lane,
+            position=position_m,
+            speed=kmh_to_mps(speed_kmh),
+            speed_limit=kmh_to_mps(speed_limit_kmh),
+            acceleration=6.0 + rng.uniform(-2, 2),     # m/s^2 (tuned for sane feel)
+            deceleration=-9.0 + rng.uniform(-2, 2),   # m/s^2
+            laneCount=lanes,
+            length=CAR_H
+        )
+        self.sprite = sprite
+
+
+class VehiclePool:
+    """
+    Cars kept between runs. spawn_traffic(pool=...) hands the previous run's cars
+    back here and resets them in place instead of building new objects, so a long
+    Monte Carlo loop stops churning through Car instances and their dicts.
+    """
+
+    def __init__(self):
+        self.free = []
+
+    def release(self, car_list):
+        # Reversed so the next run pops them in the same order (player first)
+        self.free.extend(reversed(car_list))
+
+    def acquire(self, car_cls, lane, position_m, speed_kmh, speed_limit_kmh, sprite=None, lanes=LANES, rng=None):
+        if self.free and type(self.free[-1]) is car_cls:
+            c = self.free.pop()
+            c.reset(lane, position_m, speed_kmh, speed_limit_kmh, sprite, lanes, rng)
+            return c
+        return car_cls(lane, position_m, speed_kmh, speed_limit_kmh, sprite=sprite, lanes=lanes, rng=rng)
+
+
+_gc_collected = False
+
+
+@contextmanager
+def quiet_gc(threshold0=100_000):
+    """
+    Keep the cyclic GC out of a tight run loop. The sim makes no reference cycles,
+    so objects that exist now are frozen out of collections and gen-0 collections
+    are made rare; the old settings come back on exit. The garbage from before is
+    collected on the first call in a process only (later calls are per chunk).
+    """
+    global _gc_collected
+    old = gc.get_threshold()
+    if not _gc_collected:
+        gc.collect()
+        _gc_collected = True
+    gc.freeze()
+    gc.set_threshold(threshold0, *old[1:])
+    try:
+        yield
+    finally:
+        gc.set_threshold(*old)
+        gc.unfreeze()
+
+
+class SpeedSign:
+    def __init__(self, position, limit_kmh):
+        self.position = position
+        self.limit_kmh = limit_kmh
+
+
+def build_signs(end_y_m=END_Y_M, sign_cls=SpeedSign, rng=random):
+    """All signs up to the finish line, first one just behind the start."""
+    signs = []
+    next_sign_y = -150.0
+    while next_sign_y < end_y_m:
+        signs.append(sign_cls(next_sign_y, rng.choice(SIGN_LIMITS_KMH)))
+        next_sign_y += rng.uniform(350, 450)
+    return signs
+
+
+def cars_per_run(num_traffic, lanes=LANES):
+    """How many cars spawn_traffic makes: the player plus the traffic that fits the grid."""
+    return min(num_traffic, int(HEIGHT/(CAR_H*2)*lanes)) + 1
+
+
+def spawn_traffic(sheet, start_y_m, player_speed_limit_kmh, count=6, lanes=LANES, car_cls=Car, rng=random,
+                  car_rng=None, pool=None):
+    """
+    Spawn cars ahead of the player, spaced out per lane so they don't overlap.
+    Pass sheet=None for headless runs (cars get no sprite).
+
+    rng draws the slot layout; car_rng(k), if given, returns the generator for car k's
+    own draws (0 = player), so a car keeps its attributes when the layout changes.
+    With a VehiclePool the previous cars are reset in place rather than replaced.
+    """
+    def own_rng(k):
+        return car_rng(k) if car_rng else rng
+
+    # Clear any previous cars
+    if pool is not None:
+        pool.release(cars)
+        car_cls = partial(pool.acquire, car_cls)
+    cars.clear()
+
+    # Create player first and add to cars so traffic logic sees them
+    player_sprite = sheet.get_scaled("lambo", (CAR_W, CAR_H)) if sheet else None
+    player = car_cls(lane=1, position_m=start_y_m, speed_kmh=120.0, speed_limit_kmh=player_speed_limit_kmh, sprite=player_sprite, lanes=lanes, rng=own_rng(0))
+
+    max_count = int(HEIGHT/(CAR_H*2)*lanes)
+    count = min(count, max_count)
+
+    position_function = lambda x: x // lanes * (CAR_H*2)
+    lane_function = lambda x: x % lanes
+    possibilities = [x for x in range(max_count)]
+    rng.shuffle(possibilities)
+    sprite_names = atlas_keys()
+    for k, x in enumerate(possibilities[0:count], start=1):
+        r = own_rng(k)
+        sprite_name = r.choice(sprite_names)
+        traffic_sprite = sheet.get_scaled(sprite_name, (CAR_W, CAR_H)) if sheet else None
+        spd = r.uniform(0.65, 0.9) * player_speed_limit_kmh
+        car_cls(lane=lane_function(x), position_m=position_function(x), speed_kmh=spd, speed_limit_kmh=player_speed_limit_kmh, sprite=traffic_sprite, lanes=lanes, rng=r)
+
+    return player
+
+
+def apply_signs(car, signs):
+    """Set the car's limit from the last sign it has passed (signs sorted by position)."""
+    latest_limit_kmh = None
+    for sign in signs:
+        if sign.position <= car.position:
+            latest_limit_kmh = sign.limit_kmh
+        else:
+            break
+    if latest_limit_kmh is not None:
+        car.speed_limit = kmh_to_mps(latest_limit_kmh)
+
+
+def decision_interval(dt, decision_hz=None):
+    """Ticks between driver decisions at a reaction rate of decision_hz (None = every tick)."""
+    if not decision_hz:
+        return 1
+    return max(1, round(1.0 / (decision_hz * dt)))
+
+
+def step(cars, signs, dt, end_y_m=END_Y_M, decide_every=1, tick=0):
+    """One fixed tick: every car in list order reads signs, decides, moves.
+
+    With decide_every > 1 a car only re-decides every that many ticks and keeps
+    its intent in between; car i decides on ticks where (tick + i) % decide_every
+    == 0, so the scans are spread evenly over the ticks.
+    Returns how many cars haven't finished yet.
+    """
+    live = 0
+    phase = tick % decide_every
+    for c in cars:
+        apply_signs(c, signs)
+
+        if phase == 0:
+            c.decide()
+        phase += 1
+        if phase == decide_every:
+            phase = 0
+        c.integrate(dt)
+        c.position += c.speed * dt
+        if c.position >= end_y_m:
+            c.finished = True
+        elif not c.finished:
+            live += 1
+    return live
+
+
+def run_simulation(sheet=None, num_traffic=6, speed_limit_kmh=120.0, telemetry=None, lanes=LANES, streams=None,
+                   dt=DT, decision_hz=None, pool=None):
+    """Run one full sim headless, return list of (car_id, elapsed_time, finished)
+
+    Pass a telemetry.Telemetry (or anything with record(cars, dt)) to get per-tick car states.
+    A car's clock stops when it crosses END_Y_M; it keeps rolling at its last speed.
+    streams (crn.Streams) gives layout, per-car and sign draws their own generators
+    instead of the `random` module, for common random numbers across scenarios.
+    dt is the integration step; decision_hz, if given, is how often drivers re-decide.
+    pool (VehiclePool) reuses the previous run's car objects.
+    """
+    if streams is None:
+        player = spawn_traffic(sheet, START_Y_M, speed_limit_kmh, count=num_traffic, lanes=lanes, pool=pool)
+        signs = build_signs(END_Y_M)
+    else:
+        player = spawn_traffic(sheet, START_Y_M, speed_limit_kmh, count=num_traffic, lanes=lanes,
+                               rng=streams.layout, car_rng=streams.car, pool=pool)
+        signs = build_signs(END_Y_M, rng=streams.signs)
+    return finish_run(signs, dt=dt, telemetry=telemetry, decide_every=decision_interval(dt, decision_hz))
+
+
+def finish_run(signs, dt=DT, telemetry=None, end_y_m=END_Y_M, decide_every=1, tick=0):
+    """Step the current `cars` until every one has crossed the line (see run_simulation).
+
+    tick is the number of ticks already run, so decision phases carry on after a restore.
+    """
+    if telemetry is not None:
+        telemetry.signs = [(s.position, s.limit_kmh) for s in signs]
+
+    live = len(cars) - sum(c.finished for c in cars)
+    while live:
+        live = step(cars, signs, dt, end_y_m, decide_every, tick)
+        tick += 1
+
+        if telemetry is not None:
+            telemetry.record(cars, dt)
+
+    return [(c.id, c.elapsed_time, c.finished) for c in cars]
+
+
+def run_monte_carlo(sheet=None, num_runs=100, num_traffic=6, speed_limit_kmh=120.0, lanes=LANES, log_dir=None,
+                    seed=None, batch_runs=100, progress=None):
+    """
+    num_runs headless runs. With a seed, run i is seeded with seed + i. With log_dir,
+    finished batches of batch_runs are also appended to a runlog.RunLog there and runs
+    already in it are skipped, so an interrupted call picks up where it stopped.
+    Progress goes to a progress.Progress (by default one on stderr, silent without a TTY).
+    """
+    from progress import Progress, vehicle_ticks
+
+    pool = VehiclePool()
+
+    def run(first_run, n):
+        results = []
+        with quiet_gc():
+            for i in range(first_run, first_run + n):
+                if seed is not None:
+                    random.seed(seed + i)
+                t0 = time.perf_counter()
+                result = run_simulation(sheet, num_traffic=num_traffic, speed_limit_kmh=speed_limit_kmh,
+                                        lanes=lanes, pool=pool)
+                progress.update(1, vehicle_ticks((result,)), time.perf_counter() - t0)
+                results.append(result)
+        return results
+
+    if log_dir is None:
+        if progress is None:
+            progress = Progress(num_runs)
+        with progress:
+            return run(0, num_runs)
+
+    from runlog import RunLog, run_logged, scenario
+
+    log = RunLog(log_dir, scenario(num_traffic, speed_limit_kmh, lanes), seed)
+    seed = log.seed
+    if progress is None:
+        progress = Progress(num_runs, done=min(log.runs_done, num_runs))
+    with progress:
+        return run_logged(log, num_runs, run, batch_runs)
@@ -0,0 +1,221 @@
+# events.py
+"""
+Event-driven variant of engine.run_simulation.
+
+Away from other cars a car's decisions depend only on its own speed and the
+sign it last passed, so its motion is known in closed form: constant
+acceleration / deceleration until it reaches its target speed, then cruise.
+Instead of scanning neighbours every tick, each car sits in a priority queue
+keyed by the tick of its next event (passing a sign, reaching its target
+speed, crossing the finish line) and is jumped straight there.
+
+A conservative bound on speeds gives the number of ticks before any car can
+enter another's stopping-distance envelope. Events are only processed up to
+that horizon; once cars are close, the loop falls back to engine.step() until
+they separate again.
+
+Everything stays on the engine's tick grid, and spawning/signs come from the
+engine's own functions, so with the same seed the finish times match
+engine.run_simulation (up to float rounding at exact threshold crossings).
+"""
+import heapq
+import math
+from bisect import bisect_right
+
+import engine
+from carlogic import Intent
+from carstats import cars
+
+MAX_HORIZON = 4096  # ticks
+MAX_BACKOFF = 16  # stepped ticks between horizon checks while cars interact
+
+_sums = {}  # dt -> [elapsed_time after k CarStats ticks]
+
+
+def _elapsed_after(k, dt):
+    """elapsed_time after k ticks, summed the same way CarStats.integrate does."""
+    sums = _sums.setdefault(dt, [0.0])
+    while len(sums) <= k:
+        sums.append(sums[-1] + dt)
+    return sums[k]
+
+
+class _Bounds:
+    """Speed envelope of one car over the next n ticks, assuming it stays free."""
+
+    def __init__(self, c, dt, min_limit, max_limit):
+        self.c = c
+        self.s = c.speed
+        self.frozen = c.finished  # finished cars just roll at their last speed
+        self.up = c.acceleration * dt
+        self.down = -c.deceleration * dt
+        target = c.speed_limit + c.speed_preference
+        self.cap = max(target, max_limit + c.speed_preference) + self.up
+        self.floor = max(0.0, min(target, min_limit + c.speed_preference) + 1 - self.down)
+        self.k = 1.0 / (-2 * c.deceleration)
+
+    def speeds(self, n):
+        if self.frozen:
+            return self.s, self.s
+        s = self.s
+        return max(s - n * self.down, min(s, self.floor)), min(s + n * self.up, max(s, self.cap))
+
+    def stop(self, v):
+        return v * v * self.k
+
+
+def _pair_safe(bi, bc, n, dt):
+    """True if car bi can't get a car_front flag from bc (same lane) within n ticks."""
+    i, c = bi.c, bc.c
+    lo_i, hi_i = bi.speeds(n)
+    lo_c, hi_c = bc.speeds(n)
+    g = c.position - i.position
+    g_min = g + n * dt * (lo_c - hi_i)
+    g_max = g + n * dt * (hi_c - lo_i)
+    st_lo_i, st_hi_i = bi.stop(lo_i), bi.stop(hi_i)
+    # CarLogic.analyze_traffic: front if stop_i - stop_c < g < length_i + stop_i
+    low_min = st_lo_i - bc.stop(hi_c)
+    high_max = i.length + st_hi_i
+    return g_max <= low_min or g_min >= high_max
+
+
+def safe_horizon(car_list, dt, cap=MAX_HORIZON):
+    """How many ticks every car can be advanced on its own (0 = step normally)."""
+    min_limit = engine.kmh_to_mps(min(engine.SIGN_LIMITS_KMH))
+    max_limit = engine.kmh_to_mps(max(engine.SIGN_LIMITS_KMH))
+    by_lane = {}
+    for c in car_list:
+        by_lane.setdefault(c.lane, []).append(_Bounds(c, dt, min(min_limit, c.speed_limit), max(max_limit, c.speed_limit)))
+    pairs = [(a, b) for group in by_lane.values() for a in group for b in group if a is not b]
+
+    # Cars update one after another within a tick, so check one tick past the jump
+    def safe(n):
+        return all(_pair_safe(a, b, n + 1, dt) for a, b in pairs)
+
+    if not safe(1):
+        return 0
+    lo, hi = 1, 2
+    while hi <= cap and safe(hi):
+        lo, hi = hi, hi * 2
+    hi = min(hi, cap + 1)
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if safe(mid):
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+def _first_reach(x, s, rate, dt, bound, n):
+    """Smallest k in [1, n] with x_k >= bound (x_k after k ticks of constant rate), else n."""
+    def x_at(k):
+        return x + dt * (k * s + rate * k * (k + 1) / 2)
+    if x_at(n) < bound:
+        return n
+    lo, hi = 0, n
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if x_at(mid) >= bound:
+            hi = mid
+        else:
+            lo = mid
+    return hi
+
+
+def _next_segment(c, sign_pos, sign_lim, ticks, dt, end_y_m):
+    """Advance a free car through one constant-intent segment; returns ticks used."""
+    if c.finished:
+        c.position += c.speed * dt * ticks
+        return ticks
+
+    # engine.apply_signs at the start of the tick
+    k = bisect_right(sign_pos, c.position)
+    if k:
+        c.speed_limit = sign_lim[k - 1]
+    next_sign = sign_pos[k] if k < len(sign_pos) else math.inf
+
+    # CarLogic.update with no car in front
+    s = c.speed
+    target = c.speed_limit + c.speed_preference
+    if s - target > 1:
+        intent, rate = Intent.DECELERATE, c.deceleration * dt
+        n = math.ceil((s - target - 1) / -rate)
+    elif s < target:
+        intent, rate = Intent.ACCELERATE, c.acceleration * dt
+        n = math.ceil((target - s) / rate)
+    else:
+        intent, rate = Intent.CRUISE, 0.0
+        n = ticks
+    n = max(1, min(n, ticks))
+
+    if s + n * rate < 0:
+        # Speed clamps at zero inside the segment; take that tick on its own
+        n, new_speed = 1, max(s + rate, 0.0)
+        new_pos = c.position + new_speed * dt
+    else:
+        # The target changes once a sign is passed, and the car stops at the line
+        n = _first_reach(c.position, s, rate, dt, min(next_sign, end_y_m), n)
+        new_speed = s + n * rate
+        new_pos = c.position + dt * (n * s + rate * n * (n + 1) / 2)
+
+    c.intent = intent
+    c.speed = new_speed
+    c.position = new_pos
+    # Same float sum as CarStats ticks, so threshold comparisons agree with engine.py;
+    # elapsed_time always starts at 0.0, and its tick count is far from any rounding edge
+    c.elapsed_time = _elapsed_after(round(c.elapsed_time / dt) + n, dt)
+    first = max(s + rate, 0.0)
+    c.max_speed = max(c.max_speed, first, new_speed)
+    c.min_speed = min(c.min_speed, first, new_speed)
+    if new_pos >= end_y_m:
+        c.finished = True
+    return n
+
+
+def advance_free(car_list, signs, ticks, dt, end_y_m=engine.END_Y_M):
+    """Advance every car `ticks` ticks, event by event, assuming nobody interacts."""
+    sign_pos = [s.position for s in signs]
+    sign_lim = [engine.kmh_to_mps(s.limit_kmh) for s in signs]
+
+    # (tick of the car's next event, list index): each pop jumps one car to its next event
+    queue = [(0, i) for i in range(len(car_list))]
+    while queue:
+        t, i = heapq.heappop(queue)
+        if t >= ticks:
+            continue
+        t += _next_segment(car_list[i], sign_pos, sign_lim, ticks - t, dt, end_y_m)
+        if t < ticks:
+            heapq.heappush(queue, (t, i))
+
+
+def run_event_simulation(sheet=None, num_traffic=6, speed_limit_kmh=120.0, lanes=engine.LANES, stats=None, pool=None):
+    """Same inputs/outputs as engine.run_simulation, jumping between events.
+
+    Pass a dict as `stats` to get counts of stepped vs jumped ticks.
+    """
+    engine.spawn_traffic(sheet, engine.START_Y_M, speed_limit_kmh, count=num_traffic, lanes=lanes, pool=pool)
+    signs = engine.build_signs(engine.END_Y_M)
+    dt = engine.DT
+    stepped = jumped = jumps = 0
+    # In dense traffic the horizon is 0 tick after tick; back off before asking again
+    wait = backoff = 0
+
+    while not all(c.finished for c in cars):
+        n = safe_horizon(cars, dt) if wait == 0 else 0
+        if n == 0:
+            if wait == 0:
+                backoff = min(max(1, backoff * 2), MAX_BACKOFF)
+                wait = backoff
+            wait -= 1
+            engine.step(cars, signs, dt)
+            stepped += 1
+        else:
+            backoff = 0
+            advance_free(cars, signs, n, dt)
+            jumped += n
+            jumps += 1
+
+    if stats is not None:
+        stats.update(stepped_ticks=stepped, jumped_ticks=jumped, jumps=jumps)
+    return [(c.id, c.elapsed_time, c.finished) for c in cars]
@@ -0,0 +1,207 @@
+# framebuffer.py
+"""
+Live car state shared between a simulation process and a renderer.
+
+The simulation process steps the world at a fixed dt as fast as it can (or,
+with realtime, paced to the wall clock) and publishes every tick into one of
+two buffers in a shared memory block; the
+renderer copies out the latest complete one whenever it gets round to drawing.
+Each buffer has a sequence number that is odd while it's being written
+(a seqlock), so the reader never blocks the writer: if the writer laps it
+mid-copy the sequence number changes and the reader just copies again.
+
+Layout (8-byte aligned sections), N = max cars, S = max signs:
+    header      int64[8]   latest buffer, seq[0], seq[1], command, done, signs, cars, -
+    signs       float64[S, 2]  position, limit_kmh (written once before the first frame)
+    buffer x2   float64 tick, time; float64 position[N]; float32 speed[N],
+                stopping distance[N], speed_limit[N]; int8 lane[N], intent[N]; bool finished[N]
+"""
+import multiprocessing
+import random
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import engine
+from carstats import cars
+
+MAX_SIGNS = 256
+SIM_DT = 1.0 / 120.0  # physics step of the simulation process (s)
+
+# header slots
+LATEST, SEQ0, SEQ1, COMMAND, DONE, NUM_SIGNS, NUM_CARS = range(7)
+# commands from the renderer
+WAIT, RUN, QUIT = 0, 1, 2
+
+_FIELDS = (
+    ("position", np.float64),
+    ("speed", np.float32),
+    ("stop", np.float32),
+    ("speed_limit", np.float32),
+    ("lane", np.int8),
+    ("intent", np.int8),
+    ("finished", np.bool_),
+)
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+class FrameBuffer:
+    """Double-buffered per-car state in shared memory: one writer, lock-free readers."""
+
+    def __init__(self, max_cars, max_signs=MAX_SIGNS, name=None):
+        self.max_cars, self.max_signs = max_cars, max_signs
+        sections = [("header", np.int64, (8,)), ("sign_table", np.float64, (max_signs, 2))]
+        for b in (0, 1):
+            sections.append((f"meta{b}", np.float64, (2,)))
+            sections.extend((f"{field}{b}", dtype, (max_cars,)) for field, dtype in _FIELDS)
+        sizes = [_align(int(np.prod(shape)) * np.dtype(dtype).itemsize) for _, dtype, shape in sections]
+
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=sum(sizes))
+        views = {}
+        offset = 0
+        for (key, dtype, shape), size in zip(sections, sizes):
+            views[key] = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+            offset += size
+        self.header = views["header"]
+        self.sign_table = views["sign_table"]
+        self._buffers = [
+            {"meta": views[f"meta{b}"], **{field: views[f"{field}{b}"] for field, _ in _FIELDS}} for b in (0, 1)
+        ]
+        if self.owner:
+            self.header[:] = 0
+        # Reader side: the latest frame is copied into these
+        self.frame = {"meta": np.zeros(2), **{field: np.zeros(max_cars, dtype=dtype) for field, dtype in _FIELDS}}
+
+    @property
+    def spec(self):
+        return self.shm.name, self.max_cars, self.max_signs
+
+    @classmethod
+    def attach(cls, spec):
+        name, max_cars, max_signs = spec
+        return cls(max_cars, max_signs, name=name)
+
+    # --- writer ---
+
+    def set_signs(self, signs):
+        signs = signs[:self.max_signs]
+        for k, s in enumerate(signs):
+            self.sign_table[k] = s.position, s.limit_kmh
+        self.header[NUM_SIGNS] = len(signs)
+
+    def publish(self, car_list, tick, t):
+        h = self.header
+        b = 1 - h[LATEST] if h[SEQ0] or h[SEQ1] else 0
+        buf = self._buffers[b]
+        h[SEQ0 + b] += 1  # odd: being written
+        n = len(car_list)
+        buf["meta"][:] = tick, t
+        for j, c in enumerate(car_list):
+            buf["position"][j] = c.position
+            buf["speed"][j] = c.speed
+            buf["stop"][j] = c.get_stopping_distance()
+            buf["speed_limit"][j] = c.speed_limit
+            buf["lane"][j] = c.lane
+            buf["intent"][j] = c.intent.value
+            buf["finished"][j] = c.finished
+        h[NUM_CARS] = n
+        h[SEQ0 + b] += 1  # even: complete
+        h[LATEST] = b
+
+    # --- reader ---
+
+    def signs(self):
+        return [tuple(row) for row in self.sign_table[:self.header[NUM_SIGNS]].tolist()]
+
+    def read(self, attempts=8):
+        """Copy the latest complete frame into self.frame; False if there isn't one (yet)."""
+        h = self.header
+        for _ in range(attempts):
+            b = int(h[LATEST])
+            seq = int(h[SEQ0 + b])
+            if seq == 0:
+                return False
+            if seq & 1:
+                continue
+            buf = self._buffers[b]
+            for key, arr in buf.items():
+                self.frame[key][:] = arr
+            if int(h[SEQ0 + b]) == seq:
+                return True
+        return False
+
+    @property
+    def num_cars(self):
+        return int(self.header[NUM_CARS])
+
+    # --- control ---
+
+    @property
+    def command(self):
+        return int(self.header[COMMAND])
+
+    @command.setter
+    def command(self, value):
+        self.header[COMMAND] = value
+
+    @property
+    def done(self):
+        return bool(self.header[DONE])
+
+    def close(self):
+        self.header = self.sign_table = self._buffers = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+def run_publisher(spec, num_traffic, speed_limit_kmh, lanes, end_y_m, seed=None, dt=SIM_DT, realtime=False):
+    """Simulation process: spawn, wait for RUN, then step publishing every tick, at full speed
+    or (realtime) no faster than the wall clock."""
+    fb = FrameBuffer.attach(spec)
+    try:
+        if seed is not None:
+            random.seed(seed)
+        player = engine.spawn_traffic(None, engine.START_Y_M, speed_limit_kmh, count=num_traffic, lanes=lanes)
+        player.speed_preference = 0
+        signs = engine.build_signs(end_y_m)
+        fb.set_signs(signs)
+        fb.publish(cars, 0, 0.0)
+
+        while fb.command == WAIT:
+            time.sleep(0.01)
+
+        tick = 0
+        t0 = time.perf_counter()
+        while fb.command == RUN:
+            live = engine.step(cars, signs, dt, end_y_m)
+            tick += 1
+            fb.publish(cars, tick, tick * dt)
+            if player.finished or not live:
+                fb.header[DONE] = 1
+                break
+            if not realtime:
+                continue
+            # Never run ahead of the wall clock; if a tick takes longer, just fall behind
+            ahead = tick * dt - (time.perf_counter() - t0)
+            if ahead > 0:
+                time.sleep(ahead)
+    finally:
+        fb.close()
+
+
+def start_publisher(num_traffic, speed_limit_kmh, lanes=engine.LANES, end_y_m=engine.END_Y_M, seed=None,
+                    realtime=False):
+    """Create the frame buffer and start the simulation process; returns (FrameBuffer, Process)."""
+    fb = FrameBuffer(engine.cars_per_run(num_traffic, lanes))
+    ctx = multiprocessing.get_context("spawn")  # a fresh interpreter, not a fork of the pygame one
+    proc = ctx.Process(target=run_publisher, args=(fb.spec, num_traffic, speed_limit_kmh, lanes, end_y_m, seed),
+                       kwargs={"realtime": realtime}, daemon=True)
+    proc.start()
+    return fb, proc
@@ -0,0 +1,362 @@
+# highway.py
+"""
+Long-highway simulation split into position segments across worker processes.
+
+A long road with tens of thousands of cars is stored as flat numpy arrays (one
+entry per car) and a behaviour kernel (behaviour.py: the CarLogic rules, IDM or
+MOBIL) is applied to all cars at once, with a sorted (lane, position) index so
+each car only looks at cars within reach.
+Unlike engine.step, every car decides from the state at the start of the tick
+(a synchronous update): cars in different segments then don't depend on
+each other's update order, and a segment only needs to know the cars within
+reach of its edges.
+
+run_decomposed() gives each worker one contiguous segment [a, b). Every tick:
+    1. the parent broadcasts the reach (how far the kernel looks, for the furthest-looking car)
+    2. workers swap halos: the cars within reach of each shared edge
+    3. each worker updates its own cars against own + halo cars
+    4. cars that crossed the right edge are handed to the next worker
+    5. workers report live cars and their reach back to the parent
+run_highway() runs the same ticks in one process; both give identical results.
+
+Both can also count overlaps and near misses (conflicts.ConflictCounter, on
+every tick's starting state, reusing the kernel's sorted index) and arbitrate
+lane changes made in the same tick into the same stretch of lane
+(conflicts.arbitrate); split runs then swap the lane changes near each edge
+as well (step 3b), so counts and outcomes still match a single process.
+"""
+import multiprocessing
+import queue
+import traceback
+
+import numpy as np
+
+import spawner
+from behaviour import KERNELS, Neighbours, integrate, visible_view
+from conflicts import ConflictCounter, arbitrate, proposals
+from carlogic import Intent
+from engine import CAR_H, DT, SIGN_LIMITS_KMH, kmh_to_mps
+
+CRUISE = Intent.CRUISE.value
+ACCELERATE = Intent.ACCELERATE.value
+DECELERATE = Intent.DECELERATE.value
+LANE_CHANGE_RIGHT = Intent.LANE_CHANGE_RIGHT.value
+LANE_CHANGE_LEFT = Intent.LANE_CHANGE_LEFT.value
+
+FIELDS = ("id", "position", "speed", "speed_limit", "acceleration", "deceleration", "speed_preference",
+          "length", "lane", "intent", "elapsed_time", "finished")
+
+
+class Highway:
+    """Road length, lanes, signs and the cars as a dict of equal-length arrays (FIELDS)."""
+
+    def __init__(self, cars, sign_position, sign_limit, length_m, lanes):
+        self.cars = cars
+        self.sign_position = sign_position
+        self.sign_limit = sign_limit  # m/s
+        self.length_m = length_m
+        self.lanes = lanes
+
+    @property
+    def num_cars(self):
+        return len(self.cars["id"])
+
+
+def make_highway(length_m=100_000.0, lanes=5, num_cars=20_000, speed_limit_kmh=120.0, seed=None,
+                 density_per_km=None, flow_per_h=None, min_gap_m=spawner.MIN_GAP_M):
+    """
+    Cars placed by spawner.place (num_cars in total, or a density in veh/km/lane, or a
+    flow in veh/h/lane at the initial mean speed), signs as in build_signs.
+    """
+    rng = np.random.default_rng(seed)
+    if flow_per_h is not None:
+        density_per_km = spawner.density_from_flow(flow_per_h, 0.775 * speed_limit_kmh)
+    if density_per_km is not None:
+        position, lane = spawner.place(length_m, lanes, density_per_km=density_per_km, min_gap_m=min_gap_m, rng=rng)
+    else:
+        position, lane = spawner.place(length_m, lanes, count=num_cars, min_gap_m=min_gap_m, rng=rng)
+    num_cars = len(position)
+    cars = {
+        "id": np.arange(num_cars, dtype=np.int64),
+        "position": position,
+        "speed": kmh_to_mps(rng.uniform(0.65, 0.9, num_cars) * speed_limit_kmh),
+        "speed_limit": np.full(num_cars, kmh_to_mps(speed_limit_kmh)),
+        "acceleration": 6.0 + rng.uniform(-2, 2, num_cars),
+        "deceleration": -9.0 + rng.uniform(-2, 2, num_cars),
+        "speed_preference": rng.uniform(-10, 10, num_cars),
+        "length": np.full(num_cars, float(CAR_H)),
+        "lane": lane.astype(np.int64),
+        "intent": np.full(num_cars, CRUISE, dtype=np.int8),
+        "elapsed_time": np.zeros(num_cars),
+        "finished": np.zeros(num_cars, dtype=bool),
+    }
+    gaps = rng.uniform(350, 450, int(length_m // 350) + 2)
+    sign_position = -150.0 + np.concatenate(([0.0], np.cumsum(gaps)))
+    sign_position = sign_position[sign_position < length_m]
+    sign_limit = kmh_to_mps(np.asarray(SIGN_LIMITS_KMH, dtype=float)[rng.integers(0, len(SIGN_LIMITS_KMH), len(sign_position))])
+    return Highway(cars, sign_position, sign_limit, length_m, lanes)
+
+
+def _take(cars, mask):
+    return {k: v[mask] for k, v in cars.items()}
+
+
+def _concat(parts):
+    return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+
+def reach(cars, kernel=KERNELS["reference"]):
+    """Furthest any car looks along the road under kernel, for halo widths."""
+    if not len(cars["id"]):
+        return 0.0
+    return kernel.view(cars)
+
+
+def advance(own, visible, sign_position, sign_limit, lanes, dt, end_m, kernel=KERNELS["reference"], view=np.inf,
+            conflicts=None, resolve=None):
+    """
+    One synchronous tick for the own cars (in place): signs, kernel decisions, integration, move.
+    visible starts with own's cars. conflicts (a ConflictCounter) counts the pairs
+    own cars are the rear car of; resolve(own, change) -> change arbitrates lane changes.
+    """
+    if not len(own["id"]):
+        if resolve is not None:
+            resolve(own, np.zeros(0, np.int64))  # neighbouring segments still wait for our (empty) proposals
+        return
+    # engine.apply_signs
+    passed = np.searchsorted(sign_position, own["position"], "right")
+    has = passed > 0
+    own["speed_limit"][has] = sign_limit[passed[has] - 1]
+
+    nb = Neighbours(own, visible, view)
+    if conflicts is not None:
+        conflicts.observe(nb.key, nb.cars, nb.order < len(own["id"]))
+    acceleration, change = kernel(own, nb, lanes, dt)
+    if resolve is not None:
+        change = resolve(own, change)
+    integrate(own, acceleration, change, dt, end_m)
+
+
+def _arbiter(counter=None, exchange=None):
+    """resolve() for advance: conflicts.arbitrate, with exchange(proposals) -> other segments' proposals."""
+    def resolve(own, change):
+        others = exchange(proposals(own, change)) if exchange is not None else ()
+        change, cancelled = arbitrate(own, change, others)
+        if counter is not None:
+            counter.lane_change_conflicts += int(cancelled.sum())
+        return change
+    return resolve
+
+
+def _results(cars):
+    order = np.argsort(cars["id"])
+    return cars["id"][order], cars["elapsed_time"][order], cars["finished"][order]
+
+
+def run_highway(hw, dt=DT, max_ticks=None, macro=None, kernel="reference", conflicts=None, arbitrate=False):
+    """
+    Single-process reference: (ids, elapsed_time, finished) sorted by id, and ticks run.
+    macro (a macro.MacroRecorder) gets every tick's states and is closed at the end.
+    kernel names the driver behaviour (behaviour.KERNELS). conflicts (a ConflictCounter)
+    counts overlaps and near misses; arbitrate resolves conflicting lane changes.
+    """
+    kernel = KERNELS[kernel]
+    resolve = _arbiter(conflicts) if arbitrate else None
+    cars = {k: v.copy() for k, v in hw.cars.items()}
+    ticks = 0
+    while not cars["finished"].all() and (max_ticks is None or ticks < max_ticks):
+        advance(cars, visible_view(cars), hw.sign_position, hw.sign_limit, hw.lanes, dt, hw.length_m, kernel,
+                reach(cars, kernel), conflicts, resolve)
+        ticks += 1
+        if macro is not None:
+            macro.observe(cars["position"], cars["lane"], cars["speed"], dt)
+    if macro is not None:
+        macro.close()
+    return _results(cars), ticks
+
+
+# --- domain decomposition ---
+
+_RUN, _STOP = 0, 1
+_FAILED = "failed"  # report (k, _FAILED, traceback, None): the worker raised
+_POLL_S = 1.0       # how often the parent checks that workers are still alive while it waits
+
+
+def _segment_worker(k, lo, hi, cars, hw_static, dt, control, report, *links, **options):
+    """Process entry point: _segment_loop, with an exception reported to the parent instead of lost."""
+    try:
+        _segment_loop(k, lo, hi, cars, hw_static, dt, control, report, *links, **options)
+    except Exception:
+        report.put((k, _FAILED, traceback.format_exc(), None))
+
+
+def _get_report(report, procs):
+    """Next worker report; RuntimeError if a worker raised or died (so the parent never waits forever)."""
+    while True:
+        try:
+            msg = report.get(timeout=_POLL_S)
+        except queue.Empty:
+            dead = [(k, p.exitcode) for k, p in enumerate(procs) if p.exitcode not in (None, 0)]
+            if dead:
+                raise RuntimeError(f"segment worker died: (segment, exit code) {dead}")
+            continue
+        if isinstance(msg[1], str) and msg[1] == _FAILED:
+            raise RuntimeError(f"segment worker {msg[0]} failed:\n{msg[2]}")
+        return msg
+
+
+def _segment_loop(k, lo, hi, cars, hw_static, dt, control, report, from_left, from_right, to_left, to_right,
+                  macro_spec=None, checks=(False, False)):
+    sign_position, sign_limit, lanes, end_m, kernel = hw_static
+    kernel = KERNELS[kernel]
+    count, arbitrated = checks
+    counter = ConflictCounter(end_m=end_m) if count else None
+    r = 0.0
+
+    def exchange(props):
+        """3b. swap the lane changes within reach of each shared edge."""
+        pos = props["position"]
+        if to_left is not None:
+            to_left.put(_take(props, pos < lo + r))
+        if to_right is not None:
+            to_right.put(_take(props, pos >= hi - r))
+        return [q.get() for q in (from_left, from_right) if q is not None]
+
+    resolve = _arbiter(counter, exchange) if arbitrated else None
+    if macro_spec is not None:
+        from macro import FlowGrid
+
+        section_m, window_ticks, sample_every = macro_spec
+        grid = FlowGrid(end_m, lanes, section_m)
+    tick = 0
+    while True:
+        cmd, r = control.get()
+        if cmd == _STOP:
+            report.put((k, cars, grid.take() if macro_spec is not None else None,
+                        counter.stats() if counter is not None else None))
+            return
+
+        # Halo exchange: the cars within reach of each shared edge
+        pos = cars["position"]
+        if to_left is not None:
+            to_left.put(visible_view(_take(cars, pos < lo + r)))
+        if to_right is not None:
+            to_right.put(visible_view(_take(cars, pos >= hi - r)))
+        views = [visible_view(cars)] + [q.get() for q in (from_left, from_right) if q is not None]
+        visible = _concat(views) if len(views) > 1 else views[0]
+
+        advance(cars, visible, sign_position, sign_limit, lanes, dt, end_m, kernel, r, counter, resolve)
+
+        # Hand-off: cars only move forward, so only to the right (with their conflict pairs)
+        if to_right is not None:
+            out = cars["position"] >= hi
+            to_right.put((_take(cars, out), counter.carry(cars["id"][out]) if counter is not None else None))
+            cars = _take(cars, ~out)
+        if from_left is not None:
+            incoming, carried = from_left.get()
+            cars = _concat([cars, incoming])
+            if counter is not None:
+                counter.adopt(carried)
+
+        # Macroscopic bins: this segment's share of the window, summed by the parent
+        tick += 1
+        window = None
+        if macro_spec is not None:
+            if tick % sample_every == 0:
+                grid.add(cars["position"], cars["lane"], cars["speed"], dt * sample_every)
+            if tick % window_ticks == 0:
+                window = grid.take()
+        report.put((k, int((~cars["finished"]).sum()), reach(cars, kernel), window))
+
+
+def _merge_windows(parts):
+    return tuple(sum(p[i] for p in parts) for i in range(3))
+
+
+def run_decomposed(hw, segments=4, dt=DT, max_ticks=None, macro=None, kernel="reference", conflicts=None,
+                   arbitrate=False):
+    """
+    run_highway split over `segments` worker processes; same (results, ticks), and the
+    same counts added to conflicts.
+    Halos only come from the neighbouring segments, so the kernel's reach has to stay
+    under the segment length (ValueError otherwise). A worker that raises or dies
+    makes it raise RuntimeError (the other workers are terminated).
+    With macro, each worker bins its own cars and the parent adds up the segments'
+    grids per window (equal to run_highway's up to float summation order).
+    """
+    edges = np.linspace(0.0, hw.length_m, segments + 1)
+    edges[0], edges[-1] = -np.inf, np.inf  # the last segment keeps finished cars rolling past the line
+    hw_static = (hw.sign_position, hw.sign_limit, hw.lanes, hw.length_m, kernel)
+    width = hw.length_m / segments
+    macro_spec = None
+    if macro is not None:
+        macro_spec = (macro.grid.section_m, macro.configure(dt), macro.sample_every)
+
+    ctx = multiprocessing.get_context()
+    report = ctx.Queue()
+    controls = [ctx.Queue() for _ in range(segments)]
+    rightward = [ctx.Queue() for _ in range(segments - 1)]  # k -> k + 1
+    leftward = [ctx.Queue() for _ in range(segments - 1)]   # k + 1 -> k
+    procs = []
+    for k in range(segments):
+        lo, hi = edges[k], edges[k + 1]
+        own = _take(hw.cars, (hw.cars["position"] >= lo) & (hw.cars["position"] < hi))
+        procs.append(ctx.Process(target=_segment_worker, daemon=True, args=(
+            k, lo, hi, own, hw_static, dt, controls[k], report,
+            rightward[k - 1] if k > 0 else None,         # from_left
+            leftward[k] if k < segments - 1 else None,   # from_right
+            leftward[k - 1] if k > 0 else None,          # to_left
+            rightward[k] if k < segments - 1 else None,  # to_right
+            macro_spec, (conflicts is not None, arbitrate),
+        )))
+
+    def check_reach(r):
+        if segments > 1 and r >= width:
+            raise ValueError(f"{kernel} looks {r:.0f} m ahead, more than a {width:.0f} m segment: "
+                             "use fewer segments")
+
+    r = reach(hw.cars, KERNELS[kernel])
+    check_reach(r)
+    for p in procs:
+        p.start()
+
+    finished = False
+    try:
+        live = int((~hw.cars["finished"]).sum())
+        ticks = 0
+        while live and (max_ticks is None or ticks < max_ticks):
+            check_reach(r)
+            for q in controls:
+                q.put((_RUN, r))
+            live, r = 0, 0.0
+            windows = []
+            for _ in range(segments):
+                _, n, seg_reach, window = _get_report(report, procs)
+                live += n
+                r = max(r, seg_reach)
+                if window is not None:
+                    windows.append(window)
+            ticks += 1
+            if windows:
+                macro.emit(*_merge_windows(windows), macro.window_ticks)
+
+        for q in controls:
+            q.put((_STOP, None))
+        parts = sorted((_get_report(report, procs) for _ in range(segments)), key=lambda kc: kc[0])
+        if macro is not None:
+            if ticks % macro.window_ticks:
+                macro.emit(*_merge_windows([window for _, _, window, _ in parts]), ticks % macro.window_ticks)
+            macro.sink.flush()
+        if conflicts is not None:
+            for *_, stats in parts:
+                conflicts.merge(stats)
+        finished = True
+        return _results(_concat([cars for _, cars, _, _ in parts])), ticks
+    finally:
+        # After an error the others are blocked on a queue that nobody will feed: don't wait for them
+        for p in procs:
+            if finished:
+                p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+                p.join()
@@ -0,0 +1,223 @@
+# macro.py
+"""
+Macroscopic flow / density / speed per (lane, road section, time window).
+
+Every sampled tick, the car states are binned into lane x section cells with
+np.bincount, adding up per cell the vehicle-time spent there (count x dt) and
+the distance travelled (speed x dt). When a time window closes its cells are
+turned into fundamental-diagram values with Edie's definitions over the
+window's space-time area A = window length x section length:
+
+    density  k = total time spent / A       (veh/km)
+    flow     q = total distance travelled / A  (veh/h)
+    speed    v = q / k                         (km/h, space-mean)
+
+and handed to a sink as one row per cell, so only the current window's
+lanes x sections accumulators are ever held, never trajectories.
+
+    rec = MacroRecorder(open_sink("macro.csv"), section_m=100, window_s=5)
+    engine.run_simulation(None, telemetry=rec); rec.close()
+"""
+import csv
+import json
+import math
+import sys
+
+import numpy as np
+
+from engine import END_Y_M, LANES
+
+class FlowGrid:
+    """Per-cell vehicle-time, distance and sample counts for one window."""
+
+    def __init__(self, length_m, lanes, section_m):
+        self.length_m, self.lanes, self.section_m = length_m, lanes, section_m
+        self.sections = max(1, math.ceil(length_m / section_m))
+        n = lanes * self.sections
+        self.time = np.zeros(n)
+        self.distance = np.zeros(n)
+        self.samples = np.zeros(n, dtype=np.int64)
+
+    def add(self, position, lane, speed, dt):
+        inside = (position >= 0) & (position < self.length_m) & (lane >= 0) & (lane < self.lanes)
+        if not inside.all():
+            position, lane, speed = position[inside], lane[inside], speed[inside]
+        cell = lane.astype(np.int64) * self.sections + (position // self.section_m).astype(np.int64)
+        n = len(self.time)
+        counts = np.bincount(cell, minlength=n)
+        self.samples += counts
+        self.time += counts * dt
+        self.distance += np.bincount(cell, weights=speed, minlength=n) * dt
+
+    def take(self):
+        """(time, distance, samples) so far, and start over."""
+        out = self.time, self.distance, self.samples
+        self.time, self.distance, self.samples = np.zeros_like(self.time), np.zeros_like(self.distance), \
+            np.zeros_like(self.samples)
+        return out
+
+
+class MacroRecorder:
+    """
+    Bins car states into windows of window_s seconds and sections of section_m metres
+    on [0, length_m) and writes each finished window to sink. Works as a
+    run_simulation telemetry recorder (record(cars, dt)) or with arrays (observe());
+    sample_every > 1 samples every k-th tick with k x dt weight. close() flushes the
+    last, possibly shorter, window.
+    """
+
+    def __init__(self, sink, length_m=END_Y_M, lanes=LANES, section_m=100.0, window_s=5.0, sample_every=1, run=0):
+        self.sink = sink
+        self.grid = FlowGrid(length_m, lanes, section_m)
+        self.window_s = window_s
+        self.sample_every = sample_every
+        self.run = run
+        self.signs = None  # filled in by engine.finish_run
+        self.window = 0
+        self.window_ticks = None
+        self._tick = 0
+        self._window_tick = 0
+        self._dt = None
+        self._buf = None
+
+    def record(self, car_list, dt):
+        if self._due():
+            n = len(car_list)
+            if self._buf is None or len(self._buf[0]) != n:
+                self._buf = (np.empty(n), np.empty(n, dtype=np.int64), np.empty(n))
+            pos, lane, spd = self._buf
+            for j, c in enumerate(car_list):
+                pos[j] = c.position
+                lane[j] = c.lane
+                spd[j] = c.speed
+            self.grid.add(pos, lane, spd, dt * self.sample_every)
+        self._advance(dt)
+
+    def observe(self, position, lane, speed, dt):
+        """One tick of car states as arrays."""
+        if self._due():
+            self.grid.add(position, lane, speed, dt * self.sample_every)
+        self._advance(dt)
+
+    def _due(self):
+        self._tick += 1
+        return self._tick % self.sample_every == 0
+
+    def configure(self, dt):
+        """Fix the tick length (done by the first record/observe); returns ticks per window."""
+        if self.window_ticks is None:
+            self._dt = dt
+            self.window_ticks = max(1, round(self.window_s / dt))
+        return self.window_ticks
+
+    def _advance(self, dt):
+        self.configure(dt)
+        self._window_tick += 1
+        if self._window_tick == self.window_ticks:
+            self.emit(*self.grid.take(), self._window_tick)
+
+    def emit(self, time, distance, samples, ticks):
+        """Write one window's cells and start the next; callers merging FlowGrid.take()
+        results from several processes call this directly (after configure())."""
+        t0 = self.window * self.window_ticks * self._dt
+        span_h = ticks * self._dt / 3600.0
+        g = self.grid
+        x0 = np.tile(np.arange(g.sections) * g.section_m, g.lanes)
+        x1 = np.minimum(x0 + g.section_m, g.length_m)
+        area = span_h * (x1 - x0) / 1000.0  # h x km
+        time_h = time / 3600.0
+        distance_km = distance / 1000.0
+        density = time_h / area
+        flow = distance_km / area
+        with np.errstate(invalid="ignore", divide="ignore"):
+            speed = np.where(time_h > 0, distance_km / time_h, np.nan)
+        self.sink.write({
+            "run": np.full(len(time), self.run),
+            "window": np.full(len(time), self.window),
+            "t0": np.full(len(time), t0),
+            "t1": np.full(len(time), t0 + ticks * self._dt),
+            "lane": np.repeat(np.arange(g.lanes), g.sections),
+            "section": np.tile(np.arange(g.sections), g.lanes),
+            "x0": x0, "x1": x1,
+            "flow_veh_h": flow, "density_veh_km": density, "speed_kmh": speed, "samples": samples,
+        })
+        self.window += 1
+        self._window_tick = 0
+
+    def close(self):
+        """Write the last, possibly shorter, window."""
+        if self._window_tick:
+            self.emit(*self.grid.take(), self._window_tick)
+        self.sink.flush()
+
+
+# --- sinks: one call per window with a dict of equal-length columns ---
+
+class JsonLinesSink:
+    """One JSON object per cell per line (NaN speeds as null)."""
+
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, columns):
+        names = list(columns)
+        for row in zip(*(columns[k].tolist() for k in names)):
+            self.f.write(json.dumps({k: (None if isinstance(v, float) and v != v else v) for k, v in zip(names, row)}))
+            self.f.write("\n")
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        if self.f is not sys.stdout:
+            self.f.close()
+
+
+class CsvSink:
+    """Columnar text: a header line, then one line per cell."""
+
+    def __init__(self, f):
+        self.writer = csv.writer(f)
+        self.f = f
+        self.header = False
+
+    def write(self, columns):
+        if not self.header:
+            self.writer.writerow(columns)
+            self.header = True
+        self.writer.writerows(zip(*(columns[k].tolist() for k in columns)))
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        if self.f is not sys.stdout:
+            self.f.close()
+
+
+class ColumnSink:
+    """Keeps every window in memory; columns() concatenates them (for calibration and tests)."""
+
+    def __init__(self):
+        self._parts = {}
+
+    def write(self, columns):
+        for k, v in columns.items():
+            self._parts.setdefault(k, []).append(v)
+
+    def columns(self):
+        return {k: np.concatenate(v) for k, v in self._parts.items()}
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def open_sink(path):
+    """CsvSink for *.csv, else JsonLinesSink; '-' writes JSON lines to stdout."""
+    if path in (None, "-"):
+        return JsonLinesSink(sys.stdout)
+    f = open(path, "w", encoding="utf-8", newline="")
+    return CsvSink(f) if path.endswith(".csv") else JsonLinesSink(f)
@@ -3,14 +3,17 @@ import pygame
 import random
 import sys
 from sheets import SpriteSheet
-from sheets import ATLAS_KEYS
-from carstats import CarStats, cars
-
-WIDTH, HEIGHT = 1400, 800
+from carstats import cars
+import engine
+from engine import kmh_to_mps, mps_to_kmh, CAR_W, CAR_H, HEIGHT
+# Headless API, re-exported for existing callers
+from engine import run_simulation, run_monte_carlo
+from analysis import summarize_results, analyze_results
+
+WIDTH = 1400
 FPS = 60
 
 SIM_SPEED = 1
-all_run_results = []
 
 SPEEDO_CENTER = (80, 680)  # left side, near bottom
 SPEEDO_RADIUS = 60
@@ -26,8 +29,6 @@ GRASS_COLOR = (40, 120, 40)
 ROAD_COLOR = (30, 30, 30)
 LINE_COLOR = (235, 235, 235)
 
-CAR_W, CAR_H = 22, 40
-
 def speed_to_angle(speed, max_speed=300):
     angle = 225 - (speed / max_speed) * 270
     return math.radians(angle)
@@ -74,45 +75,25 @@ def draw_speedometer(surface, speed_kmh, center, radius, max_speed, font):
     spd_text = font.render(f"{int(speed_kmh)}", True, (255, 255, 255))
     surface.blit(spd_text, spd_text.get_rect(center=(center[0], center[1] + 16)))
 
-# --- Units ---
-# World distance is in METERS.
-# Sign limits are in KM/H.
-def kmh_to_mps(kmh: float) -> float:
-    return kmh * 1000.0 / 3600.0
-
-def mps_to_kmh(x: float) -> float:
-    return x / 1000.0 * 3600.0
-
-class Car(CarStats):
-    def __init__(self, lane, position_m, speed_kmh, speed_limit_kmh, sprite):
-        super().__init__()
-        self.set_properties(
-            lane=lane,
-            position=position_m,
-            speed=kmh_to_mps(speed_kmh),
-            speed_limit=kmh_to_mps(speed_limit_kmh),
-            acceleration=6.0 + random.uniform(-2, 2),     # m/s^2 (tuned for sane feel)
-            deceleration=-9.0 + random.uniform(-2, 2),   # m/s^2
-            laneCount=LANES,
-            length=CAR_H
-        )
-        self.sprite = sprite
+def lane_x(lane):
+    lane_center = ROAD_LEFT + lane * LANE_W + LANE_W // 2
+    return lane_center - CAR_W // 2
 
+def draw_car(screen, sprite, lane, position, speed, stopping_distance, camera_y_m):
+    x = lane_x(lane)
+    screen_y = HEIGHT - (position - camera_y_m)
+    screen.blit(sprite, (x, screen_y))
+    pygame.draw.rect(screen, (255, 0, 0), (x, screen_y - stopping_distance, CAR_W//2, stopping_distance))
+    pygame.draw.rect(screen, (0, 255, 0), (x+CAR_W//2, screen_y - speed, 10, speed))
+
+class Car(engine.Car):
     def x(self):
-        lane_center = ROAD_LEFT + self.lane * LANE_W + LANE_W // 2
-        return lane_center - CAR_W // 2
+        return lane_x(self.lane)
 
     def draw(self, screen, camera_y_m):
-        screen_y = HEIGHT - (self.position - camera_y_m)
-        screen.blit(self.sprite, (self.x(), screen_y))
-        pygame.draw.rect(screen, (255, 0, 0), (self.x(), screen_y - self.get_stopping_distance(), CAR_W//2, self.get_stopping_distance()))
-        pygame.draw.rect(screen, (0, 255, 0), (self.x()+CAR_W//2, screen_y - self.speed, 10, self.speed))
-
-class SpeedSign:
-    def __init__(self, position, limit_kmh):
-        self.position = position
-        self.limit_kmh = limit_kmh
+        draw_car(screen, self.sprite, self.lane, self.position, self.speed, self.get_stopping_distance(), camera_y_m)
 
+class SpeedSign(engine.SpeedSign):
     def draw(self, screen, camera_y_m, font):
         screen_y = HEIGHT - (self.position - camera_y_m) - 34
         x = ROAD_RIGHT + 10
@@ -148,51 +129,21 @@ def draw_world(screen, signs, camera_y_m, font):
     for s in signs:
         s.draw(screen, camera_y_m, font)
 
-def spawn_traffic(sheet, start_y_m, player_speed_limit_kmh, count=6):
-    """
-    Spawn cars ahead of the player, spaced out per lane so they don't overlap.
-    """
-    # Clear any previous cars
-    cars.clear()
-
-    # Create player first and add to cars so traffic logic sees them
-    player_sprite = sheet.get_scaled("lambo", (CAR_W, CAR_H))
-    player = Car(lane=1, position_m=start_y_m, speed_kmh=120.0, speed_limit_kmh=player_speed_limit_kmh, sprite=player_sprite)
-
-    max_count = HEIGHT/(CAR_H*2)*LANES
-    count = min(count, max_count)
-
-    position_function = lambda x: x // LANES * (CAR_H*2)
-    lane_function = lambda x: x % LANES
-    possibilities = [x for x in range(int(max_count))]
-    random.shuffle(possibilities)
-    for x in possibilities[0:count]:
-        sprite_name = random.choice(ATLAS_KEYS)
-        traffic_sprite = sheet.get_scaled(sprite_name, (CAR_W, CAR_H))
-        spd = random.uniform(0.65, 0.9) * player_speed_limit_kmh
-        Car(lane=lane_function(x), position_m=position_function(x), speed_kmh=spd, speed_limit_kmh=player_speed_limit_kmh, sprite=traffic_sprite)
-
-
-    '''# Track last placed position per lane to avoid overlaps
-    last_pos_by_lane = [start_y_m + 80.0 for _ in range(LANES)]
-    min_gap = CAR_H + 35.0  # meters (tuned spacing)
-
-    for _ in range(count):
-        lane = random.randint(0, LANES - 1)
-
-        # place this car ahead of the last one in that lane
-        lane_base = last_pos_by_lane[lane]
-        pos = lane_base + random.uniform(min_gap, min_gap + 160.0)
-        last_pos_by_lane[lane] = pos
-
-        
-
-        # Start traffic at some reasonable speed (near limit, with a little variation)
-        
-    '''
-    return player
-
-def main():
+def spawn_traffic(sheet, start_y_m, player_speed_limit_kmh, count=6, lanes=None):
+    """engine.spawn_traffic with drawable cars (lanes defaults to the current road)."""
+    return engine.spawn_traffic(sheet, start_y_m, player_speed_limit_kmh, count=count,
+                                lanes=LANES if lanes is None else lanes, car_cls=Car)
+
+def set_lanes(lanes):
+    """Resize the road for a different lane count (visual mode reads these globals)."""
+    global LANES, ROAD_WIDTH, ROAD_LEFT, ROAD_RIGHT, LANE_W
+    LANES = lanes
+    ROAD_WIDTH = LANES * 120
+    ROAD_LEFT = (WIDTH - ROAD_WIDTH) // 2
+    ROAD_RIGHT = ROAD_LEFT + ROAD_WIDTH
+    LANE_W = ROAD_WIDTH // LANES
+
+def main(num_cars=20, speed_limit=120.0):
     pygame.init()
     screen = pygame.display.set_mode((WIDTH, HEIGHT))
     clock = pygame.time.Clock()
@@ -207,7 +158,7 @@ def main():
     finished = False
 
     # Build player + traffic (player returned; all cars stored in global cars list)
-    player_car = spawn_traffic(sheet, START_Y_M, player_speed_limit_kmh=120.0, count=20)
+    player_car = spawn_traffic(sheet, START_Y_M, player_speed_limit_kmh=speed_limit, count=num_cars, lanes=LANES)
     player_car.speed_preference = 0
 
     # Camera in meters
@@ -306,109 +257,188 @@ def main():
     pygame.quit()
     sys.exit()
 
-def run_simulation(sheet, num_traffic=6, speed_limit_kmh=120.0):
-    """Run one full sim headless, return list of (car_id, elapsed_time, finished)"""
+def live(num_cars=20, speed_limit=120.0, seed=None, realtime=False):
+    """
+    Visual mode with the simulation in its own process (framebuffer.py). Physics
+    runs at a fixed step there, at full speed (or in real time, with realtime);
+    this loop only draws the latest frame it published, so a slow display drops
+    frames instead of slowing the sim.
+    """
+    from framebuffer import RUN, QUIT, WAIT, start_publisher
+    from sheets import atlas_keys
+
     START_Y_M = 0.0
-    END_Y_M = 1000.0
-    
-    player = spawn_traffic(sheet, START_Y_M, speed_limit_kmh, count=num_traffic)
-    
-    # Build signs once
-    signs = []
-    next_sign_y = -150.0
-    while next_sign_y < END_Y_M:
-        signs.append(SpeedSign(next_sign_y, random.choice([120, 160, 200, 240, 280])))
-        next_sign_y += random.uniform(350, 450)
+    END_Y_M = START_Y_M + 10000.0
+    fb, proc = start_publisher(num_cars, speed_limit, lanes=LANES, end_y_m=END_Y_M, seed=seed, realtime=realtime)
+    try:
+        pygame.init()
+        screen = pygame.display.set_mode((WIDTH, HEIGHT))
+        clock = pygame.time.Clock()
+        font = pygame.font.SysFont(None, 20)
+        sheet = SpriteSheet("cars.png")
+        names = atlas_keys()
+        sprites = [sheet.get_scaled("lambo" if j == 0 else names[j % len(names)], (CAR_W, CAR_H))
+                   for j in range(fb.max_cars)]
+        start_button = Button((10, 40, 110, 32), "START")
+        signs = None
+        frame = fb.frame
+        drawn_tick = 0
+        draw_rate = 0.0
+
+        running = True
+        while running:
+            clock.tick(FPS)
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+                if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                    if start_button.hit(event.pos) and fb.command == WAIT:
+                        fb.command = RUN
+
+            if not fb.read():
+                continue  # the simulation process hasn't published yet
+            if signs is None:
+                signs = [SpeedSign(pos, int(limit)) for pos, limit in fb.signs()]
+
+            n = fb.num_cars
+            tick, sim_t = frame["meta"]
+            # Sim ticks between two drawn frames, smoothed: how far the sim outruns the display
+            draw_rate = 0.9 * draw_rate + 0.1 * (tick - drawn_tick)
+            drawn_tick = tick
+            positions = frame["position"]
+            camera_y_m = min(positions[0] - 120.0, END_Y_M - HEIGHT / 2)
+
+            draw_world(screen, signs, camera_y_m, font)
+            start_screen_y = HEIGHT - (START_Y_M - camera_y_m)
+            end_screen_y = HEIGHT - (END_Y_M - camera_y_m)
+            pygame.draw.line(screen, (0, 200, 255), (ROAD_LEFT, start_screen_y), (ROAD_RIGHT, start_screen_y), 3)
+            pygame.draw.line(screen, (255, 80, 80), (ROAD_LEFT, end_screen_y), (ROAD_RIGHT, end_screen_y), 3)
+
+            speed_kmh = mps_to_kmh(frame["speed"][0])
+            limit_kmh = mps_to_kmh(frame["speed_limit"][0])
+            info1 = font.render(f"Speed: {int(speed_kmh)} km/h   Limit: {int(limit_kmh)}", True, (255, 255, 255))
+            info2 = font.render(f"Distance: {max(0.0, positions[0] - START_Y_M):.1f} m / {END_Y_M - START_Y_M:.1f} m   "
+                                f"sim t = {sim_t:.1f}s, {draw_rate:.1f} ticks/frame", True, (255, 255, 255))
+            screen.blit(info1, (10, 10))
+            screen.blit(info2, (10, 25))
+            if fb.done:
+                msg = font.render("FINISHED", True, (255, 255, 255))
+                screen.blit(msg, (WIDTH // 2 - msg.get_width() // 2, 80))
+            start_button.draw(screen, font, enabled=fb.command == WAIT)
+
+            for j in range(n):
+                draw_car(screen, sprites[j], int(frame["lane"][j]), positions[j], float(frame["speed"][j]),
+                         float(frame["stop"][j]), camera_y_m)
+
+            draw_speedometer(screen, speed_kmh, (110, 680), 90, 300, font)
+            label = font.render("Player Speed", True, (255, 255, 255))
+            screen.blit(label, (110 - label.get_width() // 2, 540))
+            pygame.display.flip()
+    finally:
+        fb.command = QUIT
+        proc.join(timeout=2)
+        fb.close()
+        fb.unlink()
+        pygame.quit()
+
+def playback(path):
+    """
+    Watch a recorded run (replay.py). The file is memory-mapped, so jumping
+    anywhere on the timeline only decodes that one frame.
 
-    SIM_SPEED = 50.0
-    SUB_STEPS = 4
-    dt_base = 1.0 / 60.0  # simulate at 60fps timestep regardless of wall clock
-    dt = (dt_base * SIM_SPEED) / SUB_STEPS
+    SPACE pause, LEFT/RIGHT -/+1 s, UP/DOWN faster/slower, click or drag the bar to scrub.
+    """
+    from replay import Replay
+    from sheets import atlas_keys
 
-    while any(c.position < 1000 for c in cars):
-        for c in cars:
-            # apply signs
-            latest_limit_kmh = None
-            for sign in signs:
-                if sign.position <= c.position:
-                    latest_limit_kmh = sign.limit_kmh
-                #else:
-                #    break
-            if latest_limit_kmh is not None:
-                c.speedLimit = kmh_to_mps(latest_limit_kmh)
-
-            c.update(dt)
-            c.position += c.speed * dt
-
-    return [(c.id, c.elapsed_time, c.position >= 1000) for c in cars]
-
-
-def run_monte_carlo(sheet, num_runs=100):
-    all_run_results = []
-    
-    for i in range(num_runs):
-        results = run_simulation(sheet)
-        all_run_results.append(results)
-        print(f"Run {i+1}/{num_runs} done")
-    
-    return all_run_results
-
-
-def analyze_results(all_run_results, time_threshold=25.0):
-    import matplotlib.pyplot as plt
-    from collections import defaultdict
-    times_by_car = defaultdict(list)
-    
-    for run in all_run_results:
-        for car_id, elapsed, finished in run:
-            if finished:
-                times_by_car[car_id].append(elapsed)
-    
-    # Flatten all times across all cars for the histogram
-    all_times = [t for times in times_by_car.values() for t in times]
-    total_entries = len(all_times)
-    under_threshold = sum(1 for t in all_times if t < time_threshold)
-    prob_under = under_threshold / total_entries * 100 if total_entries > 0 else 0
-
-    print(f"\n==== MONTE CARLO RESULTS ({len(all_run_results)} runs) ====")
-    for car_id, times in sorted(times_by_car.items()):
-        avg = sum(times) / len(times)
-        pct_under = sum(1 for t in times if t < time_threshold) / len(times) * 100
-        runs_str = "  |  ".join(f"run{i+1}: {t:.2f}s" for i, t in enumerate(times))
-        print(f"Car #{car_id}: avg={avg:.2f}s  % under {time_threshold}s: {pct_under:.1f}%  [{runs_str}]")
-
-    print(f"\nProbability of finishing under {time_threshold}s: {prob_under:.1f}%")
-
-    # Histogram — floor each time to nearest second for bucketing
-    import math
-    bucketed = [math.floor(t) for t in all_times]
-    counts = defaultdict(int)
-    for b in bucketed:
-        counts[b] += 1
-
-    seconds = sorted(counts.keys())
-    freqs = [counts[s] for s in seconds]
-
-    plt.figure(figsize=(10, 5))
-    bars = plt.bar(seconds, freqs, color=["red" if s >= time_threshold else "steelblue" for s in seconds], edgecolor="black", width=0.8)
-    plt.axvline(x=time_threshold, color="red", linestyle="--", linewidth=1.5, label=f"Threshold: {time_threshold}s")
-    plt.xlabel("Finish Time (s)")
-    plt.ylabel("Count")
-    plt.title(f"Finish Time Distribution ({len(all_run_results)} runs, {len(all_times)} total finishes)")
-    plt.legend()
-    plt.xticks(seconds)
-    plt.tight_layout()
-    plt.show()
+    rec = Replay(path)
+    if rec.num_frames == 0:
+        raise ValueError(f"{path} has no frames")
+
+    pygame.init()
+    lanes = int(rec.lanes.max()) + 1
+    if lanes > LANES:
+        set_lanes(lanes)
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption(f"Replay: {path}")
+    clock = pygame.time.Clock()
+    font = pygame.font.SysFont(None, 20)
+    sheet = SpriteSheet("cars.png")
+
+    names = atlas_keys()
+    sprites = [sheet.get_scaled("lambo" if i == 0 else names[int(cid) % len(names)], (CAR_W, CAR_H))
+               for i, cid in enumerate(rec.car_ids)]
+    signs = [SpeedSign(pos, int(limit)) for pos, limit in rec.signs]
+    end_y_m = rec.end_position
+
+    bar = pygame.Rect(ROAD_LEFT, HEIGHT - 24, ROAD_WIDTH, 12)
+    t = 0.0
+    rate = 1.0
+    paused = False
+    dragging = False
+
+    running = True
+    while running:
+        dt = clock.tick(FPS) / 1000.0
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    paused = not paused
+                elif event.key == pygame.K_LEFT:
+                    t -= 1.0
+                elif event.key == pygame.K_RIGHT:
+                    t += 1.0
+                elif event.key == pygame.K_UP:
+                    rate *= 2.0
+                elif event.key == pygame.K_DOWN:
+                    rate /= 2.0
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and bar.inflate(0, 16).collidepoint(event.pos):
+                dragging = True
+            elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+                dragging = False
+
+        if dragging:
+            mx = min(max(pygame.mouse.get_pos()[0], bar.left), bar.right)
+            t = (mx - bar.left) / bar.width * rec.duration
+        elif not paused:
+            t += dt * rate
+        t = min(max(t, 0.0), rec.duration)
+
+        i = rec.index_at(t)
+        positions, speeds, car_lanes, intents = rec.frame(i)
+        camera_y_m = min(positions[0] - 120.0, end_y_m - HEIGHT / 2)
+
+        draw_world(screen, signs, camera_y_m, font)
+        end_screen_y = HEIGHT - (end_y_m - camera_y_m)
+        pygame.draw.line(screen, (255, 80, 80), (ROAD_LEFT, end_screen_y), (ROAD_RIGHT, end_screen_y), 3)
+
+        for sprite, pos, lane in zip(sprites, positions, car_lanes):
+            screen.blit(sprite, (lane_x(int(lane)), HEIGHT - (pos - camera_y_m)))
+
+        # Timeline
+        pygame.draw.rect(screen, (70, 70, 70), bar, border_radius=6)
+        filled = bar.copy()
+        filled.width = int(bar.width * (t / rec.duration if rec.duration else 0))
+        pygame.draw.rect(screen, (60, 160, 240), filled, border_radius=6)
+
+        info1 = font.render(f"t = {rec.times[i]:.2f}s / {rec.duration:.2f}s   frame {i + 1}/{rec.num_frames}   x{rate:g}"
+                            + ("   PAUSED" if paused else ""), True, (255, 255, 255))
+        info2 = font.render(f"Distance: {positions[0]:.1f} m / {end_y_m:.1f} m", True, (255, 255, 255))
+        screen.blit(info1, (10, 10))
+        screen.blit(info2, (10, 25))
+
+        draw_speedometer(screen, mps_to_kmh(speeds[0]), (110, 680), 90, 300, font)
+        label = font.render("Player Speed", True, (255, 255, 255))
+        screen.blit(label, (110 - label.get_width() // 2, 540))
+
+        pygame.display.flip()
+
+    pygame.quit()
 
 if __name__ == "__main__":
-    mode = input("Run mode? [sim/monte]: ").strip().lower()
-    if mode == "monte":
-        num_runs = int(input("How many runs? "))
-        threshold = float(input("Time threshold (seconds)? "))
-        pygame.init()
-        pygame.display.set_mode((1, 1))  # dummy window, needed for image loading
-        sheet = SpriteSheet("cars.png")
-        results = run_monte_carlo(sheet, num_runs=num_runs)
-        analyze_results(results, time_threshold=threshold)
-    else:
-        main()
\ No newline at end of file
+    # Non-interactive entry point lives in cli.py (python cli.py --help)
+    import cli
+    sys.exit(cli.main())
@@ -0,0 +1,116 @@
+# progress.py
+"""
+Rate-limited progress line for long Monte Carlo runs.
+
+    done/total runs, runs/s, vehicle-ticks/s, ETA and worker utilisation
+
+Runners call update() as runs (or chunks of runs) finish; the line is redrawn
+at most every `interval` seconds, so the cost per update is a clock read. With
+no terminal on the other end (batch jobs, pipes) nothing is written at all.
+
+Utilisation is the time workers spent simulating over wall time x workers,
+from the busy seconds runners pass in; it's left out when none are reported.
+"""
+import sys
+import time
+
+from engine import DT
+
+
+def vehicle_ticks(results, dt=DT):
+    """Vehicle-ticks in runs of [(car_id, elapsed_time, finished)]: cars x ticks of the longest car, per run."""
+    total = 0
+    for run in results:
+        if run:
+            total += len(run) * round(max(t for _, t, _ in run) / dt)
+    return total
+
+
+def _si(x):
+    for unit, scale in (("G", 1e9), ("M", 1e6), ("k", 1e3)):
+        if x >= scale:
+            return f"{x / scale:.1f}{unit}"
+    return f"{x:.0f}"
+
+
+def _clock(seconds):
+    seconds = int(seconds)
+    h, rest = divmod(seconds, 3600)
+    return f"{h}:{rest // 60:02d}:{rest % 60:02d}" if h else f"{rest // 60}:{rest % 60:02d}"
+
+
+class Progress:
+    """Counts finished runs and redraws one status line on stream (default stderr) if it's a TTY."""
+
+    def __init__(self, total, workers=1, done=0, interval=0.25, stream=None, enabled=None):
+        self.stream = stream or sys.stderr
+        if enabled is None:
+            enabled = getattr(self.stream, "isatty", lambda: False)()
+        self.enabled = enabled
+        self.total = total
+        self.workers = max(1, workers)
+        self.interval = interval
+        self.start_done = done  # runs already done before this session (resumed logs)
+        self.runs = done
+        self.vehicle_ticks = 0
+        self.busy_s = 0.0
+        self._t0 = self._last = time.monotonic()
+        self._width = 0
+
+    def update(self, runs=1, vehicle_ticks=0, busy_s=0.0):
+        """Add finished runs (and their vehicle-ticks and worker busy seconds)."""
+        self.runs += runs
+        self.vehicle_ticks += vehicle_ticks
+        self.busy_s += busy_s
+        if self.enabled:
+            now = time.monotonic()
+            if now - self._last >= self.interval:
+                self._last = now
+                self._draw(now)
+
+    def set(self, runs, vehicle_ticks=None, busy_s=None):
+        """Absolute counts, for runners that poll a total (distributed)."""
+        self.update(runs - self.runs,
+                    0 if vehicle_ticks is None else vehicle_ticks - self.vehicle_ticks,
+                    0.0 if busy_s is None else busy_s - self.busy_s)
+
+    def stats(self, now=None):
+        wall = (now or time.monotonic()) - self._t0
+        new = self.runs - self.start_done
+        rate = new / wall if wall > 0 else 0.0
+        out = {
+            "runs": self.runs,
+            "wall_s": wall,
+            "runs_per_s": rate,
+            "vehicle_ticks_per_s": self.vehicle_ticks / wall if wall > 0 else 0.0,
+            "eta_s": (self.total - self.runs) / rate if rate > 0 else None,
+        }
+        if self.busy_s:
+            out["utilisation"] = min(1.0, self.busy_s / (wall * self.workers)) if wall > 0 else 0.0
+        return out
+
+    def _draw(self, now):
+        s = self.stats(now)
+        parts = [f"{self.runs}/{self.total} runs", f"{s['runs_per_s']:.0f} runs/s"]
+        if self.vehicle_ticks:
+            parts.append(f"{_si(s['vehicle_ticks_per_s'])} veh-ticks/s")
+        parts.append("ETA " + ("?" if s["eta_s"] is None else _clock(s["eta_s"])))
+        if "utilisation" in s:
+            parts.append(f"util {s['utilisation'] * 100:.0f}%")
+        line = "  ".join(parts)
+        self.stream.write("\r" + line.ljust(self._width))
+        self.stream.flush()
+        self._width = len(line)
+
+    def close(self):
+        """Draw the final counts and end the line."""
+        if self.enabled:
+            self._draw(time.monotonic())
+            self.stream.write("\n")
+            self.stream.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,125 @@
+# replay.py
+"""
+Compact binary recordings of a run, for scrubbing through it in main.playback().
+
+Layout (little endian), every section 8-byte aligned:
+    header      magic, version, cars, frames, keyframe interval, signs,
+                position scale (m per unit), speed scale (m/s per unit), end position
+    car ids     int32[cars]
+    signs       float64 position, float64 limit_kmh  [signs]
+    times       float64[frames]
+    keyframes   int64[ceil(frames / K), cars]  absolute quantized positions every K frames
+    deltas      int16[frames, cars]            quantized position change since the previous frame
+    speeds      uint16[frames, cars]           quantized speed
+    lanes       uint8[frames, cars]
+    intents     uint8[frames, cars]
+
+Frame f is rebuilt from its keyframe plus at most K-1 deltas, so any time can
+be reached without decoding the file from the start.
+"""
+import struct
+import numpy as np
+
+MAGIC = b"SIMREPL\0"
+VERSION = 1
+KEYFRAME_EVERY = 64
+_HEADER = struct.Struct("<8sHxxIIIIddd")
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+def write_replay(path, telemetry, end_position=0.0, keyframe_every=KEYFRAME_EVERY):
+    """Write what a telemetry.Telemetry recorded (plus its signs) to `path`."""
+    tr = telemetry.trajectories()
+    pos, spd = tr["position"], tr["speed"]
+    frames, n = pos.shape
+
+    # Positions to 1 cm unless a frame-to-frame jump wouldn't fit in an int16
+    step = np.abs(np.diff(pos, axis=0)).max(initial=0.0)
+    pos_scale = max(0.01, step / 32000.0)
+    q = np.rint(pos / pos_scale).astype(np.int64)
+    deltas = np.diff(q, axis=0, prepend=q[:1]).astype(np.int16)
+    keyframes = q[::keyframe_every]
+
+    speed_scale = 0.01
+    speeds = np.clip(np.rint(spd / speed_scale), 0, 65535).astype(np.uint16)
+
+    signs = np.array(telemetry.signs or [], dtype=np.float64).reshape(-1, 2)
+    car_ids = (telemetry.car_ids if telemetry.car_ids is not None else np.empty(0)).astype(np.int32)
+
+    with open(path, "wb") as f:
+        head = _HEADER.pack(MAGIC, VERSION, n, frames, keyframe_every, len(signs), pos_scale, speed_scale, end_position)
+        f.write(head + b"\0" * (_align(len(head)) - len(head)))
+        for arr in (car_ids, signs, tr["time"].astype(np.float64), keyframes, deltas, speeds,
+                    tr["lane"].astype(np.uint8), tr["intent"].astype(np.uint8)):
+            data = np.ascontiguousarray(arr).tobytes()
+            f.write(data + b"\0" * (_align(len(data)) - len(data)))
+
+
+class Replay:
+    """Memory-mapped view of a recording; nothing is decoded until a frame is asked for."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            head = f.read(_HEADER.size)
+        magic, version, n, frames, k, n_signs, self.pos_scale, self.speed_scale, self.end_position = _HEADER.unpack(head)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} replay file")
+        self.num_cars, self.num_frames, self.keyframe_every = n, frames, k
+
+        layout = [
+            ("car_ids", np.int32, (n,)),
+            ("signs", np.float64, (n_signs, 2)),
+            ("times", np.float64, (frames,)),
+            ("keyframes", np.int64, ((frames - 1) // k + 1 if frames else 0, n)),
+            ("deltas", np.int16, (frames, n)),
+            ("speeds", np.uint16, (frames, n)),
+            ("lanes", np.uint8, (frames, n)),
+            ("intents", np.uint8, (frames, n)),
+        ]
+        offset = _align(_HEADER.size)
+        for name, dtype, shape in layout:
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            if size:
+                arr = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape)
+            else:
+                arr = np.empty(shape, dtype=dtype)
+            setattr(self, name, arr)
+            offset += _align(size)
+
+    @property
+    def duration(self):
+        return float(self.times[-1]) if self.num_frames else 0.0
+
+    def index_at(self, t):
+        """Last frame at or before time t (clamped to the recording)."""
+        i = int(np.searchsorted(self.times, t, side="right")) - 1
+        return min(max(i, 0), self.num_frames - 1)
+
+    def frame(self, i):
+        """(positions m, speeds m/s, lanes, intents) for frame i."""
+        k = i // self.keyframe_every
+        start = k * self.keyframe_every
+        q = self.keyframes[k] + self.deltas[start + 1:i + 1].sum(axis=0, dtype=np.int64)
+        return (
+            q * self.pos_scale,
+            self.speeds[i] * self.speed_scale,
+            np.asarray(self.lanes[i]),
+            np.asarray(self.intents[i]),
+        )
+
+
+def record_run(path, seed=None, **sim_kwargs):
+    """Run engine.run_simulation once with telemetry on and save it to `path`."""
+    import random
+    import engine
+    from telemetry import Telemetry
+
+    if seed is not None:
+        random.seed(seed)
+    telemetry = Telemetry()
+    results = engine.run_simulation(None, telemetry=telemetry, **sim_kwargs)
+    write_replay(path, telemetry, end_position=engine.END_Y_M)
+    return results
@@ -0,0 +1,203 @@
+# runlog.py
+"""
+Durable, append-only log of completed Monte Carlo runs, so long sweeps can resume.
+
+A log directory holds:
+    runs.log        records appended as batches finish, each fsync'd
+    manifest.json   scenario, seed, completed run ranges and the log length they cover
+
+Run i is seeded with seed + i, so the completed ranges are the completed seeds;
+a restart with the same scenario only runs what's missing, and results() can be
+read (e.g. into analysis.analyze_results) at any time, also while a sweep runs.
+
+Record layout (little endian):
+    header      magic, first run, runs, cars, payload bytes, crc32 of the payload
+    payload     int64 car_id[runs * cars], float64 elapsed_time[runs * cars], bool finished[runs * cars]
+
+A crash can leave a torn record at the end of runs.log (or a record the manifest
+hasn't caught up with); opening the log keeps every complete record and cuts the rest.
+The manifest is only a summary: if runs.log turns out shorter than it says, or a
+record in it fails its CRC, completed is rebuilt from the records before that point.
+"""
+import json
+import os
+import random
+import struct
+import zlib
+from array import array
+
+MAGIC = b"RUNS"
+_RECORD = struct.Struct("<4sQIIQI")
+LOG_NAME = "runs.log"
+MANIFEST_NAME = "manifest.json"
+SCENARIO_DEFAULTS = {"engine": "object", "sub_steps": 1, "decision_hz": None}
+
+
+def scenario(num_traffic, speed_limit_kmh, lanes, **timing):
+    """The scenario a log is keyed on, for every writer (monte --log, run_monte_carlo, surrogate.train)."""
+    return {"num_traffic": int(num_traffic), "speed_limit_kmh": float(speed_limit_kmh), "lanes": int(lanes),
+            **SCENARIO_DEFAULTS, **timing}
+
+
+def _pack(first_run, results):
+    ids, times, finished = array("q"), array("d"), bytearray()
+    for run in results:
+        for cid, t, f in run:
+            ids.append(cid)
+            times.append(t)
+            finished.append(f)
+    cars = len(results[0]) if results else 0
+    payload = ids.tobytes() + times.tobytes() + bytes(finished)
+    return _RECORD.pack(MAGIC, first_run, len(results), cars, len(payload), zlib.crc32(payload)) + payload
+
+
+def _unpack(payload, runs, cars):
+    n = runs * cars
+    ids, times = array("q"), array("d")
+    ids.frombytes(payload[:8 * n])
+    times.frombytes(payload[8 * n:16 * n])
+    finished = payload[16 * n:]
+    return [[(ids[j], times[j], bool(finished[j])) for j in range(r * cars, (r + 1) * cars)] for r in range(runs)]
+
+
+def _merge(ranges):
+    out = []
+    for start, end in sorted(ranges):
+        if out and start <= out[-1][1]:
+            out[-1][1] = max(out[-1][1], end)
+        else:
+            out.append([start, end])
+    return out
+
+
+class RunLog:
+    """
+    Completed runs of one scenario in a directory. Opening an existing log with a
+    different scenario or seed raises ValueError instead of mixing results; with
+    seed=None an existing log keeps its seed and a new one gets a random seed.
+    """
+
+    def __init__(self, path, scenario=None, seed=None):
+        self.path = path
+        self.log_path = os.path.join(path, LOG_NAME)
+        self.manifest_path = os.path.join(path, MANIFEST_NAME)
+        os.makedirs(path, exist_ok=True)
+
+        manifest = None
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            manifest["scenario"] = {**SCENARIO_DEFAULTS, **manifest["scenario"]}  # logs from before those keys
+            if seed is None:
+                seed = manifest["seed"]
+            if scenario is not None and (manifest["scenario"] != scenario or manifest["seed"] != seed):
+                raise ValueError(f"{path} holds runs of {manifest['scenario']} seed {manifest['seed']}, "
+                                 f"not {scenario} seed {seed}")
+        elif scenario is None:
+            raise FileNotFoundError(f"no run log in {path}")
+        self.scenario = manifest["scenario"] if manifest else scenario
+        self.seed = manifest["seed"] if manifest else (random.getrandbits(32) if seed is None else seed)
+        self.completed = [list(r) for r in manifest["completed"]] if manifest else []
+        self._recover(manifest["log_bytes"] if manifest else 0)
+
+    def _records(self, start=0):
+        """(offset, end, first_run, runs, cars, payload) of every complete record from start."""
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, "rb") as f:
+            f.seek(start)
+            offset = start
+            while True:
+                header = f.read(_RECORD.size)
+                if len(header) < _RECORD.size:
+                    return
+                magic, first, runs, cars, size, crc = _RECORD.unpack(header)
+                payload = f.read(size)
+                if magic != MAGIC or len(payload) < size or zlib.crc32(payload) != crc:
+                    return
+                end = offset + _RECORD.size + size
+                yield offset, end, first, runs, cars, payload
+                offset = end
+
+    def _recover(self, covered):
+        """Rebuild completed from the valid records, cut everything after them, and fix the manifest."""
+        good, completed = 0, []
+        for _, end, first, runs, _, _ in self._records():
+            completed.append([first, first + runs])
+            good = end
+        completed = _merge(completed)
+        if os.path.exists(self.log_path) and os.path.getsize(self.log_path) > good:
+            with open(self.log_path, "r+b") as f:
+                f.truncate(good)
+        changed = good != covered or completed != self.completed
+        self.completed = completed
+        self.log_bytes = good
+        if changed or not os.path.exists(self.manifest_path):
+            self._write_manifest()
+
+    def _write_manifest(self):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"scenario": self.scenario, "seed": self.seed, "completed": self.completed,
+                       "log_bytes": self.log_bytes}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.manifest_path)
+
+    @property
+    def runs_done(self):
+        return sum(end - start for start, end in self.completed)
+
+    def missing(self, num_runs):
+        """[(first_run, end)] of runs 0..num_runs-1 not in the log yet."""
+        out, at = [], 0
+        for start, end in self.completed:
+            if start >= num_runs:
+                break
+            if start > at:
+                out.append((at, start))
+            at = max(at, end)
+        if at < num_runs:
+            out.append((at, num_runs))
+        return out
+
+    def append(self, first_run, results):
+        """Durably add runs first_run.. (then update the manifest)."""
+        if not results:
+            return
+        record = _pack(first_run, results)
+        with open(self.log_path, "ab") as f:
+            f.write(record)
+            f.flush()
+            os.fsync(f.fileno())
+        self.log_bytes += len(record)
+        self.completed = _merge(self.completed + [[first_run, first_run + len(results)]])
+        self._write_manifest()
+
+    def results(self, num_runs=None):
+        """All logged runs in run order (only run ids below num_runs, if given); duplicates read once."""
+        by_first = {}
+        for _, _, first, runs, cars, payload in self._records():
+            by_first.setdefault(first, (runs, cars, payload))
+        out, at = [], 0
+        for first in sorted(by_first):
+            runs, cars, payload = by_first[first]
+            end = first + runs if num_runs is None else min(first + runs, num_runs)
+            if end <= at:
+                continue
+            out.extend(_unpack(payload, runs, cars)[max(0, at - first):end - first])
+            at = end
+        return out
+
+
+def run_logged(log, num_runs, run, batch_runs=100):
+    """
+    Fill log up to num_runs runs: run(first_run, n) must return runs first_run..first_run+n-1
+    (seeded with log.seed + i). Each batch is appended as soon as it's done, so an
+    interrupted call loses at most one batch. Returns log.results(num_runs).
+    """
+    for start, end in log.missing(num_runs):
+        for first in range(start, end, batch_runs):
+            n = min(batch_runs, end - first)
+            log.append(first, run(first, n))
+    return log.results(num_runs)
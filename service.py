@@ -0,0 +1,473 @@
+# service.py
+"""
+Local simulation service.
+
+    python service.py --port 8765
+
+HTTP (JSON bodies):
+    POST /scenarios          submit a scenario, returns {"id": ...}
+    GET  /scenarios/<id>     status, and the result once done
+WebSocket:
+    GET  /scenarios/<id>/stream   progress / tick messages, then the result
+
+Scenario fields mirror start_screen():
+    sim:   {"mode": "sim", "num_cars", "num_lanes", "speed_limit"}
+    monte: {"mode": "monte", "num_runs", "threshold", "num_cars", "speed_limit", "num_lanes"}
+Optional: "stream_every" (ticks between tick messages in sim mode, default 5).
+Values must be finite and within SCENARIO_LIMITS (or the service's own limits).
+
+Runs execute in a process pool; the event loop only shuffles messages.
+Workers put their messages on one shared queue, read by a single forwarding
+thread that hands them to the event loop. A job keeps its last MAX_MESSAGES
+messages for streams that connect late; only the last max_finished finished
+jobs are kept, older ids answer 404.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import itertools
+import json
+import math
+import multiprocessing
+import struct
+import threading
+from collections import deque
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+SCENARIO_DEFAULTS = {
+    "sim": {"num_cars": 13, "num_lanes": 5, "speed_limit": 120.0, "stream_every": 5},
+    "monte": {"num_runs": 100, "threshold": 25.0, "num_cars": 6, "num_lanes": 5, "speed_limit": 120.0},
+}
+# Upper bounds per field: one request shouldn't be able to hold a worker for days
+SCENARIO_LIMITS = {"num_cars": 200, "num_lanes": 20, "speed_limit": 500.0, "stream_every": 10_000,
+                   "num_runs": 100_000, "threshold": 3600.0}
+
+
+def parse_scenario(body: dict, limits=SCENARIO_LIMITS) -> dict:
+    """Fill defaults and coerce types, raising ValueError on bad input."""
+    mode = body.get("mode")
+    if mode not in SCENARIO_DEFAULTS:
+        raise ValueError(f"mode must be one of {sorted(SCENARIO_DEFAULTS)}")
+
+    scenario = {"mode": mode}
+    for key, default in SCENARIO_DEFAULTS[mode].items():
+        value = body.get(key, default)
+        if isinstance(value, bool):
+            raise ValueError(f"{key} must be a number")
+        if isinstance(default, int) and isinstance(value, float) and not value.is_integer():
+            raise ValueError(f"{key} must be an integer")
+        try:
+            scenario[key] = type(default)(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{key} must be {'an integer' if isinstance(default, int) else 'a number'}")
+        if not math.isfinite(scenario[key]):
+            raise ValueError(f"{key} must be finite")
+        if scenario[key] < 0 or (key in ("num_lanes", "num_runs", "stream_every") and scenario[key] < 1):
+            raise ValueError(f"{key} out of range")
+        if scenario[key] > limits[key]:
+            raise ValueError(f"{key} is limited to {limits[key]}")
+    return scenario
+
+
+# -----------------------
+# Worker side (runs in pool processes)
+# -----------------------
+class _TickStream:
+    """Recorder that forwards every n-th tick's car states to the service."""
+
+    def __init__(self, queue, every):
+        self.queue = queue
+        self.every = every
+        self.clock = 0.0
+        self.tick = 0
+
+    def record(self, cars, dt):
+        self.clock += dt
+        self.tick += 1
+        if self.tick % self.every:
+            return
+        self.queue.put({
+            "type": "tick",
+            "t": round(self.clock, 4),
+            "cars": [[c.id, round(c.position, 2), round(c.speed, 2), c.lane, c.intent.name] for c in cars],
+        })
+
+
+class _Tagged:
+    """The shared message queue as seen by one job: messages go out as (job_id, msg)."""
+
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.job_id = job_id
+
+    def put(self, msg):
+        self.queue.put((self.job_id, msg))
+
+
+def _run_job(scenario, queue):
+    """Pool entry point: run_scenario, then (job_id, None) so the service knows every message is in."""
+    try:
+        return run_scenario(scenario, queue)
+    finally:
+        queue.put(None)
+
+
+def run_scenario(scenario: dict, queue) -> dict:
+    import engine
+    from analysis import summarize_results
+
+    if scenario["mode"] == "sim":
+        stream = _TickStream(queue, scenario["stream_every"])
+        results = engine.run_simulation(
+            None,
+            num_traffic=scenario["num_cars"],
+            speed_limit_kmh=scenario["speed_limit"],
+            lanes=scenario["num_lanes"],
+            telemetry=stream,
+        )
+        return {
+            "cars": [{"car_id": cid, "elapsed_time": t, "finished": f} for cid, t, f in results],
+            "sim_time": stream.clock,
+        }
+
+    all_run_results = []
+    num_runs = scenario["num_runs"]
+    for i in range(num_runs):
+        all_run_results.append(engine.run_simulation(
+            None,
+            num_traffic=scenario["num_cars"],
+            speed_limit_kmh=scenario["speed_limit"],
+            lanes=scenario["num_lanes"],
+        ))
+        queue.put({"type": "progress", "done": i + 1, "total": num_runs})
+
+    summary = summarize_results(all_run_results, scenario["threshold"])
+    summary.pop("times_by_car")
+    summary["per_car"] = {str(k): v for k, v in summary["per_car"].items()}
+    return summary
+
+
+# -----------------------
+# Service side (event loop)
+# -----------------------
+class Job:
+    MAX_MESSAGES = 1000  # kept for streams that connect late; older ones are dropped
+
+    def __init__(self, job_id, scenario):
+        self.id = job_id
+        self.scenario = scenario
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.messages = deque(maxlen=self.MAX_MESSAGES)
+        self.published = 0  # messages ever published; messages holds the last len(messages)
+        self.drained = asyncio.Event()  # the worker's messages have all been forwarded
+        self._new = asyncio.Event()
+
+    def publish(self, msg):
+        self.messages.append(msg)
+        self.published += 1
+        self._new.set()
+        self._new = asyncio.Event()
+
+    async def since(self, seq):
+        """(messages after the seq-th that are still kept, new seq); waits if there are none yet."""
+        if seq == self.published:
+            await self._new.wait()
+        first = self.published - len(self.messages)
+        return list(itertools.islice(self.messages, max(seq - first, 0), None)), self.published
+
+    def describe(self):
+        out = {"id": self.id, "status": self.status, "scenario": self.scenario}
+        if self.result is not None:
+            out["result"] = self.result
+        if self.error is not None:
+            out["error"] = self.error
+        return out
+
+
+class SimulationService:
+    def __init__(self, workers=None, limits=None, max_finished=1000):
+        self.workers = workers
+        self.limits = {**SCENARIO_LIMITS, **(limits or {})}
+        self.max_finished = max_finished
+        self.jobs = {}
+        self._finished = deque()  # ids of finished jobs, oldest first
+        self._ids = itertools.count(1)
+        self._pool = None
+        self._manager = None
+        self._queue = None
+        self._forwarder = None
+        self._server = None
+
+    async def start(self, host="127.0.0.1", port=8765):
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        self._manager = multiprocessing.Manager()
+        self._queue = self._manager.Queue()
+        self._forwarder = threading.Thread(target=self._forward, args=(asyncio.get_running_loop(),), daemon=True)
+        self._forwarder.start()
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+        if self._forwarder is not None:
+            self._queue.put(None)
+            self._forwarder.join()
+        if self._manager is not None:
+            self._manager.shutdown()
+
+    def _forward(self, loop):
+        """Forwarding thread: worker messages -> their job on the event loop, until None."""
+        while (item := self._queue.get()) is not None:
+            loop.call_soon_threadsafe(self._deliver, *item)
+
+    def _deliver(self, job_id, msg):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return  # a late message for a job that has already been evicted
+        if msg is None:
+            job.drained.set()
+        else:
+            job.publish(msg)
+
+    def submit(self, scenario) -> Job:
+        job = Job(str(next(self._ids)), scenario)
+        self.jobs[job.id] = job
+        asyncio.get_running_loop().create_task(self._run(job))
+        return job
+
+    async def _run(self, job):
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._pool, _run_job, job.scenario, _Tagged(self._queue, job.id))
+        job.status = "running"
+        job.publish({"type": "status", "status": job.status})
+
+        drained = True
+        try:
+            job.result = await future
+            job.status = "done"
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = "failed"
+            drained = not isinstance(e, BrokenExecutor)  # a dead worker never sends its sentinel
+        if drained:
+            await job.drained.wait()  # progress / tick messages still on their way come first
+        job.publish({"type": "result", **job.describe()})
+        self._finished.append(job.id)
+        while len(self._finished) > self.max_finished:
+            del self.jobs[self._finished.popleft()]
+
+    # --- HTTP plumbing ---
+    async def _handle(self, reader, writer):
+        try:
+            try:
+                request = await _read_request(reader)
+            except ValueError as e:
+                return await _send_json(writer, 400, {"error": f"malformed request: {e}"})
+            if request is None:
+                return
+            method, path, headers, body = request
+            parts = [p for p in path.split("?")[0].split("/") if p]
+
+            if headers.get("upgrade", "").lower() == "websocket":
+                if method == "GET" and len(parts) == 3 and parts[0] == "scenarios" and parts[2] == "stream":
+                    job = self.jobs.get(parts[1])
+                    if job is None:
+                        return await _send_json(writer, 404, {"error": "unknown scenario"})
+                    if "sec-websocket-key" not in headers:
+                        return await _send_json(writer, 400, {"error": "missing Sec-WebSocket-Key"})
+                    return await self._stream(job, headers, reader, writer)
+                return await _send_json(writer, 404, {"error": "not found"})
+
+            if method == "POST" and parts == ["scenarios"]:
+                try:
+                    scenario = parse_scenario(json.loads(body or b"{}"), self.limits)
+                except (ValueError, AttributeError) as e:
+                    return await _send_json(writer, 400, {"error": str(e)})
+                job = self.submit(scenario)
+                return await _send_json(writer, 202, {"id": job.id, "status": job.status})
+
+            if method == "GET" and len(parts) == 2 and parts[0] == "scenarios":
+                job = self.jobs.get(parts[1])
+                if job is None:
+                    return await _send_json(writer, 404, {"error": "unknown scenario"})
+                return await _send_json(writer, 200, job.describe())
+
+            await _send_json(writer, 404, {"error": "not found"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _stream(self, job, headers, reader, writer):
+        accept = base64.b64encode(hashlib.sha1((headers["sec-websocket-key"] + WS_GUID).encode()).digest()).decode()
+        writer.write((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode())
+        await writer.drain()
+
+        # Replay what is still kept, then follow live until the result message
+        seq = 0
+        while True:
+            pending, seq = await job.since(seq)
+            for msg in pending:
+                writer.write(_ws_frame(json.dumps(msg).encode()))
+            await writer.drain()
+            if pending and pending[-1]["type"] == "result":
+                break
+
+        writer.write(_ws_frame(b"", opcode=0x8))
+        await writer.drain()
+
+
+async def _read_request(reader):
+    """(method, path, headers, body), None on a closed connection; ValueError if malformed."""
+    line = await reader.readline()
+    if not line:
+        return None
+    fields = line.decode("latin-1").split(" ", 2)
+    if len(fields) != 3:
+        raise ValueError("bad request line")
+    method, path, _ = fields
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        k, sep, v = line.decode("latin-1").partition(":")
+        if not sep:
+            raise ValueError("bad header line")
+        headers[k.strip().lower()] = v.strip()
+    length = int(headers.get("content-length", 0))  # ValueError if not a number
+    if length < 0:
+        raise ValueError("bad content-length")
+    body = await reader.readexactly(length) if length else b""
+    return method, path, headers, body
+
+
+async def _send_json(writer, status, payload):
+    reasons = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found"}
+    body = json.dumps(payload).encode()
+    writer.write((
+        f"HTTP/1.1 {status} {reasons[status]}\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+    ).encode() + body)
+    await writer.drain()
+
+
+def _ws_frame(payload: bytes, opcode=0x1, mask=False) -> bytes:
+    head = bytes([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    n = len(payload)
+    if n < 126:
+        head += bytes([mask_bit | n])
+    elif n < 1 << 16:
+        head += bytes([mask_bit | 126]) + struct.pack("!H", n)
+    else:
+        head += bytes([mask_bit | 127]) + struct.pack("!Q", n)
+    if mask:
+        # Clients must mask; the key doesn't need to be random for a local tool
+        key = b"\x00\x00\x00\x00"
+        return head + key + payload
+    return head + payload
+
+
+async def _ws_read(reader):
+    """Read one (unfragmented) frame: returns (opcode, payload)."""
+    b0, b1 = await reader.readexactly(2)
+    n = b1 & 0x7F
+    if n == 126:
+        n = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif n == 127:
+        n = struct.unpack("!Q", await reader.readexactly(8))[0]
+    key = await reader.readexactly(4) if b1 & 0x80 else None
+    payload = await reader.readexactly(n)
+    if key:
+        payload = bytes(c ^ key[i % 4] for i, c in enumerate(payload))
+    return b0 & 0x0F, payload
+
+
+# -----------------------
+# Minimal client (for scripts and local testing)
+# -----------------------
+async def request(host, port, method, path, payload=None):
+    reader, writer = await asyncio.open_connection(host, port)
+    body = json.dumps(payload).encode() if payload is not None else b""
+    writer.write((
+        f"{method} {path} HTTP/1.1\r\nHost: {host}\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+    ).encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        k, v = line.decode("latin-1").split(":", 1)
+        headers[k.strip().lower()] = v.strip()
+    data = await reader.readexactly(int(headers.get("content-length", 0)))
+    writer.close()
+    return status, json.loads(data) if data else None
+
+
+async def stream(host, port, job_id):
+    """Yield decoded messages from /scenarios/<id>/stream until the server closes it."""
+    reader, writer = await asyncio.open_connection(host, port)
+    key = base64.b64encode(b"local-sim-client!").decode()
+    writer.write((
+        f"GET /scenarios/{job_id}/stream HTTP/1.1\r\nHost: {host}\r\n"
+        "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+        f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n"
+    ).encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    if status != 101:
+        writer.close()
+        raise ConnectionError(f"websocket upgrade refused ({status})")
+    while await reader.readline() not in (b"\r\n", b""):
+        pass
+
+    try:
+        while True:
+            opcode, payload = await _ws_read(reader)
+            if opcode == 0x8:
+                break
+            if opcode == 0x1:
+                yield json.loads(payload)
+    finally:
+        writer.close()
+
+
+async def _serve(host, port, workers, limits, max_finished):
+    service = SimulationService(workers=workers, limits=limits, max_finished=max_finished)
+    host, port = await service.start(host, port)
+    print(f"Simulation service on http://{host}:{port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await service.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local simulation service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-cars", type=int, default=SCENARIO_LIMITS["num_cars"])
+    parser.add_argument("--max-runs", type=int, default=SCENARIO_LIMITS["num_runs"])
+    parser.add_argument("--max-finished", type=int, default=1000, help="finished jobs kept for GET / stream")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args.host, args.port, args.workers, {"num_cars": args.max_cars, "num_runs": args.max_runs},
+                           args.max_finished))
+    except KeyboardInterrupt:
+        pass
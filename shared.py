@@ -0,0 +1,252 @@
+# shared.py
+"""
+Monte Carlo results in shared memory instead of pickled lists.
+
+The parent allocates one multiprocessing.shared_memory block laid out as numpy
+arrays indexed by run id; workers attach to it by name, write their runs'
+rows in place and return only a count. The parent reads the arrays directly,
+so nothing per run crosses the process boundary.
+
+Layout (each section 8-byte aligned), R runs x C cars, T state ticks:
+    car_id      int64[R, C]
+    time        float64[R, C]     elapsed_time
+    finished    bool[R, C]
+    ticks       int32[R]          ticks each run took (filled when states are kept)
+    position    float32[R, T, C]  per-tick states, only if T > 0
+    speed       float32[R, T, C]
+"""
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+import engine
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+class SharedResults:
+    """
+    Results of num_runs runs in a shared memory block. Created without a name it
+    owns the block (unlink() frees it); workers use attach(spec) instead.
+    """
+
+    def __init__(self, num_runs, num_cars, state_ticks=0, name=None):
+        self.num_runs, self.num_cars, self.state_ticks = num_runs, num_cars, state_ticks
+        layout = [
+            ("car_id", np.int64, (num_runs, num_cars)),
+            ("time", np.float64, (num_runs, num_cars)),
+            ("finished", np.bool_, (num_runs, num_cars)),
+            ("ticks", np.int32, (num_runs,)),
+            ("position", np.float32, (num_runs, state_ticks, num_cars)),
+            ("speed", np.float32, (num_runs, state_ticks, num_cars)),
+        ]
+        sizes = [_align(int(np.prod(shape)) * np.dtype(dtype).itemsize) for _, dtype, shape in layout]
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=max(1, sum(sizes)))
+        offset = 0
+        for (attr, dtype, shape), size in zip(layout, sizes):
+            setattr(self, attr, np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset))
+            offset += size
+        if self.owner:
+            self.finished[:] = False
+            self.ticks[:] = 0
+
+    @property
+    def spec(self):
+        """Picklable handle for attach()."""
+        return self.shm.name, self.num_runs, self.num_cars, self.state_ticks
+
+    @classmethod
+    def attach(cls, spec):
+        name, num_runs, num_cars, state_ticks = spec
+        return cls(num_runs, num_cars, state_ticks, name=name)
+
+    def write(self, run, results):
+        """Store one run's [(car_id, elapsed_time, finished)]."""
+        ids, times, finished = zip(*results)
+        n = len(ids)
+        self.car_id[run, :n] = ids
+        self.time[run, :n] = times
+        self.finished[run, :n] = finished
+
+    def write_runs(self, first_run, runs):
+        """Store consecutive runs at once (same number of cars each)."""
+        if not runs:
+            return
+        columns = [tuple(zip(*run)) for run in runs]  # per run: (ids, times, finished)
+        n = len(columns[0][0])
+        block = slice(first_run, first_run + len(runs))
+        for k, arr in enumerate((self.car_id, self.time, self.finished)):
+            arr[block, :n] = [c[k] for c in columns]
+
+    def runs(self):
+        """The results as run_batch returns them (copies; for code that wants lists)."""
+        return [list(zip(ids, t, f)) for ids, t, f in zip(self.car_id.tolist(), self.time.tolist(),
+                                                             self.finished.tolist())]
+
+    def close(self):
+        # numpy views keep the buffer exported; drop them before closing
+        for attr in ("car_id", "time", "finished", "ticks", "position", "speed"):
+            self.__dict__.pop(attr, None)
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        if self.owner:
+            self.unlink()
+
+
+class _StateRecorder:
+    """run_simulation recorder writing the first state_ticks ticks into the shared arrays."""
+
+    def __init__(self, res, run):
+        self.res = res
+        self.run = run
+        self.signs = None
+        self.tick = 0
+
+    def record(self, car_list, dt):
+        t = self.tick
+        if t < self.res.state_ticks:
+            pos = self.res.position[self.run, t]
+            spd = self.res.speed[self.run, t]
+            for j, c in enumerate(car_list):
+                pos[j] = c.position
+                spd[j] = c.speed
+        self.tick = t + 1
+
+
+def _shared_chunk(spec, run_ids, seed, num_traffic, speed_limit_kmh, lanes, engine_name):
+    """Worker: run run_ids and write them straight into the shared block."""
+    import random
+
+    res = SharedResults.attach(spec)
+    try:
+        if engine_name == "batch":
+            from batch import iter_batch_blocks
+
+            # Seeded per slice like cli._run_batch_chunk
+            blocks = iter_batch_blocks(len(run_ids), num_traffic=num_traffic, speed_limit_kmh=speed_limit_kmh,
+                                       lanes=lanes, seed=None if seed is None else [seed, run_ids.start])
+            for start, times, finished in blocks:
+                rows = slice(run_ids.start + start, run_ids.start + start + len(times))
+                res.time[rows] = times
+                res.finished[rows] = finished
+                res.car_id[rows] = np.arange(times.shape[1])
+            return len(run_ids)
+
+        pool = engine.VehiclePool()
+        with engine.quiet_gc():
+            for i in run_ids:
+                if seed is not None:
+                    random.seed(seed + i)
+                if engine_name == "event":
+                    from events import run_event_simulation
+
+                    res.write(i, run_event_simulation(None, num_traffic=num_traffic, speed_limit_kmh=speed_limit_kmh,
+                                                      lanes=lanes, pool=pool))
+                    continue
+                recorder = _StateRecorder(res, i) if res.state_ticks else None
+                res.write(i, engine.run_simulation(None, num_traffic=num_traffic, speed_limit_kmh=speed_limit_kmh,
+                                                   lanes=lanes, telemetry=recorder, pool=pool))
+                if recorder is not None:
+                    res.ticks[i] = recorder.tick
+        return len(run_ids)
+    finally:
+        res.close()
+
+
+def run_shared(num_runs, seed=None, workers=1, num_traffic=6, speed_limit_kmh=120.0, lanes=engine.LANES,
+               state_ticks=0, engine_name="object"):
+    """
+    cli.run_batch with results in a SharedResults (use it as a context manager to free it).
+    Seeds match run_batch for the same engine. With state_ticks, the first that many
+    ticks of every run's positions and speeds are kept too (object engine).
+    """
+    if state_ticks and engine_name != "object":
+        raise ValueError("per-tick states need the object engine")
+    res = SharedResults(num_runs, engine.cars_per_run(num_traffic, lanes), state_ticks)
+    args = (seed, num_traffic, speed_limit_kmh, lanes, engine_name)
+    try:
+        if workers <= 1:
+            _shared_chunk(res.spec, range(num_runs), *args)
+        else:
+            chunk = -(-num_runs // workers) if engine_name == "batch" else max(1, num_runs // (workers * 4))
+            slices = [range(i, min(i + chunk, num_runs)) for i in range(0, num_runs, chunk)]
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(_shared_chunk, itertools.repeat(res.spec), slices,
+                              *[itertools.repeat(a) for a in args]))
+    except BaseException:
+        res.close()
+        res.unlink()
+        raise
+    return res
+
+
+# --- transport benchmark: the same synthetic results through either path ---
+
+def _fake_runs(run_ids, cars):
+    rng = np.random.default_rng(run_ids.start)
+    times = (15.0 + 5.0 * rng.random((len(run_ids), cars))).tolist()
+    return [[(i * cars + j, t, True) for j, t in enumerate(row)] for i, row in zip(run_ids, times)]
+
+
+def _pickled_chunk(run_ids, cars):
+    return _fake_runs(run_ids, cars)
+
+
+def _discard_chunk(run_ids, cars):
+    return len(_fake_runs(run_ids, cars))
+
+
+def _shm_chunk(spec, run_ids, cars):
+    res = SharedResults.attach(spec)
+    try:
+        res.write_runs(run_ids.start, _fake_runs(run_ids, cars))
+    finally:
+        res.close()
+    return len(run_ids)
+
+
+def transport_benchmark(num_runs=1_000_000, cars=7, workers=2, chunk=10_000):
+    """Wall seconds to get num_runs synthetic results to the parent: {"pickle": s, "shared_memory": s}.
+
+    "produce_only" is the workers building the results and dropping them, i.e. the
+    part of both timings that isn't transport.
+    """
+    import time
+
+    slices = [range(i, min(i + chunk, num_runs)) for i in range(0, num_runs, chunk)]
+    out = {}
+    # Workers must share the parent's resource tracker, or one of them would unlink
+    # the block when it exits; start it before the pool forks
+    resource_tracker.ensure_running()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(_pickled_chunk, slices[:workers], itertools.repeat(cars)))  # start the workers
+
+        t0 = time.perf_counter()
+        list(pool.map(_discard_chunk, slices, itertools.repeat(cars)))
+        out["produce_only"] = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        results = []
+        for part in pool.map(_pickled_chunk, slices, itertools.repeat(cars)):
+            results.extend(part)
+        out["pickle"] = time.perf_counter() - t0
+        del results
+
+        t0 = time.perf_counter()
+        with SharedResults(num_runs, cars) as res:
+            list(pool.map(_shm_chunk, itertools.repeat(res.spec), slices, itertools.repeat(cars)))
+            out["shared_memory"] = time.perf_counter() - t0
+    return out
@@ -1,13 +1,17 @@
 # sheets.py
-import pygame
+# pygame is imported lazily: headless runs only need the region names.
+import os
+from functools import lru_cache
 
-def _parse_atlas(atlas_path: str) -> dict[str, pygame.Rect]:
+ATLAS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cars.atlas")
+
+def _parse_atlas(atlas_path: str) -> dict[str, tuple[int, int, int, int]]:
     """
     Parses your cars.atlas file (Spine/TexturePacker style).
-    Returns: {name: pygame.Rect(x, y, w, h)} based on xy/size.
+    Returns: {name: (x, y, w, h)} based on xy/size.
     Assumes rotate: false (your atlas shows rotate: false).
     """
-    rects: dict[str, pygame.Rect] = {}
+    rects: dict[str, tuple[int, int, int, int]] = {}
 
     with open(atlas_path, "r", encoding="utf-8") as f:
         lines = [ln.rstrip("\n") for ln in f]
@@ -21,7 +25,7 @@ def _parse_atlas(atlas_path: str) -> dict[str, pygame.Rect]:
         if name and xy and size:
             x, y = xy
             w, h = size
-            rects[name] = pygame.Rect(x, y, w, h)
+            rects[name] = (x, y, w, h)
         name = None
         xy = None
         size = None
@@ -65,16 +69,34 @@ def _parse_atlas(atlas_path: str) -> dict[str, pygame.Rect]:
     return rects
 
 
-# Load once at import time
-_ATLAS_RECTS = _parse_atlas("cars.atlas")
-ATLAS_KEYS = list(_ATLAS_RECTS.keys())
+# Parsed on first use, then cached
+@lru_cache(maxsize=None)
+def atlas_rects() -> dict[str, tuple[int, int, int, int]]:
+    return _parse_atlas(ATLAS_PATH)
+
+@lru_cache(maxsize=None)
+def atlas_keys() -> list[str]:
+    return list(atlas_rects().keys())
+
+def __getattr__(name):
+    # Keep `from sheets import ATLAS_KEYS` working without parsing at import
+    if name == "ATLAS_KEYS":
+        return atlas_keys()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class SpriteSheet:
     def __init__(self, png_path: str):
+        import pygame
         self.sheet = pygame.image.load(png_path).convert_alpha()
-
-    def get_scaled(self, name: str, size: tuple[int, int]) -> pygame.Surface:
-        rect = _ATLAS_RECTS[name]
-        img = self.sheet.subsurface(rect).copy()
-        return pygame.transform.scale(img, size)
\ No newline at end of file
+        self._scaled = {}
+
+    def get_scaled(self, name: str, size: tuple[int, int]) -> "pygame.Surface":
+        # Cars only blit their sprite, so every car with the same region shares one surface
+        key = (name, tuple(size))
+        if key not in self._scaled:
+            import pygame
+            rect = pygame.Rect(atlas_rects()[name])
+            img = self.sheet.subsurface(rect).copy()
+            self._scaled[key] = pygame.transform.scale(img, size)
+        return self._scaled[key]
\ No newline at end of file
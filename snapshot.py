@@ -0,0 +1,172 @@
+# snapshot.py
+"""
+Snapshot / restore of a headless run, and forking continuations from a snapshot.
+
+A snapshot is a single bytes object (little endian), so it pickles cheaply to
+worker processes or can be written straight to disk:
+    header      magic, version, cars, signs, tick, dt, end position,
+                random module state (version, gauss_next)
+    rng         uint32[625]   Mersenne Twister state of the `random` module
+    cars        one _CAR record per car, in `cars` list order
+    signs       float64 position, float64 limit_kmh  [signs]
+
+Restoring rebuilds the global `cars` list with the same ids, intents and stats
+without going through CarLogic.__init__, so ids aren't consumed and no random
+draws are made; stepping on from a restore gives the same results as the
+uninterrupted run.
+"""
+import os
+import random
+import struct
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import engine
+from carlogic import Intent
+from carstats import cars
+
+MAGIC = b"SIMSNAP\0"
+VERSION = 1
+_HEADER = struct.Struct("<8sHIIQddIBd")
+_CAR = struct.Struct("<qddddddhhbdd?dd")
+_SIGN = struct.Struct("<dd")
+_CAR_FIELDS = ("id", "position", "speed", "speed_limit", "acceleration", "deceleration", "length",
+               "lane", "laneCount", "intent", "speed_preference", "elapsed_time", "finished", "max_speed", "min_speed")
+
+
+def take(signs, tick=0, dt=engine.DT, end_y_m=engine.END_Y_M, car_list=cars):
+    """Pack the current cars, signs (SpeedSigns or (position, limit_kmh) pairs) and RNG state."""
+    signs = [(s.position, s.limit_kmh) if hasattr(s, "limit_kmh") else tuple(s) for s in signs]
+    rng_version, mt, gauss = random.getstate()
+    parts = [
+        _HEADER.pack(MAGIC, VERSION, len(car_list), len(signs), tick, dt, end_y_m,
+                     rng_version, gauss is not None, gauss or 0.0),
+        array("I", mt).tobytes(),
+    ]
+    for c in car_list:
+        parts.append(_CAR.pack(c.id, c.position, c.speed, c.speed_limit, c.acceleration, c.deceleration,
+                               c.length, c.lane, c.laneCount, c.intent.value, c.speed_preference,
+                               c.elapsed_time, c.finished, c.max_speed, c.min_speed))
+    parts.extend(_SIGN.pack(*s) for s in signs)
+    return b"".join(parts)
+
+
+def restore(buf, car_cls=engine.Car, sign_cls=engine.SpeedSign):
+    """Rebuild `cars` and the RNG from a snapshot; returns (signs, tick, dt, end_y_m)."""
+    magic, version, n, n_signs, tick, dt, end_y_m, rng_version, has_gauss, gauss = _HEADER.unpack_from(buf)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"not a version {VERSION} snapshot")
+    offset = _HEADER.size
+
+    mt = array("I")
+    mt.frombytes(buf[offset:offset + 625 * mt.itemsize])
+    offset += 625 * mt.itemsize
+    random.setstate((rng_version, tuple(mt), gauss if has_gauss else None))
+
+    cars.clear()
+    for _ in range(n):
+        values = _CAR.unpack_from(buf, offset)
+        offset += _CAR.size
+        c = car_cls.__new__(car_cls)
+        c.__dict__.update(zip(_CAR_FIELDS, values))
+        c.intent = Intent(c.intent)
+        c.sprite = None
+        cars.append(c)
+
+    signs = []
+    for _ in range(n_signs):
+        signs.append(sign_cls(*_SIGN.unpack_from(buf, offset)))
+        offset += _SIGN.size
+    return signs, tick, dt, end_y_m
+
+
+class SnapshotAt:
+    """
+    Recorder for engine.run_simulation(telemetry=...) that takes a snapshot at
+    tick `tick`, or at the first tick where when(cars) is true.
+    """
+
+    def __init__(self, tick=None, when=None):
+        if (tick is None) == (when is None):
+            raise ValueError("give exactly one of tick / when")
+        self.tick = tick
+        self.when = when
+        self.signs = None  # filled in by engine.finish_run
+        self.snapshot = None
+        self._tick = 0
+
+    def record(self, car_list, dt):
+        self._tick += 1
+        if self.snapshot is not None:
+            return
+        if self._tick == self.tick or (self.when is not None and self.when(car_list)):
+            self.snapshot = take(self.signs, self._tick, dt, car_list=car_list)
+
+
+def apply_changes(signs, changes):
+    """
+    Apply a picklable description of a what-if to restored state:
+        {"cars": {index: {attribute: value}}, "signs": [(position, limit_kmh), ...]}
+    Car indexes are positions in `cars` (0 = player). Returns the (possibly new) signs.
+    """
+    for i, attrs in (changes.get("cars") or {}).items():
+        c = cars[i]
+        for name, value in attrs.items():
+            setattr(c, name, Intent(value) if name == "intent" else value)
+    if changes.get("signs") is not None:
+        signs = [engine.SpeedSign(p, lim) for p, lim in sorted(changes["signs"])]
+    return signs
+
+
+def continue_run(buf, changes=None, mutate=None, seed=None, telemetry=None, decide_every=1):
+    """
+    Restore a snapshot and step it to the end; returns run_simulation-style results.
+
+    `changes` goes through apply_changes(); `mutate(cars, signs)` is called after
+    that for anything it can't express (must be picklable to be used with fork()).
+    A seed reseeds the `random` module so forks don't share the snapshot's stream.
+    """
+    signs, tick, dt, end_y_m = restore(buf)
+    if changes:
+        signs = apply_changes(signs, changes)
+    if mutate is not None:
+        mutate(cars, signs)
+    if seed is not None:
+        random.seed(seed)
+    return engine.finish_run(signs, dt=dt, telemetry=telemetry, end_y_m=end_y_m, decide_every=decide_every, tick=tick)
+
+
+def _continue_chunk(args):
+    buf, jobs, mutate = args
+    return [continue_run(buf, changes, mutate, seed) for changes, seed in jobs]
+
+
+def fork(buf, n=None, variants=None, seeds=None, mutate=None, workers=None):
+    """
+    Run continuations of one snapshot in parallel; returns one result list per fork.
+
+    Give `n` identical forks, or a list of `variants` (changes dicts, None = as is).
+    `seeds` is either one base seed (fork i gets base + i) or a list, one per fork.
+    With workers=1 everything runs in this process.
+    """
+    if variants is None:
+        variants = [None] * (n or 1)
+    elif n is not None and n != len(variants):
+        raise ValueError("n doesn't match the number of variants")
+    count = len(variants)
+    if seeds is None:
+        seeds = [None] * count
+    elif isinstance(seeds, int):
+        seeds = [seeds + i for i in range(count)]
+    jobs = list(zip(variants, seeds))
+
+    if workers == 1 or count == 1:
+        return _continue_chunk((buf, jobs, mutate))
+
+    # The state and the simulator globals are per process, so each worker takes a
+    # contiguous slice of forks and the snapshot is shipped once per slice
+    workers = workers or os.cpu_count() or 1
+    size = -(-count // workers)
+    chunks = [(buf, jobs[i:i + size], mutate) for i in range(0, count, size)]
+    with ProcessPoolExecutor(max_workers=len(chunks)) as pool:
+        return [r for part in pool.map(_continue_chunk, chunks) for r in part]
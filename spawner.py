@@ -0,0 +1,61 @@
+# spawner.py
+"""
+Initial traffic for a road of any length from a target density or flow.
+
+engine.spawn_traffic places cars on a shuffled grid of screen-height slots,
+which caps traffic at HEIGHT / (CAR_H * 2) * lanes cars. Here each lane gets a
+Poisson number of cars for the target density (veh/km/lane) and positions are
+drawn uniformly subject to a minimum gap, all with array operations:
+
+    n cars in a lane of length L with spacing s = car length + min gap fit in
+    the free length F = L - length - (n - 1) * s; sorted uniform draws on [0, F]
+    plus k * s for the k-th car give every gap >= min gap, and the gaps beyond
+    that are as random as the density allows (exponential-like when sparse).
+
+A flow target (veh/h/lane) is turned into a density at the initial mean speed.
+"""
+import numpy as np
+
+from engine import CAR_H
+
+MIN_GAP_M = 2.0  # bumper to bumper (m)
+
+
+def density_from_flow(flow_per_h, speed_kmh):
+    """veh/km/lane for a flow of veh/h/lane moving at speed_kmh."""
+    return flow_per_h / speed_kmh
+
+
+def capacity(length_m, min_gap_m=MIN_GAP_M, car_length=CAR_H):
+    """Most cars one lane of length_m holds with min_gap_m between them."""
+    return max(0, int((length_m - car_length) // (car_length + min_gap_m)) + 1)
+
+
+def place(length_m, lanes, density_per_km=None, count=None, min_gap_m=MIN_GAP_M, car_length=CAR_H, rng=None,
+          poisson=True):
+    """
+    (position, lane) arrays of cars on [0, length_m), sorted by lane then position.
+    Give density_per_km (veh/km/lane; Poisson counts per lane, or rounded with
+    poisson=False) or a total count (spread evenly over the lanes at random).
+    Lanes are capped at capacity(), so a too-high target gives a jammed road.
+    """
+    if (density_per_km is None) == (count is None):
+        raise ValueError("give exactly one of density_per_km / count")
+    rng = np.random.default_rng(rng)
+    cap = capacity(length_m, min_gap_m, car_length)
+    if count is not None:
+        per_lane = rng.multinomial(count, np.full(lanes, 1.0 / lanes))
+    elif poisson:
+        per_lane = rng.poisson(density_per_km * length_m / 1000.0, lanes)
+    else:
+        per_lane = np.full(lanes, int(round(density_per_km * length_m / 1000.0)))
+    per_lane = np.minimum(per_lane, cap)
+
+    spacing = car_length + min_gap_m
+    free = length_m - car_length - (per_lane - 1) * spacing
+    lane = np.repeat(np.arange(lanes), per_lane)
+    u = rng.random(len(lane)) * free[lane]
+    u = u[np.lexsort((u, lane))]  # lane stays grouped (already sorted), u sorted within each lane
+    first = np.concatenate(([0], np.cumsum(per_lane)[:-1]))
+    rank = np.arange(len(lane)) - first[lane]
+    return u + rank * spacing, lane
@@ -0,0 +1,259 @@
+# surrogate.py
+"""
+Finish-time distribution emulator over stored Monte Carlo results.
+
+Each stored scenario (cars, lanes, speed limit) is reduced to the empirical
+CDF of all finish times on a fixed time grid, plus its standard error from the
+run-to-run spread. A query interpolates the CDFs of the scenarios around it:
+multilinear when the stored scenarios form a full grid, inverse-distance
+weighting otherwise. Quantiles are read off the interpolated CDF, and
+P(t < T) is the CDF at T (in percent, like analysis.summarize_results).
+
+Every answer carries a standard error made of
+    sampling       the neighbours' CDF standard errors, combined with the weights
+    interpolation  leave-one-out error of the stored scenarios, scaled by how far
+                   the query is from the nearest stored one
+Queries outside the trained region (outside the parameter box, or further from
+every stored scenario than they are from each other) are answered by running
+the simulation instead, and say so in "source".
+
+Scenarios come from runlog.RunLog directories (monte --log), so every sweep
+that was logged can be used as training data; train() fills a grid of them.
+"""
+import itertools
+import json
+import os
+
+import numpy as np
+
+PARAMS = ("num_traffic", "lanes", "speed_limit_kmh")
+TIME_GRID = np.arange(0.0, 120.0 + 1e-9, 0.25)  # s
+QUANTILES = (0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 0.95)
+
+
+def distribution(results, grid=TIME_GRID):
+    """(cdf, cdf_se, runs, finishes) of run_monte_carlo-style results: P(t < grid) over all finishes."""
+    runs = len(results)
+    counts = np.array([sum(1 for _, _, f in run if f) for run in results])
+    times = np.full((runs, max(1, counts.max(initial=0))), np.inf)
+    for r, run in enumerate(results):
+        finished = [t for _, t, f in run if f]
+        times[r, :len(finished)] = finished
+    under = np.empty((runs, len(grid)), dtype=np.int64)  # finishes under each grid time, per run
+    for r0 in range(0, runs, 1000):
+        under[r0:r0 + 1000] = (times[r0:r0 + 1000, :, None] < grid).sum(axis=1)
+    total = counts.sum()
+    cdf = under.sum(axis=0) / max(total, 1)
+    # Ratio estimator over runs: per-run residuals of finishes under vs finishes
+    resid = under - cdf * counts[:, None]
+    mean_count = counts.mean() if runs else 1.0
+    se = np.sqrt((resid ** 2).sum(axis=0) / max(runs - 1, 1) / max(runs, 1)) / max(mean_count, 1e-12)
+    return cdf, se, runs, int(total)
+
+
+class Surrogate:
+    """Stored scenarios' finish-time CDFs; query() interpolates them."""
+
+    def __init__(self, params, cdf, cdf_se, runs, finishes, grid=TIME_GRID):
+        self.params = np.asarray(params, dtype=float)  # (scenarios, len(PARAMS))
+        self.cdf = np.asarray(cdf, dtype=float)
+        self.cdf_se = np.asarray(cdf_se, dtype=float)
+        self.runs = np.asarray(runs)
+        self.finishes = np.asarray(finishes)
+        self.grid = np.asarray(grid, dtype=float)
+        self.lo = self.params.min(axis=0)
+        self.hi = self.params.max(axis=0)
+        self._span = np.where(self.hi > self.lo, self.hi - self.lo, 1.0)
+        self._axes = [np.unique(self.params[:, d]) for d in range(self.params.shape[1])]
+        self._index = {tuple(p): i for i, p in enumerate(self.params)}
+        self.full_grid = len(self._index) == int(np.prod([len(a) for a in self._axes]))
+        unit = self._unit(self.params)
+        if len(unit) > 1:
+            d = np.sqrt(((unit[:, None] - unit[None]) ** 2).sum(-1))
+            np.fill_diagonal(d, np.inf)
+            self.spacing = float(d.min(axis=1).max())
+        else:
+            self.spacing = 0.0
+        self.loo_rmse = self._leave_one_out()
+
+    # --- building ---
+
+    @classmethod
+    def from_runlogs(cls, paths, grid=TIME_GRID):
+        """One scenario per runlog directory (its manifest scenario; other keys are ignored)."""
+        from runlog import RunLog
+
+        rows = {}
+        for path in paths:
+            log = RunLog(path)
+            key = tuple(float(log.scenario[p]) for p in PARAMS)
+            results = log.results()
+            if results:
+                rows.setdefault(key, []).extend(results)
+        if not rows:
+            raise ValueError("no logged runs to train on")
+        params, stats = [], []
+        for key, results in sorted(rows.items()):
+            params.append(key)
+            stats.append(distribution(results, grid))
+        cdf, se, runs, finishes = zip(*stats)
+        return cls(params, cdf, se, runs, finishes, grid)
+
+    def to_dict(self):
+        return {"params": PARAMS, "grid": self.grid.tolist(), "scenarios": [
+            {"params": p.tolist(), "runs": int(r), "finishes": int(f), "cdf": c.tolist(), "cdf_se": s.tolist()}
+            for p, r, f, c, s in zip(self.params, self.runs, self.finishes, self.cdf, self.cdf_se)]}
+
+    @classmethod
+    def from_dict(cls, d):
+        sc = d["scenarios"]
+        return cls([s["params"] for s in sc], [s["cdf"] for s in sc], [s["cdf_se"] for s in sc],
+                   [s["runs"] for s in sc], [s["finishes"] for s in sc], d["grid"])
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+    # --- interpolation ---
+
+    def _unit(self, x):
+        return (np.asarray(x, dtype=float) - self.lo) / self._span
+
+    def _grid_weights(self, x):
+        """Multilinear corner weights on the full grid: (indices, weights)."""
+        brackets = []
+        for d, axis in enumerate(self._axes):
+            if len(axis) == 1:
+                brackets.append(((axis[0], 1.0),))
+                continue
+            j = int(np.clip(np.searchsorted(axis, x[d], "right") - 1, 0, len(axis) - 2))
+            f = (x[d] - axis[j]) / (axis[j + 1] - axis[j])
+            brackets.append(((axis[j], 1.0 - f), (axis[j + 1], f)))
+        idx, w = [], []
+        for corner in itertools.product(*brackets):
+            weight = float(np.prod([cw for _, cw in corner]))
+            if weight > 0:
+                idx.append(self._index[tuple(v for v, _ in corner)])
+                w.append(weight)
+        return np.array(idx), np.array(w)
+
+    def _idw_weights(self, x, exclude=None, k=None):
+        """Inverse-distance-squared weights of the k nearest scenarios: (indices, weights)."""
+        d = np.sqrt(((self._unit(self.params) - self._unit(x)) ** 2).sum(-1))
+        if exclude is not None:
+            d[exclude] = np.inf
+        k = min(k or 2 ** self.params.shape[1], np.isfinite(d).sum())
+        idx = np.argsort(d)[:k]
+        if d[idx[0]] == 0:
+            return idx[:1], np.ones(1)
+        w = 1.0 / d[idx] ** 2
+        return idx, w / w.sum()
+
+    def _weights(self, x):
+        return self._grid_weights(x) if self.full_grid else self._idw_weights(x)
+
+    def _leave_one_out(self):
+        """RMS CDF error predicting each stored scenario from the others (IDW), per grid point."""
+        if len(self.params) < 2:
+            return np.zeros_like(self.grid)
+        errs = []
+        for i in range(len(self.params)):
+            idx, w = self._idw_weights(self.params[i], exclude=i)
+            errs.append(w @ self.cdf[idx] - self.cdf[i])
+        return np.sqrt(np.mean(np.square(errs), axis=0))
+
+    def in_region(self, x):
+        x = np.asarray(x, dtype=float)
+        if np.any(x < self.lo - 1e-9) or np.any(x > self.hi + 1e-9):
+            return False
+        nearest = np.sqrt(((self._unit(self.params) - self._unit(x)) ** 2).sum(-1)).min()
+        return nearest <= self.spacing + 1e-9
+
+    def query(self, x, thresholds=(25.0,), quantiles=QUANTILES):
+        """Interpolated answer for x = (num_traffic, lanes, speed_limit_kmh); None outside the region."""
+        x = np.asarray(x, dtype=float)
+        if not self.in_region(x):
+            return None
+        idx, w = self._weights(x)
+        cdf = np.maximum.accumulate(np.clip(w @ self.cdf[idx], 0.0, 1.0))
+        sampling = np.sqrt((w ** 2) @ (self.cdf_se[idx] ** 2))
+        nearest = np.sqrt(((self._unit(self.params) - self._unit(x)) ** 2).sum(-1)).min()
+        interp = self.loo_rmse * (min(1.0, nearest / self.spacing) if self.spacing else 0.0)
+        se = np.sqrt(sampling ** 2 + interp ** 2)
+        return _answer(self.grid, cdf, se, thresholds, quantiles, source="surrogate",
+                       neighbours=[self.params[i].tolist() for i in idx])
+
+
+def _answer(grid, cdf, se, thresholds, quantiles, **extra):
+    out = {"prob_under": {}, "quantiles": {}}
+    for T in thresholds:
+        p = float(np.interp(T, grid, cdf))
+        out["prob_under"][str(T)] = {"value": p * 100, "se": float(np.interp(T, grid, se)) * 100}
+    slope = np.gradient(cdf, grid)
+    for q in quantiles:
+        j = int(np.searchsorted(cdf, q, "left"))
+        if j >= len(grid) or cdf[-1] < q:
+            out["quantiles"][str(q)] = {"value": None, "se": None}
+            continue
+        if j == 0:
+            t = float(grid[0])
+        else:  # linear between the grid points around the crossing
+            c0, c1 = cdf[j - 1], cdf[j]
+            t = float(grid[j - 1] + (q - c0) / (c1 - c0) * (grid[j] - grid[j - 1])) if c1 > c0 else float(grid[j])
+        dens = max(float(np.interp(t, grid, slope)), 1e-6)
+        out["quantiles"][str(q)] = {"value": t, "se": float(np.interp(t, grid, se)) / dens}
+    out.update(extra)
+    return out
+
+
+def simulate(x, runs=200, seed=0, thresholds=(25.0,), quantiles=QUANTILES, grid=TIME_GRID):
+    """The fallback: run the scenario and answer the same way from its own CDF."""
+    import engine
+    from progress import Progress
+
+    num_traffic, lanes, limit = x
+    results = engine.run_monte_carlo(num_runs=runs, num_traffic=int(num_traffic), speed_limit_kmh=float(limit),
+                                     lanes=int(lanes), seed=seed, progress=Progress(runs))
+    cdf, se, _, finishes = distribution(results, grid)
+    return _answer(grid, cdf, se, thresholds, quantiles, source="simulation", runs=runs, finishes=finishes)
+
+
+def answer(model, x, thresholds=(25.0,), quantiles=QUANTILES, fallback_runs=200, seed=0):
+    """model.query(), or simulate() when x is outside the trained region (model may be None)."""
+    out = model.query(x, thresholds, quantiles) if model is not None else None
+    if out is None:
+        out = simulate(x, fallback_runs, seed, thresholds, quantiles)
+    out["scenario"] = dict(zip(PARAMS, (int(x[0]), int(x[1]), float(x[2]))))
+    return out
+
+
+def train(log_root, cars, lanes, speed_limits, runs=200, seed=0, run=None, **engine_options):
+    """
+    Fill log_root/<cars>_<lanes>_<limit> run logs for every grid scenario (resuming any
+    that are partly done) and build a Surrogate from them. run(first_run, n, scenario, seed),
+    e.g. a cli.run_batch wrapper, replaces engine.run_monte_carlo's serial loop; engine_options
+    (engine, sub_steps, decision_hz) are what it runs with, recorded in the logs like monte --log does.
+    """
+    import engine
+    from runlog import SCENARIO_DEFAULTS, RunLog, run_logged
+    from runlog import scenario as log_scenario
+
+    if run is None and any(engine_options.get(k, d) != d for k, d in SCENARIO_DEFAULTS.items()):
+        raise ValueError("engine options other than the defaults need a run function")
+    paths = []
+    for n, l, v in itertools.product(cars, lanes, speed_limits):
+        scenario = log_scenario(n, v, l, **engine_options)
+        path = os.path.join(log_root, f"{n}_{l}_{v:g}")
+        if run is None:
+            engine.run_monte_carlo(num_runs=runs, log_dir=path, seed=seed, batch_runs=max(1, runs // 4),
+                                   num_traffic=int(n), speed_limit_kmh=float(v), lanes=int(l))
+        else:
+            run_logged(RunLog(path, scenario, seed), runs, lambda first, count: run(first, count, scenario, seed),
+                       batch_runs=max(1, runs // 4))
+        paths.append(path)
+    return Surrogate.from_runlogs(paths)
@@ -0,0 +1,130 @@
+# telemetry.py
+import numpy as np
+from carlogic import Intent
+
+INTENT_COUNT = len(Intent)
+
+
+class Telemetry:
+    """
+    Records position / speed / lane / intent of every car each sampled tick.
+
+    Samples go into preallocated chunks of `chunk_size` rows (one row per sample,
+    one column per car) so the hot loop only does a row write; all the stats
+    that CarStats tracks per car per tick are derived in bulk by summary().
+    """
+
+    def __init__(self, sample_every: int = 1, chunk_size: int = 1024):
+        if sample_every < 1:
+            raise ValueError("sample_every must be >= 1")
+        self.sample_every = sample_every
+        self.chunk_size = chunk_size
+        self.num_cars = 0
+        self.car_ids = None
+        self.signs = None  # [(position, limit_kmh)], filled in by engine.run_simulation
+        self.clock = 0.0
+        self._tick = 0
+        self._row = 0
+        self._chunks = []
+
+    def _new_chunk(self):
+        n, rows = self.num_cars, self.chunk_size
+        self._chunks.append((
+            np.empty(rows, dtype=np.float64),         # time
+            np.empty((rows, n), dtype=np.float64),    # position (m)
+            np.empty((rows, n), dtype=np.float32),    # speed (m/s)
+            np.empty((rows, n), dtype=np.int8),       # lane
+            np.empty((rows, n), dtype=np.int8),       # intent
+        ))
+        self._row = 0
+
+    def record(self, cars, dt: float):
+        """Advance the clock by dt and store a row if this tick is sampled."""
+        self.clock += dt
+        self._tick += 1
+        if self._tick % self.sample_every:
+            return
+
+        if self.car_ids is None:
+            self.num_cars = len(cars)
+            self.car_ids = np.array([c.id for c in cars], dtype=np.int64)
+            self._new_chunk()
+        elif self._row == self.chunk_size:
+            self._new_chunk()
+
+        t, pos, spd, lane, intent = self._chunks[-1]
+        row = self._row
+        t[row] = self.clock
+        pos[row] = [c.position for c in cars]
+        spd[row] = [c.speed for c in cars]
+        lane[row] = [c.lane for c in cars]
+        intent[row] = [c.intent.value for c in cars]
+        self._row += 1
+
+    @property
+    def samples(self) -> int:
+        if not self._chunks:
+            return 0
+        return (len(self._chunks) - 1) * self.chunk_size + self._row
+
+    def trajectories(self) -> dict:
+        """All samples as contiguous arrays: time (S,) and per-car (S, N) arrays."""
+        if not self._chunks:
+            empty = np.empty((0, 0))
+            return {"time": np.empty(0), "position": empty, "speed": empty, "lane": empty, "intent": empty}
+
+        last = self._row
+        parts = [list(chunk) for chunk in self._chunks[:-1]]
+        parts.append([a[:last] for a in self._chunks[-1]])
+        names = ("time", "position", "speed", "lane", "intent")
+        return {name: np.concatenate([p[i] for p in parts]) for i, name in enumerate(names)}
+
+    def summary(self, end_position: float | None = None) -> dict:
+        """
+        Per-car stats derived from the recorded samples.
+
+        If end_position is given, samples after a car crossed it are ignored,
+        so avg/min speed and intent times only cover the time on the road.
+        Lane changes are counted between consecutive samples, so with
+        sample_every > 1 a change that is undone before the next sample is missed.
+        """
+        tr = self.trajectories()
+        time, pos, spd = tr["time"], tr["position"], tr["speed"].astype(np.float64)
+        lane, intent = tr["lane"], tr["intent"]
+        n = pos.shape[1]
+
+        # Each sample stands for the time since the previous one
+        weights = np.diff(time, prepend=0.0)[:, None]
+        if end_position is None:
+            active = np.ones(pos.shape, dtype=bool)
+        else:
+            # A car is still driving in a sample if it hadn't crossed the line at the previous one
+            active = np.ones(pos.shape, dtype=bool)
+            active[1:] = pos[:-1] < end_position
+
+        w = weights * active
+        on_road_time = w.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            avg_speed = np.where(on_road_time > 0, (spd * w).sum(axis=0) / on_road_time, 0.0)
+
+        max_speed = np.where(active, spd, -np.inf).max(axis=0, initial=-np.inf)
+        min_speed = np.where(active, spd, np.inf).min(axis=0, initial=np.inf)
+
+        changes = (np.diff(lane, axis=0) != 0) & active[1:]
+        lane_changes = changes.sum(axis=0)
+
+        # time_in_intent[car, intent] via one bincount over (car, intent) pairs
+        keys = np.arange(n)[None, :] * INTENT_COUNT + intent.astype(np.int64)
+        time_in_intent = np.bincount(
+            keys.ravel(), weights=np.broadcast_to(w, keys.shape).ravel(), minlength=n * INTENT_COUNT
+        ).reshape(n, INTENT_COUNT)
+
+        return {
+            "car_id": self.car_ids if self.car_ids is not None else np.empty(0, dtype=np.int64),
+            "elapsed_time": on_road_time,
+            "max_speed": max_speed,
+            "min_speed": min_speed,
+            "avg_speed": avg_speed,
+            "lane_changes": lane_changes,
+            "time_in_intent": time_in_intent,
+        }
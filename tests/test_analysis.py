@@ -0,0 +1,10 @@
+import analysis
+
+
+def test_sequential_summary_skipped_slots():
+    s = analysis.SequentialSummary(time_threshold=20.0)
+    s.add([[(0, 30.0, False), (1, 10.0, False), (2, 15.0, True)]])
+    s.add([[(0, 18.0, True), (1, 12.0, False), (2, 25.0, True)]])
+    assert s.runs == 2 and s.finishes == 3 and s.under == 2
+    assert sorted(s.mean_intervals()) == [0, 2]
+    assert s.mean_intervals()[2][0] == 20.0
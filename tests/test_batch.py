@@ -0,0 +1,19 @@
+import numpy as np
+
+import batch
+import cli
+
+
+def _finish_times(results):
+    return np.array([t for run in results for _, t, finished in run if finished])
+
+
+def test_batch_distribution_matches_object_engine():
+    worlds = batch.run_batch_worlds(1000, seed=1)
+    objects = cli.run_batch(300, seed=2)
+    assert len(worlds) == 1000 and all(len(run) == len(objects[0]) for run in worlds)
+    a, b = _finish_times(worlds), _finish_times(objects)
+    # Different seeds, so only the distributions can agree: loose bounds a few standard errors wide
+    assert abs(a.mean() - b.mean()) < 0.6
+    assert abs(a.std() - b.std()) < 0.6
+    assert abs((a < 25.0).mean() - (b < 25.0).mean()) < 0.04
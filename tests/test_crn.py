@@ -0,0 +1,12 @@
+import random
+
+import crn
+
+
+def test_antithetic_mirrors_floats_only():
+    plain, anti = random.Random("x"), crn.AntitheticRandom("x")
+    for _ in range(100):
+        assert anti.random() == 1.0 - plain.random()
+        assert anti.randrange(7) == plain.randrange(7)
+        assert anti.choice("abcdefghij") == plain.choice("abcdefghij")
+        assert anti.randint(0, 10 ** 30) == plain.randint(0, 10 ** 30)
@@ -0,0 +1,32 @@
+import socket
+
+import pytest
+
+import cli
+import distributed
+
+
+def _times(results):
+    return [[(t, f) for _, t, f in run] for run in results]
+
+
+def test_matches_run_batch():
+    results, state = distributed.run_distributed(30, seed=11, num_traffic=4, batch_runs=7, local_workers=1,
+                                                 timeout=120)
+    assert state["done"] == state["total"] == 5
+    assert _times(results) == _times(cli.run_batch(30, seed=11, num_traffic=4))
+
+
+def test_two_boards_in_one_process():
+    boards = [distributed.TaskBoard(), distributed.TaskBoard()]
+    for k, board in enumerate(boards):
+        board.publish([(f"task{k}", {"k": k})])
+    servers = [distributed.serve(board, authkey=b"key") for board in boards]
+    try:
+        taken = [distributed.connect(s.address, b"key").take("w") for s in servers]
+        assert taken == [[("task0", {"k": 0})], [("task1", {"k": 1})]]
+    finally:
+        for s in servers:
+            distributed.stop(s)
+    with pytest.raises(OSError):
+        socket.create_connection(servers[0].address, timeout=1.0)
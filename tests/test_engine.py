@@ -0,0 +1,44 @@
+import random
+
+import pytest
+
+import engine
+from carstats import cars
+
+
+def _times(results):
+    return [(t, f) for _, t, f in results]
+
+
+def _run_with_update(num_traffic, lanes):
+    """run_simulation as it was before decide() / integrate() were split: update() every tick."""
+    engine.spawn_traffic(None, engine.START_Y_M, 120.0, count=num_traffic, lanes=lanes)
+    signs = engine.build_signs(engine.END_Y_M)
+    while not all(c.finished for c in cars):
+        for c in cars:
+            engine.apply_signs(c, signs)
+            c.update(engine.DT)
+            c.position += c.speed * engine.DT
+            if c.position >= engine.END_Y_M:
+                c.finished = True
+    return [(c.id, c.elapsed_time, c.finished) for c in cars]
+
+
+@pytest.mark.parametrize("num_traffic, lanes", [(6, 5), (20, 3)])
+def test_default_decisions_match_update_path(num_traffic, lanes):
+    for seed in range(20):
+        random.seed(seed)
+        expected = _run_with_update(num_traffic, lanes)
+        random.seed(seed)
+        assert _times(engine.run_simulation(None, num_traffic=num_traffic, lanes=lanes)) == _times(expected), seed
+
+
+def test_pooled_runs_match_fresh_cars():
+    pool = engine.VehiclePool()
+    for seed in range(20):
+        num_traffic = 4 + seed % 3 * 8  # the pool also has to grow and shrink between runs
+        random.seed(seed)
+        fresh = engine.run_simulation(None, num_traffic=num_traffic)
+        random.seed(seed)
+        pooled = engine.run_simulation(None, num_traffic=num_traffic, pool=pool)
+        assert _times(pooled) == _times(fresh), seed
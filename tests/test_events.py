@@ -0,0 +1,24 @@
+import random
+
+import pytest
+
+import engine
+import events
+
+
+@pytest.mark.parametrize("num_traffic, lanes", [(6, 5), (20, 3), (40, 5), (10, 2)])
+def test_event_engine_matches_object_engine(num_traffic, lanes):
+    for seed in range(25):
+        random.seed(seed)
+        expected = engine.run_simulation(None, num_traffic=num_traffic, lanes=lanes)
+        random.seed(seed)
+        got = events.run_event_simulation(None, num_traffic=num_traffic, lanes=lanes)
+        assert [(t, f) for _, t, f in got] == [(t, f) for _, t, f in expected], seed
+
+
+def test_jump_elapsed_time_matches_tick_by_tick_sum():
+    elapsed = 0.0
+    for k in range(1, 50_001):
+        elapsed += engine.DT
+        assert round(elapsed / engine.DT) == k
+        assert events._elapsed_after(k, engine.DT) == elapsed
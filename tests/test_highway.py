@@ -0,0 +1,78 @@
+import multiprocessing
+import os
+import time
+
+import numpy as np
+import pytest
+
+import highway
+from conflicts import ConflictCounter
+
+
+def _assert_same(a, b):
+    (ids_a, times_a, finished_a), ticks_a = a
+    (ids_b, times_b, finished_b), ticks_b = b
+    assert ticks_a == ticks_b
+    assert np.array_equal(ids_a, ids_b) and np.array_equal(times_a, times_b)
+    assert np.array_equal(finished_a, finished_b)
+
+
+@pytest.mark.parametrize("kernel, length_m, segments, ticks", [
+    ("reference", 4000.0, 3, None),  # to the end, so segments empty out
+    ("idm", 8000.0, 2, 400),         # IDM looks a few km ahead: longer segments
+    ("mobil", 8000.0, 2, 400),
+])
+def test_split_matches_single_process(kernel, length_m, segments, ticks):
+    hw = highway.make_highway(length_m, 3, density_per_km=8, seed=5)
+    single = highway.run_highway(hw, max_ticks=ticks, kernel=kernel)
+    _assert_same(highway.run_decomposed(hw, segments, max_ticks=ticks, kernel=kernel), single)
+
+
+@pytest.mark.parametrize("kernel, length_m, segments", [("reference", 4000.0, 3), ("mobil", 8000.0, 2)])
+@pytest.mark.parametrize("arbitrate", [False, True])
+def test_split_conflicts_match_single_process(kernel, length_m, segments, arbitrate):
+    hw = highway.make_highway(length_m, 3, density_per_km=10, seed=6)
+    counters = [ConflictCounter(end_m=hw.length_m), ConflictCounter(end_m=hw.length_m)]
+    single = highway.run_highway(hw, kernel=kernel, conflicts=counters[0], arbitrate=arbitrate)
+    split = highway.run_decomposed(hw, segments, kernel=kernel, conflicts=counters[1], arbitrate=arbitrate)
+    _assert_same(split, single)
+    assert counters[1].stats() == counters[0].stats()
+    if arbitrate:
+        assert counters[0].lane_change_conflicts > 0
+
+
+def _failing_advance(fail):
+    calls = []
+
+    def advance(*args, **kwargs):
+        calls.append(None)
+        if len(calls) == 5:
+            fail()
+        return real_advance(*args, **kwargs)
+
+    real_advance = highway.advance
+    return advance
+
+
+def _raise():
+    raise ZeroDivisionError("boom")
+
+
+@pytest.mark.parametrize("fail, match", [(_raise, "ZeroDivisionError: boom"), (lambda: os._exit(3), "died")])
+def test_worker_failure_is_raised(monkeypatch, fail, match):
+    # Workers are forked, so they see the patched advance
+    monkeypatch.setattr(highway, "advance", _failing_advance(fail))
+    hw = highway.make_highway(4000.0, 3, density_per_km=8, seed=5)
+    t0 = time.monotonic()
+    with pytest.raises(RuntimeError, match=match):
+        highway.run_decomposed(hw, 3, max_ticks=50)
+    assert time.monotonic() - t0 < 10
+
+
+def test_reach_checked_before_workers_start():
+    hw = highway.make_highway(1000.0, 3, density_per_km=8, seed=5)
+    t0 = time.monotonic()
+    with pytest.raises(ValueError, match="segment"):
+        highway.run_decomposed(hw, 4, kernel="idm")
+    assert time.monotonic() - t0 < 1
+    assert not multiprocessing.active_children()
@@ -0,0 +1,33 @@
+import math
+import random
+import tracemalloc
+
+import engine
+from carstats import cars
+
+TICKS = 1000
+MAX_NET_BYTES = 4096  # over all TICKS: a per-tick allocation that sticks would blow through this
+
+
+def test_step_keeps_no_memory():
+    random.seed(3)
+    engine.spawn_traffic(None, engine.START_Y_M, 120.0, count=40, lanes=5)
+    signs = engine.build_signs()
+    tick = 0
+
+    def run(n):
+        nonlocal tick
+        for _ in range(n):
+            engine.step(cars, signs, engine.DT, math.inf, 1, tick)  # line at infinity: every car stays live
+            tick += 1
+
+    run(300)  # warm up: lane changes settle, attribute dicts reach their final size
+    tracemalloc.start()
+    try:
+        run(10)
+        before = tracemalloc.get_traced_memory()[0]
+        run(TICKS)
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    assert after - before < MAX_NET_BYTES
@@ -0,0 +1,60 @@
+import os
+
+import cli
+import engine
+import runlog
+
+
+def _batch(first, n):
+    return cli.run_batch(n, seed=7, num_traffic=3, first_run=first)
+
+
+def _times(results):
+    """Car ids come from a process-wide counter, so compare runs by their times."""
+    return [[(t, f) for _, t, f in run] for run in results]
+
+
+def test_resume_matches_one_go(tmp_path):
+    once = cli.run_batch(10, seed=7, num_traffic=3)
+    log = runlog.RunLog(str(tmp_path), runlog.scenario(3, 120.0, 5), seed=7)
+    runlog.run_logged(log, 4, _batch, batch_runs=2)
+    log = runlog.RunLog(str(tmp_path), runlog.scenario(3, 120.0, 5), seed=7)
+    assert log.runs_done == 4
+    assert _times(runlog.run_logged(log, 10, _batch, batch_runs=3)) == _times(once)
+
+
+def test_truncated_log_is_rebuilt(tmp_path):
+    log = runlog.RunLog(str(tmp_path), runlog.scenario(3, 120.0, 5), seed=7)
+    runlog.run_logged(log, 10, _batch, batch_runs=5)
+    with open(log.log_path, "r+b") as f:
+        f.truncate(os.path.getsize(log.log_path) - 50)
+
+    log = runlog.RunLog(str(tmp_path))
+    assert log.runs_done == 5 and log.missing(10) == [(5, 10)]
+    assert _times(runlog.run_logged(log, 10, _batch, batch_runs=5)) == _times(cli.run_batch(10, seed=7, num_traffic=3))
+
+
+def test_corrupt_covered_record_is_cut(tmp_path):
+    log = runlog.RunLog(str(tmp_path), runlog.scenario(3, 120.0, 5), seed=7)
+    runlog.run_logged(log, 6, _batch, batch_runs=2)
+    with open(log.log_path, "r+b") as f:
+        f.seek(runlog._RECORD.size + 3)  # inside the first record's payload
+        byte = f.read(1)
+        f.seek(-1, 1)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+    log = runlog.RunLog(str(tmp_path))
+    assert log.runs_done == 0 and log.log_bytes == 0 and os.path.getsize(log.log_path) == 0
+
+
+def test_results_by_run_id(tmp_path):
+    log = runlog.RunLog(str(tmp_path), runlog.scenario(3, 120.0, 5), seed=7)
+    log.append(4, _batch(4, 2))
+    log.append(0, _batch(0, 2))
+    assert _times(log.results(5)) == _times(_batch(0, 2) + _batch(4, 1))
+
+
+def test_run_monte_carlo_log_resumes_with_cli_scenario(tmp_path):
+    engine.run_monte_carlo(num_runs=3, num_traffic=3, log_dir=str(tmp_path), seed=7, progress=None)
+    log = runlog.RunLog(str(tmp_path), runlog.scenario(3, 120.0, 5, engine="object", sub_steps=1, decision_hz=None), 7)
+    assert log.runs_done == 3
@@ -0,0 +1,104 @@
+import asyncio
+import json
+
+import pytest
+
+import service
+
+
+async def _raw(host, port, data):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(data)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    writer.close()
+    return status
+
+
+def test_submit_and_stream():
+    async def main():
+        svc = service.SimulationService(workers=1)
+        host, port = await svc.start(port=0)
+        try:
+            status, body = await service.request(host, port, "POST", "/scenarios",
+                                                 {"mode": "monte", "num_runs": 3, "num_cars": 2})
+            assert status == 202
+            messages = [m async for m in service.stream(host, port, body["id"])]
+            status, job = await service.request(host, port, "GET", f"/scenarios/{body['id']}")
+        finally:
+            await svc.stop()
+        return messages, status, job
+
+    messages, status, job = asyncio.run(main())
+    assert [m["done"] for m in messages if m["type"] == "progress"] == [1, 2, 3]
+    assert messages[-1]["type"] == "result" and messages[-1]["status"] == "done"
+    assert status == 200 and job["result"] == messages[-1]["result"]
+
+
+@pytest.mark.parametrize("data", [
+    b"garbage\r\n\r\n",
+    b"POST /scenarios HTTP/1.1\r\nContent-Length: lots\r\n\r\n",
+    b"GET /scenarios/1/stream HTTP/1.1\r\nUpgrade: websocket\r\n\r\n",
+])
+def test_bad_requests(data):
+    async def main():
+        svc = service.SimulationService(workers=1)
+        host, port = await svc.start(port=0)
+        try:
+            svc.jobs["1"] = service.Job("1", {"mode": "sim"})
+            return await _raw(host, port, data)
+        finally:
+            await svc.stop()
+
+    assert asyncio.run(main()) == 400
+
+
+@pytest.mark.parametrize("value", [6.7, True, "six"])
+def test_parse_scenario_rejects_non_integers(value):
+    with pytest.raises(ValueError):
+        service.parse_scenario({"mode": "sim", "num_cars": value})
+    assert service.parse_scenario({"mode": "sim", "num_cars": 6.0})["num_cars"] == 6
+
+
+def test_messages_are_capped():
+    async def main():
+        job = service.Job("1", {})
+        for i in range(job.MAX_MESSAGES + 5):
+            job.publish({"type": "tick", "i": i})
+        kept, seq = await job.since(0)
+        return job, kept, seq
+
+    job, kept, seq = asyncio.run(main())
+    assert len(kept) == job.MAX_MESSAGES and kept[0]["i"] == 5 and seq == job.MAX_MESSAGES + 5
+
+
+@pytest.mark.parametrize("body", ['{"mode": "sim", "speed_limit": NaN}', '{"mode": "sim", "speed_limit": Infinity}',
+                                  '{"mode": "monte", "threshold": "nan"}', '{"mode": "monte", "num_runs": 1e300}'])
+def test_parse_scenario_rejects_non_finite(body):
+    with pytest.raises(ValueError):
+        service.parse_scenario(json.loads(body))
+
+
+def test_parse_scenario_limits():
+    with pytest.raises(ValueError):
+        service.parse_scenario({"mode": "monte", "num_runs": 10 ** 12})
+    with pytest.raises(ValueError):
+        service.parse_scenario({"mode": "sim", "num_cars": 10 ** 9})
+    assert service.parse_scenario({"mode": "sim", "num_cars": 500}, {**service.SCENARIO_LIMITS, "num_cars": 500})
+
+
+def test_finished_jobs_are_evicted():
+    async def main():
+        svc = service.SimulationService(workers=1, max_finished=1)
+        host, port = await svc.start(port=0)
+        try:
+            ids = []
+            for _ in range(2):
+                _, body = await service.request(host, port, "POST", "/scenarios", {"mode": "monte", "num_runs": 1})
+                ids.append(body["id"])
+                [m async for m in service.stream(host, port, body["id"])]
+            return [(await service.request(host, port, "GET", f"/scenarios/{i}"))[0] for i in ids], len(svc.jobs)
+        finally:
+            await svc.stop()
+
+    assert asyncio.run(main()) == ([404, 200], 1)
@@ -0,0 +1,27 @@
+import random
+
+import engine
+import snapshot
+
+
+def _snapshot(seed, tick=25, **kwargs):
+    random.seed(seed)
+    rec = snapshot.SnapshotAt(tick=tick)
+    return engine.run_simulation(None, num_traffic=20, telemetry=rec, **kwargs), rec.snapshot
+
+
+def test_continue_equals_uninterrupted_run():
+    for seed in range(10):
+        full, buf = _snapshot(seed, decision_hz=2)
+        assert snapshot.continue_run(buf, decide_every=engine.decision_interval(engine.DT, 2)) == full
+
+
+def test_forks_match_in_process_and_in_workers():
+    full, buf = _snapshot(4)
+    plain = snapshot.fork(buf, n=3, workers=2)
+    assert plain == [full] * 3
+
+    variants = [None, {"signs": [(300.0, 60.0)]}, {"cars": {0: {"speed_preference": 10.0}}}]
+    forked = snapshot.fork(buf, variants=variants, seeds=7, workers=2)
+    assert forked == snapshot.fork(buf, variants=variants, seeds=7, workers=1)
+    assert forked == [snapshot.continue_run(buf, v, seed=7 + i) for i, v in enumerate(variants)]